@@ -2,38 +2,239 @@
 Aplicación Flask para gestión de matrices de seguridad
 ISO 27001, COBIT, MAGERIT y NIST
 """
-from flask import Flask, render_template, request, jsonify, send_file
-from utils.csv_processor import CSVProcessor
+from flask import Flask, Blueprint, current_app, render_template, request, jsonify, send_file, url_for, Response, g
+from utils.csv_processor import VersionConflictError, MAGERIT_REQUIRED_FIELDS
+from utils.export import EXPORTERS, EXPORT_FORMATS
+from utils.history import parse_timestamp
+from utils.matrix_query import MATRIX_FILTERS
+from utils.metrics import metrics
+from utils.projects import ProjectPool, ProjectNotFoundError, read_project_title
+from utils.report_cache import report_cache_key
+from utils.report_jobs import ReportJobQueue, QueueFullError
+from utils.response_cache import EncodedResponseCache, available_encodings, encoded_etag, make_etag, strip_encoding
+from werkzeug.local import LocalProxy
+from typing import Any, Dict, Optional
 import json
+import logging
+import os
+import time
 from datetime import datetime
-import io
-from reportlab.lib.pagesizes import letter, A4
-from reportlab.lib import colors
-from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
-from reportlab.platypus import SimpleDocTemplate, Table, TableStyle, Paragraph, Spacer, PageBreak
-from reportlab.lib.units import inch
 
-app = Flask(__name__)
-app.config['SECRET_KEY'] = 'tu-clave-secreta-aqui'
+# Configuración por defecto de create_app; las variables de entorno
+# ISOAPP_<CLAVE> (ISOAPP_PROJECTS_DIR, ISOAPP_STORAGE, ...) la reemplazan.
+# Proyectos: el de BASE_PATH (rutas sin prefijo) y los de PROJECTS_DIR
+# (rutas /p/<proyecto>/...), que se cargan al primer uso y se descartan
+# (LRU) al superar MAX_PROJECTS o PROJECTS_MEMORY_MB. STORAGE=sqlite guarda
+# las matrices de cada proyecto en matrices.db. WARM_UP lee las matrices y
+# genera las vistas al arrancar, antes de atender solicitudes.
+DEFAULT_CONFIG = {
+    'SECRET_KEY': 'tu-clave-secreta-aqui',
+    'BASE_PATH': '.',
+    'PROJECTS_DIR': 'proyectos',
+    'STORAGE': 'csv',
+    'MAX_PROJECTS': 16,
+    'PROJECTS_MEMORY_MB': 512,
+    'WARM_UP': False
+}
 
-# Inicializar procesador de CSV
-csv_processor = CSVProcessor()
+# Rutas del proyecto por defecto que se generan (y quedan en caché) en la precarga
+WARM_UP_PATHS = ('/api/data/all', '/magerit', '/anexo-a', '/cobit', '/nist')
+# Consultas de /api/data/<csv_type> (páginas, filtros) que se guardan ya generadas
+QUERY_CACHE_ENTRIES = 128
 
+# Objetos compartidos de la aplicación en curso (ver create_app): pool de
+# proyectos, cola de reportes PDF y cuerpos ya generados de /api/data y de
+# las vistas, por proyecto y versión (las páginas y filtros de
+# /api/data/<csv_type> van en una caché aparte)
+projects = LocalProxy(lambda: current_app.extensions['isoapp']['projects'])
+report_jobs = LocalProxy(lambda: current_app.extensions['isoapp']['report_jobs'])
+response_cache = LocalProxy(lambda: current_app.extensions['isoapp']['response_cache'])
+query_cache = LocalProxy(lambda: current_app.extensions['isoapp']['query_cache'])
 
-@app.route('/')
+# Objetos del proyecto de la solicitud en curso (ver _load_project)
+csv_processor = LocalProxy(lambda: g.project.processor)
+search_index = LocalProxy(lambda: g.project.search_index)
+control_mapper = LocalProxy(lambda: g.project.control_mapper)
+risk_stats = LocalProxy(lambda: g.project.risk_stats)
+# Reportes ya generados, por secciones y versión de los datos, y PDF de cada
+# sección por separado para regenerar solo las matrices que cambiaron
+report_cache = LocalProxy(lambda: g.project.report_cache)
+section_cache = LocalProxy(lambda: g.project.section_cache)
+
+# Máximo de operaciones aceptadas por /api/magerit/batch
+MAX_BATCH_OPERATIONS = 10000
+
+logger = logging.getLogger('isoapp')
+
+# Las rutas se registran dos veces: sin prefijo para el proyecto por defecto
+# y bajo /p/<project> para los proyectos de la carpeta de proyectos
+bp = Blueprint('main', __name__)
+
+
+@bp.url_value_preprocessor
+def _load_project(endpoint, values):
+    """Carga (o toma del pool) el proyecto de la ruta en g.project"""
+    g.project = projects.get(values.pop('project', None) if values else None)
+
+
+@bp.url_defaults
+def _add_project(endpoint, values):
+    """url_for dentro de un proyecto genera rutas del mismo proyecto"""
+    project = g.get('project')
+    if (project is not None and project.name and 'project' not in values
+            and current_app.url_map.is_endpoint_expecting(endpoint, 'project')):
+        values['project'] = project.name
+
+
+@bp.context_processor
+def _project_context():
+    """Nombre del proyecto y prefijo de la API para las plantillas"""
+    return {
+        'project_title': g.project.title,
+        'api_base': url_for('.index').rstrip('/')
+    }
+
+
+@bp.errorhandler(ProjectNotFoundError)
+def _project_not_found(error):
+    return jsonify({
+        'success': False,
+        'error': str(error)
+    }), 404
+
+
+def _magerit_etag(version):
+    """
+    ETag de MAGERIT: la versión de la matriz (la que acepta If-Match) y la
+    firma de sus archivos, que cambia también si se editan a mano
+    """
+    return make_etag(f"{version}.{csv_processor.get_data_version('magerit')}")
+
+
+def _if_match_version():
+    """
+    Retorna la versión de MAGERIT indicada en el encabezado If-Match, si
+    existe. Se acepta el número de versión ("12") o el ETag de
+    GET /api/data/magerit (también el de sus variantes comprimidas), con o
+    sin W/ y en una lista separada por comas;
+    si ningún valor corresponde a la versión actual (incluidos los que no
+    se pueden interpretar) se lanza VersionConflictError, es decir, 412.
+    """
+    value = request.headers.get('If-Match', '').strip()
+    if not value or request.if_match.star_tag:
+        return None
+    current = csv_processor.get_magerit_version()
+    accepted = (str(current), _magerit_etag(current).strip('"'))
+    if any(strip_encoding(tag) in accepted for tag in request.if_match.as_set(include_weak=True)):
+        return current
+    raise VersionConflictError(value, current)
+
+
+def _version_conflict_response(error):
+    """Respuesta 412 cuando el cliente editó sobre una versión desactualizada"""
+    response = jsonify({
+        'success': False,
+        'error': str(error),
+        'version': error.current
+    })
+    response.headers['X-Matrix-Version'] = str(error.current)
+    return response, 412
+
+
+def _negotiate_encoding():
+    """Elige la compresión aceptada por el cliente (None si ninguna)"""
+    accepted = request.accept_encodings
+    best, best_quality = None, 0
+    for encoding in available_encodings():
+        quality = accepted[encoding]
+        if quality > best_quality:
+            best, best_quality = encoding, quality
+    return best
+
+
+def _cached_response(key, etag, build_body, mimetype, headers=None, cache=None):
+    """
+    Respuesta condicional: 304 si el cliente ya tiene la versión etag, si no
+    el cuerpo guardado en caché (response_cache si no se indica otra) con
+    la compresión negociada
+    """
+    # If-None-Match usa comparación débil (RFC 9110) y cualquier variante
+    # comprimida de la misma versión sirve; '*' coincide siempre
+    value = etag.strip('"')
+    matched = [tag for tag in request.if_none_match.as_set(include_weak=True)
+               if strip_encoding(tag) == value]
+    if matched or request.if_none_match.star_tag:
+        response = Response(status=304)
+        # El ETag de la variante que el cliente ya tiene
+        response.headers['ETag'] = f'"{matched[0]}"' if matched else etag
+    else:
+        cache = response_cache if cache is None else cache
+        body, encoding = cache.get(f'{g.project.name}/{key}', etag, build_body, _negotiate_encoding())
+        response = Response(body, mimetype=mimetype)
+        if encoding is not None:
+            response.headers['Content-Encoding'] = encoding
+        response.headers['ETag'] = encoded_etag(etag, encoding)
+    response.headers['Vary'] = 'Accept-Encoding'
+    # El navegador puede guardar la respuesta, pero debe revalidarla siempre
+    response.headers['Cache-Control'] = 'no-cache'
+    for name, value in (headers or {}).items():
+        response.headers[name] = value
+    return response
+
+
+def _cached_json_response(key, etag, build_payload, headers=None, cache=None):
+    """Respuesta JSON condicional (ver _cached_response)"""
+    return _cached_response(key, etag, lambda: current_app.json.dumps(build_payload()).encode('utf-8'),
+                            'application/json', headers, cache)
+
+
+def _cached_view(name, versions, render):
+    """
+    Vista HTML renderizada una vez por versión de las matrices que muestra;
+    las visitas siguientes son una búsqueda en la caché (o un 304)
+    """
+    # El nombre del proyecto también se muestra en la página
+    etag = make_etag(*(versions[k] for k in sorted(versions)), g.project.title)
+    return _cached_response(f'view:{name}', etag, lambda: render().encode('utf-8'), 'text/html')
+
+
+@bp.route('/')
 def index():
     """Página principal - Dashboard"""
     return render_template('index.html')
 
 
-@app.route('/api/data/all')
+@bp.route('/api/data/all')
 def get_all_data():
     """API para obtener todos los datos"""
     try:
-        data = csv_processor.get_all_data()
+        # Las versiones se toman antes de leer: si los datos cambian entre
+        # medio, la siguiente consulta ya no coincide y se vuelve a enviar
+        versions = csv_processor.get_data_versions()
+        etag = make_etag(*(versions[csv_type] for csv_type in sorted(versions)))
+        return _cached_json_response('all', etag, lambda: {
+            'success': True,
+            'data': csv_processor.get_all_data()
+        })
+    except Exception as e:
         return jsonify({
+            'success': False,
+            'error': str(e)
+        }), 500
+
+
+@bp.route('/api/stats')
+def get_stats():
+    """
+    API de estadísticas: activos y riesgos de MAGERIT por tipo y
+    clasificación, mapa de calor frecuencia × impacto y controles por grupo
+    """
+    try:
+        versions = csv_processor.get_data_versions()
+        etag = make_etag(*(versions[csv_type] for csv_type in sorted(versions)))
+        return _cached_json_response('stats', etag, lambda: {
             'success': True,
-            'data': data
+            'data': risk_stats.stats()
         })
     except Exception as e:
         return jsonify({
@@ -42,28 +243,267 @@ def get_all_data():
         }), 500
 
 
-@app.route('/api/data/<csv_type>')
+@bp.route('/api/live/magerit')
+def live_magerit():
+    """
+    Stream SSE con las altas y ediciones de MAGERIT (de cualquier worker).
+    Cada evento tiene la versión como id: al reconectarse, el navegador
+    envía Last-Event-ID y recibe solo lo posterior. since indica la versión
+    que ya tiene el cliente (por defecto, la actual).
+    """
+    try:
+        cursor = request.headers.get('Last-Event-ID') or request.args.get('since')
+        cursor = int(cursor) if cursor not in (None, '') else None
+        # El generador corre fuera del contexto de la solicitud
+        feed = g.project.live_feed
+        response = Response(feed.stream(cursor), mimetype='text/event-stream')
+        response.headers['Cache-Control'] = 'no-cache'
+        # Sin buffer en nginx: cada evento se envía apenas se publica
+        response.headers['X-Accel-Buffering'] = 'no'
+        return response
+    except ValueError as e:
+        return jsonify({
+            'success': False,
+            'error': str(e)
+        }), 400
+    except Exception as e:
+        return jsonify({
+            'success': False,
+            'error': str(e)
+        }), 500
+
+
+@bp.route('/api/history/magerit')
+def get_magerit_history():
+    """API para obtener MAGERIT como estaba en un instante (parámetro at)"""
+    try:
+        at = request.args.get('at')
+        if not at:
+            return jsonify({
+                'success': False,
+                'error': "Falta el parámetro 'at'"
+            }), 400
+        
+        result = csv_processor.get_magerit_at(parse_timestamp(at))
+        return jsonify({
+            'success': True,
+            'data': result,
+            'version': result['version']
+        })
+    except ValueError as e:
+        return jsonify({
+            'success': False,
+            'error': str(e)
+        }), 400
+    except Exception as e:
+        return jsonify({
+            'success': False,
+            'error': str(e)
+        }), 500
+
+
+@bp.route('/api/history/magerit/<asset>')
+def get_asset_history(asset):
+    """API para obtener la evolución del riesgo de un activo de MAGERIT (since y until opcionales)"""
+    try:
+        since = request.args.get('since')
+        until = request.args.get('until')
+        trajectory = csv_processor.get_magerit_trajectory(
+            asset,
+            parse_timestamp(since) if since else None,
+            parse_timestamp(until) if until else None
+        )
+        return jsonify({
+            'success': True,
+            'data': trajectory
+        })
+    except ValueError as e:
+        return jsonify({
+            'success': False,
+            'error': str(e)
+        }), 400
+    except Exception as e:
+        return jsonify({
+            'success': False,
+            'error': str(e)
+        }), 500
+
+
+def _matrix_query_args(csv_type):
+    """
+    Lee offset, limit, fields y los filtros de la matriz (ver
+    MATRIX_FILTERS) de la query string; los demás parámetros (por ejemplo
+    _=<marca de tiempo> para evitar cachés) se ignoran.
+    Los valores de fields y de cada filtro pueden separarse por comas.
+    """
+    def values(name):
+        return [v.strip() for raw in request.args.getlist(name) for v in raw.split(',') if v.strip()]
+    
+    try:
+        offset = int(request.args.get('offset', 0))
+        limit = int(request.args['limit']) if 'limit' in request.args else None
+    except ValueError:
+        raise ValueError("offset y limit deben ser números enteros")
+    
+    return {
+        'offset': offset,
+        'limit': limit,
+        'fields': values('fields') or None,
+        'filters': {name: values(name) for name in MATRIX_FILTERS.get(csv_type, {})
+                    if name in request.args}
+    }
+
+
+@bp.route('/api/data/<csv_type>')
 def get_csv_data(csv_type):
-    """API para obtener datos de un CSV específico"""
+    """
+    API para obtener datos de un CSV específico.
+    Admite paginación (offset, limit), proyección de columnas (fields) y
+    filtros por columna (ver utils.matrix_query.MATRIX_FILTERS).
+    """
     try:
-        if csv_type == 'magerit':
-            data = csv_processor.get_magerit_data()
-        elif csv_type == 'anexo_a':
-            data = csv_processor.get_anexo_a_data()
-        elif csv_type == 'cobit':
-            data = csv_processor.get_cobit_data()
-        elif csv_type == 'nist':
-            data = csv_processor.get_nist_data()
+        if csv_type not in csv_processor.csv_files:
+            return jsonify({
+                'success': False,
+                'error': 'Tipo de CSV no válido'
+            }), 400
+        
+        query = _matrix_query_args(csv_type)
+        if 'offset' in request.args or 'limit' in request.args or query['fields'] or query['filters']:
+            load = lambda: csv_processor.query_data(csv_type, **query)
+            # Validar antes de responder (también un 304) con filtros inválidos
+            csv_processor.get_matrix_index(csv_type).select(query['filters'])
+            # Clave según la consulta interpretada: el orden de los parámetros
+            # y los que se ignoran no generan otra entrada
+            key = f"{csv_type}?{json.dumps(query, sort_keys=True)}"
+            cache = query_cache
         else:
+            load = lambda: csv_processor.get_data(csv_type)
+            key = csv_type
+            cache = None
+        
+        if csv_type == 'magerit':
+            version = csv_processor.get_magerit_version()
+            return _cached_json_response(key, _magerit_etag(version), lambda: {
+                'success': True,
+                'data': load(),
+                'version': version
+            }, headers={'X-Matrix-Version': str(version)}, cache=cache)
+        
+        etag = make_etag(csv_processor.get_data_version(csv_type))
+        return _cached_json_response(key, etag, lambda: {
+            'success': True,
+            'data': load()
+        }, cache=cache)
+    except ValueError as e:
+        return jsonify({
+            'success': False,
+            'error': str(e)
+        }), 400
+    except Exception as e:
+        return jsonify({
+            'success': False,
+            'error': str(e)
+        }), 500
+
+
+@bp.route('/api/export/<csv_type>')
+def export_data(csv_type):
+    """
+    Exporta una matriz completa, sin paginar, en CSV, NDJSON o XLSX
+    (?format=csv por defecto). Admite fields y los mismos filtros que
+    /api/data/<csv_type>. Las filas se serializan a medida que se envían
+    (transferencia por partes), sin armar el archivo en memoria.
+    """
+    try:
+        if csv_type not in csv_processor.csv_files:
             return jsonify({
                 'success': False,
                 'error': 'Tipo de CSV no válido'
             }), 400
         
+        export_format = request.args.get('format', 'csv').strip().lower()
+        if export_format not in EXPORT_FORMATS:
+            raise ValueError(f"Formato no válido (disponibles: {', '.join(EXPORT_FORMATS)})")
+        
+        query = _matrix_query_args(csv_type)
+        version = csv_processor.get_data_version(csv_type)
+        # Filtros y columnas se validan aquí: un error no puede informarse
+        # después de empezar a enviar el archivo
+        headers, rows = csv_processor.iter_data(csv_type, query['filters'], query['fields'])
+        
+        prefix = f'{g.project.name}_' if g.project.name else ''
+        filename = f"{prefix}{csv_type}_{datetime.now().strftime('%Y%m%d_%H%M%S')}.{export_format}"
+        response = Response(EXPORTERS[export_format](headers, rows),
+                            mimetype=EXPORT_FORMATS[export_format])
+        response.headers['Content-Disposition'] = f'attachment; filename="{filename}"'
+        response.headers['X-Data-Version'] = version
+        return response
+    except ValueError as e:
+        return jsonify({
+            'success': False,
+            'error': str(e)
+        }), 400
+    except Exception as e:
+        return jsonify({
+            'success': False,
+            'error': str(e)
+        }), 500
+
+
+@bp.route('/api/search')
+def search():
+    """API de búsqueda de texto en las 4 matrices (sin distinguir mayúsculas ni tildes)"""
+    try:
+        query = request.args.get('q', '').strip()
+        if not query:
+            return jsonify({
+                'success': False,
+                'error': "Falta el parámetro 'q'"
+            }), 400
+        
+        matrices = [m.strip() for m in request.args.get('matrices', '').split(',') if m.strip()]
+        limit = int(request.args.get('limit', 20))
+        result = search_index.search(query, matrices or None, limit)
+        
+        return jsonify({
+            'success': True,
+            'data': result
+        })
+    except ValueError as e:
+        return jsonify({
+            'success': False,
+            'error': str(e)
+        }), 400
+    except Exception as e:
+        return jsonify({
+            'success': False,
+            'error': str(e)
+        }), 500
+
+
+@bp.route('/api/mapping/<csv_type>/<key>')
+def get_mapping(csv_type, key):
+    """
+    API para obtener las filas de las otras matrices relacionadas con una
+    fila (por ejemplo, los controles que cubren un activo de MAGERIT)
+    """
+    try:
+        limit = int(request.args.get('limit', 5))
         return jsonify({
             'success': True,
-            'data': data
+            'data': control_mapper.related(csv_type, key, limit)
         })
+    except KeyError as e:
+        return jsonify({
+            'success': False,
+            'error': e.args[0]
+        }), 404
+    except ValueError as e:
+        return jsonify({
+            'success': False,
+            'error': str(e)
+        }), 400
     except Exception as e:
         return jsonify({
             'success': False,
@@ -71,35 +511,62 @@ def get_csv_data(csv_type):
         }), 500
 
 
-@app.route('/magerit')
+@bp.route('/api/cache/stats')
+def get_cache_stats():
+    """API para consultar los contadores de la caché de matrices"""
+    return jsonify({
+        'success': True,
+        'data': csv_processor.get_cache_stats(),
+        'reports': report_cache.stats(),
+        'report_sections': section_cache.stats(),
+        'responses': response_cache.stats(),
+        'queries': query_cache.stats(),
+        'search': search_index.stats(),
+        'mapping': control_mapper.stats(),
+        'live': g.project.live_stats(),
+        'projects': projects.stats()
+    })
+
+
+@bp.route('/magerit')
 def magerit_view():
     """Vista de MAGERIT"""
-    data = csv_processor.get_magerit_data()
-    return render_template('magerit.html', data=data)
+    def render():
+        data = csv_processor.get_magerit_data()
+        version = csv_processor.get_magerit_version()
+        related = control_mapper.related_all('magerit', limit=1)
+        return render_template('magerit.html', data=data, version=version, related=related)
+    
+    # Los controles relacionados dependen de las 4 matrices
+    return _cached_view('magerit', control_mapper.versions(), render)
 
 
-@app.route('/anexo-a')
+@bp.route('/anexo-a')
 def anexo_a_view():
     """Vista de ISO 27001 Anexo A"""
-    data = csv_processor.get_anexo_a_data()
-    return render_template('anexo_a.html', data=data)
+    def render():
+        data = csv_processor.get_anexo_a_data()
+        related = control_mapper.related_all('anexo_a', limit=3)
+        return render_template('anexo_a.html', data=data, related=related)
+    
+    return _cached_view('anexo_a', control_mapper.versions(), render)
 
 
-@app.route('/cobit')
+@bp.route('/cobit')
 def cobit_view():
     """Vista de COBIT"""
-    data = csv_processor.get_cobit_data()
-    return render_template('cobit.html', data=data)
+    return _cached_view('cobit', {'cobit': csv_processor.get_data_version('cobit')},
+                        lambda: render_template('cobit.html', data=csv_processor.get_cobit_data()))
 
 
-@app.route('/nist')
+@bp.route('/nist')
 def nist_view():
     """Vista de NIST"""
-    data = csv_processor.get_nist_data()
-    return render_template('nist.html', data=data)
+    return _cached_view('nist', {'nist': csv_processor.get_data_version('nist')},
+                        lambda: render_template('nist.html', data=csv_processor.get_nist_data()))
 
 
-@app.route('/api/magerit/calculate', methods=['POST'])
+@bp.route('/api/magerit/calculate', methods=['POST'])
 def calculate_magerit_risk():
     """API para calcular riesgos de MAGERIT"""
     try:
@@ -121,18 +588,94 @@ def calculate_magerit_risk():
         }), 400
 
 
-@app.route('/api/magerit/update/<int:row_index>', methods=['POST'])
+@bp.route('/api/magerit/calculate/bulk', methods=['POST'])
+def calculate_magerit_risk_bulk():
+    """
+    API para calcular riesgos de MAGERIT en bloque. Acepta listas
+    (frecuencia, impacto, salvaguarda_pct), una lista de items o
+    matrix=true para recalcular todos los activos de la matriz.
+    """
+    try:
+        data = request.json or {}
+        
+        if data.get('matrix'):
+            overrides = {k: float(v) for k, v in (data.get('overrides') or {}).items()
+                         if k in ('frecuencia', 'impacto', 'salvaguarda_pct')}
+            result = csv_processor.calculate_magerit_matrix_risks(overrides)
+        else:
+            if 'items' in data:
+                items = data['items']
+                frecuencias = [float(item.get('frecuencia', 0)) for item in items]
+                impactos = [float(item.get('impacto', 0)) for item in items]
+                salvaguardas = [float(item.get('salvaguarda_pct', 0)) for item in items]
+            else:
+                frecuencias = [float(v) for v in data.get('frecuencia', [])]
+                impactos = [float(v) for v in data.get('impacto', [])]
+                salvaguardas = [float(v) for v in data.get('salvaguarda_pct', [])]
+            
+            result = csv_processor.calculate_magerit_risk_bulk(frecuencias, impactos, salvaguardas)
+        
+        return jsonify({
+            'success': True,
+            'data': result
+        })
+    except Exception as e:
+        return jsonify({
+            'success': False,
+            'error': str(e)
+        }), 400
+
+
+@bp.route('/api/magerit/simulate', methods=['POST'])
+def simulate_magerit_risk():
+    """API para simular escenarios de riesgo (Monte Carlo) sobre todos los activos"""
+    try:
+        data = request.json or {}
+        seed = data.get('seed')
+        
+        result = csv_processor.simulate_magerit_risk(
+            trials=int(data.get('trials', 100_000)),
+            seed=int(seed) if seed is not None else None,
+            spreads=data.get('spreads'),
+            percentiles=data.get('percentiles')
+        )
+        
+        return jsonify({
+            'success': True,
+            'data': result
+        })
+    except RuntimeError as e:
+        return jsonify({
+            'success': False,
+            'error': str(e)
+        }), 501
+    except Exception as e:
+        return jsonify({
+            'success': False,
+            'error': str(e)
+        }), 400
+
+
+@bp.route('/api/magerit/update/<int:row_index>', methods=['POST'])
 def update_magerit_row(row_index):
     """API para actualizar una fila de MAGERIT"""
     try:
         data = request.json
-        updated_row = csv_processor.update_magerit_row(row_index, data)
+        updated_row = csv_processor.update_magerit_row(
+            row_index, data, expected_version=_if_match_version()
+        )
+        version = csv_processor.get_last_write_version()
         
-        return jsonify({
+        response = jsonify({
             'success': True,
             'message': f'Activo N° {row_index} actualizado correctamente',
-            'data': updated_row
+            'data': updated_row,
+            'version': version
         })
+        response.headers['X-Matrix-Version'] = str(version)
+        return response
+    except VersionConflictError as e:
+        return _version_conflict_response(e)
     except Exception as e:
         return jsonify({
             'success': False,
@@ -140,30 +683,33 @@ def update_magerit_row(row_index):
         }), 400
 
 
-@app.route('/api/magerit/add', methods=['POST'])
+@bp.route('/api/magerit/add', methods=['POST'])
 def add_magerit_asset():
     """API para agregar un nuevo activo a MAGERIT"""
     try:
         data = request.json
         
         # Validar campos requeridos
-        required_fields = ['tipo_activo', 'activo', 'amenaza', 'valor_economico', 
-                          'frecuencia', 'impacto', 'salvaguarda', 'valor_salvaguarda_pct']
-        
-        for field in required_fields:
+        for field in MAGERIT_REQUIRED_FIELDS:
             if field not in data or not data[field]:
                 return jsonify({
                     'success': False,
                     'error': f'Campo requerido faltante: {field}'
                 }), 400
         
-        new_row = csv_processor.add_magerit_asset(data)
+        new_row = csv_processor.add_magerit_asset(data, expected_version=_if_match_version())
+        version = csv_processor.get_last_write_version()
         
-        return jsonify({
+        response = jsonify({
             'success': True,
             'message': 'Nuevo activo agregado correctamente',
-            'data': new_row
+            'data': new_row,
+            'version': version
         })
+        response.headers['X-Matrix-Version'] = str(version)
+        return response
+    except VersionConflictError as e:
+        return _version_conflict_response(e)
     except Exception as e:
         return jsonify({
             'success': False,
@@ -171,171 +717,119 @@ def add_magerit_asset():
         }), 400
 
 
-@app.route('/reports')
+@bp.route('/api/magerit/batch', methods=['POST'])
+def magerit_batch():
+    """API para aplicar varias altas y actualizaciones de MAGERIT en una sola escritura"""
+    try:
+        data = request.json
+        operations = data.get('operations') if isinstance(data, dict) else data
+        
+        if not isinstance(operations, list) or not operations:
+            return jsonify({
+                'success': False,
+                'error': 'Se requiere una lista de operaciones'
+            }), 400
+        
+        if len(operations) > MAX_BATCH_OPERATIONS:
+            return jsonify({
+                'success': False,
+                'error': f'El lote supera el máximo de {MAX_BATCH_OPERATIONS} operaciones'
+            }), 400
+        
+        results = csv_processor.apply_magerit_batch(operations, expected_version=_if_match_version())
+        applied = sum(1 for r in results if r['success'])
+        version = csv_processor.get_last_write_version() if applied else csv_processor.get_magerit_version()
+        
+        response = jsonify({
+            'success': True,
+            'message': f'{applied} de {len(results)} operaciones aplicadas',
+            'applied': applied,
+            'failed': len(results) - applied,
+            'results': results,
+            'version': version
+        })
+        response.headers['X-Matrix-Version'] = str(version)
+        return response
+    except VersionConflictError as e:
+        return _version_conflict_response(e)
+    except Exception as e:
+        return jsonify({
+            'success': False,
+            'error': str(e)
+        }), 400
+
+
+@bp.route('/reports')
 def reports_view():
     """Vista de reportes"""
     return render_template('reports.html')
 
 
-@app.route('/api/report/generate', methods=['POST'])
+def _report_key(project, include_sections, versions):
+    """Clave del reporte: secciones, versión de los datos y nombre del proyecto (portada)"""
+    return report_cache_key(include_sections, dict(versions, proyecto=project.title))
+
+
+def _build_and_cache_report(project, include_sections, progress):
+    """Genera el PDF de un proyecto y lo guarda en su caché de reportes"""
+    # ReportLab y pypdf se importan con el primer reporte, no al arrancar
+    from utils.report_builder import build_report_pdf_parallel, count_pdf_pages
+
+    # Las versiones se toman antes de leer los datos: el PDF nunca queda
+    # asociado a una versión más nueva que la de su contenido
+    versions = project.processor.get_data_versions()
+    key = _report_key(project, include_sections, versions)
+    with metrics.timer('isoapp_report_build_seconds'):
+        content = build_report_pdf_parallel(project.processor.get_all_data(), include_sections,
+                                            data_versions=versions, section_cache=project.section_cache,
+                                            progress=progress, project_title=project.title)
+    if metrics.enabled:
+        metrics.observe('isoapp_report_pages', count_pdf_pages(content))
+        metrics.observe('isoapp_report_bytes', len(content))
+    project.report_cache.put(key, content)
+    return content
+
+
+@bp.route('/api/report/generate', methods=['POST'])
 def generate_report():
-    """Genera un reporte en PDF con todos los datos"""
+    """Encola la generación de un reporte PDF y retorna el identificador del trabajo"""
+    from utils.report_builder import REPORT_SECTIONS
+
     try:
-        data_request = request.json
-        include_sections = data_request.get('sections', ['magerit', 'anexo_a', 'cobit', 'nist'])
-        
-        # Crear buffer para el PDF
-        buffer = io.BytesIO()
-        
-        # Crear documento PDF
-        doc = SimpleDocTemplate(buffer, pagesize=A4)
-        elements = []
-        styles = getSampleStyleSheet()
-        
-        # Estilo personalizado para título
-        title_style = ParagraphStyle(
-            'CustomTitle',
-            parent=styles['Heading1'],
-            fontSize=18,
-            textColor=colors.HexColor('#2c3e50'),
-            spaceAfter=30
-        )
-        
-        # Título principal
-        title = Paragraph("Reporte de Análisis de Seguridad de la Información", title_style)
-        elements.append(title)
-        elements.append(Spacer(1, 0.2*inch))
+        data_request = request.json or {}
+        include_sections = [
+            section for section in data_request.get('sections', REPORT_SECTIONS)
+            if section in REPORT_SECTIONS
+        ]
         
-        # Información del reporte
-        date_str = datetime.now().strftime('%d/%m/%Y %H:%M')
-        info_text = f"<b>Fecha de generación:</b> {date_str}<br/><b>Proyecto:</b> Geotermia con CNN"
-        elements.append(Paragraph(info_text, styles['Normal']))
-        elements.append(Spacer(1, 0.3*inch))
-        
-        # Obtener todos los datos
-        all_data = csv_processor.get_all_data()
-        
-        # MAGERIT
-        if 'magerit' in include_sections:
-            elements.append(Paragraph("1. Análisis de Riesgos (MAGERIT)", styles['Heading2']))
-            elements.append(Spacer(1, 0.1*inch))
-            
-            magerit_data = all_data['magerit']
-            if magerit_data['data']:
-                # Preparar datos para la tabla
-                table_data = [magerit_data['headers'][:6]]  # Solo primeras 6 columnas
-                for row in magerit_data['data']:
-                    table_data.append(row[:6])
-                
-                # Crear tabla
-                t = Table(table_data, repeatRows=1)
-                t.setStyle(TableStyle([
-                    ('BACKGROUND', (0, 0), (-1, 0), colors.grey),
-                    ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke),
-                    ('ALIGN', (0, 0), (-1, -1), 'CENTER'),
-                    ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
-                    ('FONTSIZE', (0, 0), (-1, 0), 8),
-                    ('FONTSIZE', (0, 1), (-1, -1), 7),
-                    ('BOTTOMPADDING', (0, 0), (-1, 0), 12),
-                    ('BACKGROUND', (0, 1), (-1, -1), colors.beige),
-                    ('GRID', (0, 0), (-1, -1), 1, colors.black)
-                ]))
-                elements.append(t)
-                elements.append(PageBreak())
-        
-        # ANEXO A
-        if 'anexo_a' in include_sections:
-            elements.append(Paragraph("2. Controles ISO 27001 (Anexo A)", styles['Heading2']))
-            elements.append(Spacer(1, 0.1*inch))
-            
-            anexo_data = all_data['anexo_a']
-            if anexo_data['data']:
-                table_data = [anexo_data['headers'][:4]]
-                for row in anexo_data['data'][:10]:  # Primeras 10 filas
-                    table_data.append(row[:4])
-                
-                t = Table(table_data, repeatRows=1, colWidths=[1.5*inch, 1.5*inch, 2*inch, 2*inch])
-                t.setStyle(TableStyle([
-                    ('BACKGROUND', (0, 0), (-1, 0), colors.HexColor('#3498db')),
-                    ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke),
-                    ('ALIGN', (0, 0), (-1, -1), 'LEFT'),
-                    ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
-                    ('FONTSIZE', (0, 0), (-1, 0), 8),
-                    ('FONTSIZE', (0, 1), (-1, -1), 6),
-                    ('BOTTOMPADDING', (0, 0), (-1, 0), 12),
-                    ('BACKGROUND', (0, 1), (-1, -1), colors.lightblue),
-                    ('GRID', (0, 0), (-1, -1), 1, colors.black),
-                    ('VALIGN', (0, 0), (-1, -1), 'TOP')
-                ]))
-                elements.append(t)
-                elements.append(PageBreak())
-        
-        # COBIT
-        if 'cobit' in include_sections:
-            elements.append(Paragraph("3. Procesos de Gobernanza TI (COBIT)", styles['Heading2']))
-            elements.append(Spacer(1, 0.1*inch))
-            
-            cobit_data = all_data['cobit']
-            if cobit_data['data']:
-                table_data = [['Proceso', 'Objetivo', 'KPIs']]
-                for row in cobit_data['data'][:8]:
-                    table_data.append([row[0], row[1][:100] + '...', row[4][:80] + '...'])
-                
-                t = Table(table_data, repeatRows=1, colWidths=[1.5*inch, 3*inch, 2*inch])
-                t.setStyle(TableStyle([
-                    ('BACKGROUND', (0, 0), (-1, 0), colors.HexColor('#e74c3c')),
-                    ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke),
-                    ('ALIGN', (0, 0), (-1, -1), 'LEFT'),
-                    ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
-                    ('FONTSIZE', (0, 0), (-1, 0), 8),
-                    ('FONTSIZE', (0, 1), (-1, -1), 6),
-                    ('BOTTOMPADDING', (0, 0), (-1, 0), 12),
-                    ('BACKGROUND', (0, 1), (-1, -1), colors.lightpink),
-                    ('GRID', (0, 0), (-1, -1), 1, colors.black),
-                    ('VALIGN', (0, 0), (-1, -1), 'TOP')
-                ]))
-                elements.append(t)
-                elements.append(PageBreak())
-        
-        # NIST
-        if 'nist' in include_sections:
-            elements.append(Paragraph("4. Marco de Ciberseguridad (NIST)", styles['Heading2']))
-            elements.append(Spacer(1, 0.1*inch))
-            
-            nist_data = all_data['nist']
-            if nist_data['data']:
-                table_data = [['Función', 'Control', 'Descripción']]
-                for row in nist_data['data']:
-                    table_data.append([row[0], row[1], row[2][:100] + '...'])
-                
-                t = Table(table_data, repeatRows=1, colWidths=[1.5*inch, 2*inch, 3*inch])
-                t.setStyle(TableStyle([
-                    ('BACKGROUND', (0, 0), (-1, 0), colors.HexColor('#27ae60')),
-                    ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke),
-                    ('ALIGN', (0, 0), (-1, -1), 'LEFT'),
-                    ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
-                    ('FONTSIZE', (0, 0), (-1, 0), 8),
-                    ('FONTSIZE', (0, 1), (-1, -1), 6),
-                    ('BOTTOMPADDING', (0, 0), (-1, 0), 12),
-                    ('BACKGROUND', (0, 1), (-1, -1), colors.lightgreen),
-                    ('GRID', (0, 0), (-1, -1), 1, colors.black),
-                    ('VALIGN', (0, 0), (-1, -1), 'TOP')
-                ]))
-                elements.append(t)
+        filename = f"reporte_seguridad_{datetime.now().strftime('%Y%m%d_%H%M%S')}.pdf"
         
-        # Construir PDF
-        doc.build(elements)
-        buffer.seek(0)
+        # Si ya existe un reporte con las mismas secciones y datos, se entrega sin regenerarlo
+        project = g.project
+        cached = report_cache.get(_report_key(project, include_sections, csv_processor.get_data_versions()))
+        if cached is not None:
+            job = report_jobs.complete(cached, filename)
+        else:
+            job = report_jobs.submit(
+                lambda progress: _build_and_cache_report(project, include_sections, progress),
+                filename
+            )
         
-        # Enviar archivo
-        filename = f"reporte_seguridad_{datetime.now().strftime('%Y%m%d_%H%M%S')}.pdf"
-        return send_file(
-            buffer,
-            as_attachment=True,
-            download_name=filename,
-            mimetype='application/pdf'
-        )
+        return jsonify({
+            'success': True,
+            'job_id': job['id'],
+            'status': job['status'],
+            'status_url': url_for('.report_status', job_id=job['id']),
+            'download_url': url_for('.download_report', job_id=job['id'])
+        }), 202
         
+    except QueueFullError as e:
+        response = jsonify({
+            'success': False,
+            'error': str(e)
+        })
+        response.headers['Retry-After'] = '5'
+        return response, 503
     except Exception as e:
         return jsonify({
             'success': False,
@@ -343,5 +837,218 @@ def generate_report():
         }), 500
 
 
+@bp.route('/api/report/status/<job_id>')
+def report_status(job_id):
+    """API para consultar el estado y progreso de un reporte"""
+    job = report_jobs.get(job_id)
+    if job is None:
+        return jsonify({
+            'success': False,
+            'error': 'Reporte no encontrado'
+        }), 404
+    
+    return jsonify({
+        'success': True,
+        'data': job
+    })
+
+
+@bp.route('/api/report/download/<job_id>')
+def download_report(job_id):
+    """Descarga el PDF de un reporte terminado"""
+    job = report_jobs.get(job_id)
+    if job is None:
+        return jsonify({
+            'success': False,
+            'error': 'Reporte no encontrado'
+        }), 404
+    
+    path = report_jobs.result_path(job_id)
+    if path is None:
+        return jsonify({
+            'success': False,
+            'error': 'El reporte aún no está listo',
+            'data': job
+        }), 409
+    
+    return send_file(
+        path,
+        as_attachment=True,
+        download_name=job['filename'],
+        mimetype='application/pdf'
+    )
+
+
+def list_projects():
+    """API para listar los proyectos de la carpeta de proyectos"""
+    loaded = set(projects.stats()['cargados'])
+    return jsonify({
+        'success': True,
+        'data': [
+            {
+                'id': name,
+                'nombre': read_project_title(projects.project_path(name)),
+                'cargado': name in loaded,
+                'url': url_for('project.index', project=name)
+            }
+            for name in projects.names()
+        ]
+    })
+
+
+def get_metrics():
+    """Métricas en formato de texto de Prometheus (requiere ISOAPP_METRICS=1)"""
+    if not metrics.enabled:
+        return jsonify({
+            'success': False,
+            'error': 'Las métricas están deshabilitadas (ISOAPP_METRICS=1 las habilita)'
+        }), 404
+    return Response(metrics.render(), mimetype='text/plain; version=0.0.4')
+
+
+slow_request_log = logging.getLogger('isoapp.slow_requests')
+
+
+def _start_request_timer():
+    g.request_started = time.perf_counter()
+
+
+def _observe_request(response):
+    """Latencia de la solicitud por ruta, y registro de las más lentas"""
+    started = g.pop('request_started', None)
+    if started is None:
+        return response
+    elapsed = time.perf_counter() - started
+    # Las rutas de los proyectos (/p/<proyecto>/...) se agregan con las del proyecto por defecto
+    endpoint = request.endpoint.rsplit('.', 1)[-1] if request.endpoint else 'sin_ruta'
+    metrics.observe('isoapp_request_duration_seconds', elapsed,
+                    (endpoint, request.method, str(response.status_code)))
+    if elapsed >= metrics.slow_request_seconds:
+        metrics.inc('isoapp_slow_requests_total', labels=(endpoint,))
+        slow_request_log.warning('%s %s %s %.3f s', request.method, request.full_path.rstrip('?'),
+                                 response.status_code, elapsed)
+    return response
+
+
+def _cache_metrics(projects, response_cache, query_cache):
+    """Aciertos y fallos de las cachés de cada proyecto cargado, calculados al exportar"""
+    hits, misses, ratios = [], [], []
+
+    def add(labels, stats):
+        hits.append((labels, stats['hits']))
+        misses.append((labels, stats['misses']))
+        total = stats['hits'] + stats['misses']
+        ratios.append((labels, stats['hits'] / total if total else 0.0))
+
+    for project in projects.loaded():
+        name = project.name or 'default'
+        add({'cache': 'matrices', 'project': name}, project.processor.get_cache_stats())
+        add({'cache': 'reportes', 'project': name}, project.report_cache.stats())
+        add({'cache': 'secciones', 'project': name}, project.section_cache.stats())
+    add({'cache': 'respuestas', 'project': '*'}, response_cache.stats())
+    add({'cache': 'consultas', 'project': '*'}, query_cache.stats())
+
+    pool = projects.stats()
+    return [
+        ('isoapp_cache_hits_total', 'counter', 'Aciertos de cada caché', hits),
+        ('isoapp_cache_misses_total', 'counter', 'Fallos de cada caché', misses),
+        ('isoapp_cache_hit_ratio', 'gauge', 'Proporción de aciertos de cada caché', ratios),
+        ('isoapp_projects_loaded', 'gauge', 'Proyectos cargados en el pool', [({}, len(pool['cargados']))]),
+        ('isoapp_projects_memory_bytes', 'gauge', 'Memoria estimada de los proyectos del pool',
+         [({}, pool['memoria_estimada'])])
+    ]
+
+
+def _warm_up(app):
+    """
+    Lee las matrices del proyecto por defecto, arma sus índices y el mapeo
+    entre marcos, y genera las respuestas de WARM_UP_PATHS; también importa
+    el generador de reportes
+    """
+    started = time.perf_counter()
+    try:
+        import utils.report_builder  # noqa: F401
+
+        project = app.extensions['isoapp']['projects'].default
+        for csv_type in project.processor.csv_files:
+            project.processor.get_matrix_index(csv_type)
+        project.control_mapper.refresh()
+        client = app.test_client()
+        for path in WARM_UP_PATHS:
+            client.get(path, headers={'Accept-Encoding': 'gzip'})
+    except Exception as e:
+        logger.exception('Error en la precarga: %s', e)
+        return
+    logger.info('Precarga completada en %.2f s', time.perf_counter() - started)
+
+
+def create_app(config: Optional[Dict[str, Any]] = None) -> Flask:
+    """
+    Crea la aplicación (para gunicorn: 'app:create_app()')
+
+    La configuración parte de DEFAULT_CONFIG, luego las variables de entorno
+    ISOAPP_* y por último config. Las matrices se leen en la primera
+    solicitud de cada proyecto (o aquí mismo, con WARM_UP) y ReportLab con
+    el primer reporte, de modo que un worker nuevo atiende casi de inmediato.
+
+    Args:
+        config: Claves de configuración que reemplazan a las anteriores
+    """
+    app = Flask(__name__)
+    app.config.update(DEFAULT_CONFIG)
+    app.config.from_prefixed_env('ISOAPP')
+    app.config.update(config or {})
+
+    projects = ProjectPool(
+        str(app.config['PROJECTS_DIR']),
+        default_path=str(app.config['BASE_PATH']),
+        backend=str(app.config['STORAGE']),
+        max_projects=int(app.config['MAX_PROJECTS']),
+        memory_budget_bytes=int(app.config['PROJECTS_MEMORY_MB']) * 1024 * 1024
+    )
+    # Páginas y filtros de /api/data/<csv_type> en una caché propia, para
+    # que paginar no desplace a /api/data/all ni a las vistas; los cuerpos
+    # de un proyecto descartado del pool se eliminan
+    response_cache = EncodedResponseCache()
+    query_cache = EncodedResponseCache(max_entries=QUERY_CACHE_ENTRIES)
+    for cache in (response_cache, query_cache):
+        projects.add_evict_listener(lambda name, cache=cache: cache.discard_prefix(f'{name}/'))
+    # Reportes PDF de todos los proyectos (hasta 2 en paralelo y 20 pendientes por worker)
+    report_jobs = ReportJobQueue(os.path.join(projects.default.processor.state_dir, 'reports'),
+                                 max_workers=2, max_pending=20)
+    app.extensions['isoapp'] = {
+        'projects': projects,
+        'report_jobs': report_jobs,
+        'response_cache': response_cache,
+        'query_cache': query_cache
+    }
+
+    app.register_blueprint(bp)
+    app.register_blueprint(bp, url_prefix='/p/<project>', name='project')
+    app.add_url_rule('/api/projects', view_func=list_projects)
+    app.add_url_rule('/metrics', view_func=get_metrics)
+
+    # Deshabilitadas, las métricas no agregan trabajo a cada solicitud
+    if metrics.enabled:
+        app.before_request(_start_request_timer)
+        app.after_request(_observe_request)
+        metrics.add_collector(lambda: _cache_metrics(projects, response_cache, query_cache))
+
+    if app.config['WARM_UP']:
+        _warm_up(app)
+
+    return app
+
+
+def __getattr__(name):
+    # `app` (gunicorn app:app, flask run) se crea en el primer acceso: importar
+    # el módulo para usar create_app no lee la configuración ni los proyectos
+    if name == 'app':
+        global app
+        app = create_app()
+        return app
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
 if __name__ == '__main__':
-    app.run(debug=True, host='0.0.0.0', port=5000)
+    create_app().run(debug=True, host='0.0.0.0', port=5000)
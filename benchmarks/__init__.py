@@ -0,0 +1,3 @@
+"""
+Benchmarks de rendimiento de ISOapp (ver benchmarks/run.py)
+"""
@@ -0,0 +1,313 @@
+"""
+Benchmark de lectura, escritura, APIs JSON y reportes sobre matrices
+sintéticas de distintos tamaños
+
+Uso:
+    python -m benchmarks.run --sizes 100,1000,10000
+    python -m benchmarks.run --compare benchmarks/results/<commit>.json
+    python -m benchmarks.run --sizes 1000 --import-budget 0.5
+
+Los resultados se guardan en benchmarks/results/<commit>.json para poder
+compararlos entre commits.
+"""
+import argparse
+import json
+import os
+import platform
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime
+from typing import Any, Callable, Dict, List, Optional
+
+from utils.csv_processor import CSVProcessor
+from utils.matrix_cache import MatrixCache
+
+from .synthetic import generate_project
+
+
+RESULTS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'results')
+DEFAULT_SIZES = [100, 1000, 10000]
+# Escrituras medidas por caso (se informa el promedio por operación)
+WRITE_OPS = 20
+# Arranques de un proceso nuevo medidos (import app y create_app)
+STARTUP_RUNS = 5
+
+# Se ejecuta en un proceso nuevo: imprime los segundos de `import app`, de
+# create_app() y el pico de memoria de ambos (argv[1] = 1 activa tracemalloc)
+_STARTUP_SCRIPT = """
+import json, sys, time, tracemalloc
+if sys.argv[1] == '1':
+    tracemalloc.start()
+started = time.perf_counter()
+import app
+imported = time.perf_counter()
+app.create_app()
+created = time.perf_counter()
+peak = tracemalloc.get_traced_memory()[1] if tracemalloc.is_tracing() else 0
+print(json.dumps([imported - started, created - imported, peak]))
+"""
+
+
+def measure(run: Callable[[Any], Any], setup: Optional[Callable[[], Any]] = None,
+            repeat: int = 3, ops: int = 1) -> Dict[str, float]:
+    """
+    Mide run (tras setup, que no se cronometra) repeat veces sin trazar la
+    memoria, y una vez más con tracemalloc para obtener el pico
+
+    Returns:
+        Dict con segundos (mínimo), mediana y memoria_pico (bytes), por operación
+    """
+    times = []
+    for _ in range(repeat):
+        state = setup() if setup else None
+        started = time.perf_counter()
+        run(state)
+        times.append((time.perf_counter() - started) / ops)
+
+    state = setup() if setup else None
+    tracemalloc.start()
+    try:
+        run(state)
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+
+    return {
+        'segundos': min(times),
+        'mediana': statistics.median(times),
+        'memoria_pico': peak
+    }
+
+
+def _processor_cases(directory: str, repeat: int) -> Dict[str, Dict[str, float]]:
+    """Lectura en frío (procesador nuevo) y en caliente, y escrituras de MAGERIT"""
+    results = {}
+    fresh = lambda: CSVProcessor(directory, cache=MatrixCache())
+
+    for csv_type in CSVProcessor.CSV_FILES:
+        name = f'get_{csv_type}_data'
+        results[name] = measure(lambda p: p.get_data(csv_type), fresh, repeat)
+
+    results['get_all_data'] = measure(lambda p: p.get_all_data(), fresh, repeat)
+
+    warm = fresh()
+    warm.get_all_data()
+    results['get_all_data_caliente'] = measure(lambda _: warm.get_all_data(), repeat=repeat)
+
+    writer = fresh()
+    total = len(writer.get_magerit_data()['data'])
+    assets = [1 + (i * 7919) % total for i in range(WRITE_OPS)]
+
+    def updates(_):
+        for asset in assets:
+            writer.update_magerit_row(asset, {'frecuencia': '1.5', 'impacto': '3.5',
+                                              'valor_salvaguarda': 'Alto: 75%'})
+
+    def adds(_):
+        for i in range(WRITE_OPS):
+            writer.add_magerit_asset({
+                'tipo_activo': 'Software', 'activo': f'Activo de benchmark {i}',
+                'amenaza': 'Pérdida de información', 'valor_economico': 'Normal: 1.000.000 COP',
+                'frecuencia': 1.5, 'impacto': 2.5, 'salvaguarda': 'Backup de datos',
+                'valor_salvaguarda_pct': 60
+            })
+
+    results['update_magerit_row'] = measure(updates, repeat=repeat, ops=WRITE_OPS)
+    results['add_magerit_asset'] = measure(adds, repeat=repeat, ops=WRITE_OPS)
+    return results
+
+
+def _startup_cases(root: str, runs: int = STARTUP_RUNS) -> Dict[str, Dict[str, float]]:
+    """
+    Tiempo de `import app` y de create_app() en procesos nuevos (lo que tarda
+    un worker en quedar listo), sin precarga
+    """
+    env = dict(os.environ, ISOAPP_PROJECTS_DIR=root, ISOAPP_WARM_UP='0')
+    cwd = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+    def start(traced: bool) -> List[float]:
+        output = subprocess.check_output([sys.executable, '-c', _STARTUP_SCRIPT, '1' if traced else '0'],
+                                         cwd=cwd, env=env, text=True)
+        return json.loads(output.strip().splitlines()[-1])
+
+    samples = [start(False) for _ in range(runs)]
+    peak = start(True)[2]
+    results = {}
+    for position, name in ((0, 'import_app'), (1, 'create_app')):
+        times = [sample[position] for sample in samples]
+        results[name] = {'segundos': min(times), 'mediana': statistics.median(times), 'memoria_pico': peak}
+    return results
+
+
+def _endpoint_cases(application, project: str, rows: int, repeat: int,
+                    report_max_rows: int) -> Dict[str, Dict[str, float]]:
+    """APIs JSON (tras una escritura, desde la caché y con 304) y generación de reportes"""
+    client = application.test_client()
+    processor = application.extensions['isoapp']['projects'].get(project).processor
+    results = {}
+
+    def touch():
+        # Una escritura cambia la versión: la respuesta siguiente se vuelve a generar
+        processor.update_magerit_row(1, {'frecuencia': '1.5', 'impacto': '3.5'})
+
+    for name, url in (('api_data_all', f'/p/{project}/api/data/all'),
+                      ('api_data_magerit', f'/p/{project}/api/data/magerit'),
+                      ('api_data_magerit_pagina', f'/p/{project}/api/data/magerit?limit=100&tipo_activo=Software')):
+        results[name] = measure(lambda _: client.get(url).data, touch, repeat)
+        client.get(url)
+        results[f'{name}_caliente'] = measure(lambda _: client.get(url).data, repeat=repeat)
+        etag = client.get(url).headers['ETag']
+        results[f'{name}_304'] = measure(
+            lambda _: client.get(url, headers={'If-None-Match': etag}).status_code, repeat=repeat
+        )
+
+    if rows <= report_max_rows:
+        def report(_):
+            job = client.post(f'/p/{project}/api/report/generate', json={}).get_json()
+            while True:
+                status = client.get(job['status_url']).get_json()['data']
+                if status['status'] in ('done', 'failed'):
+                    break
+                time.sleep(0.01)
+            if status['status'] != 'done':
+                raise RuntimeError(f"El reporte falló: {status.get('error')}")
+            return client.get(job['download_url']).data
+
+        # Cada medición parte de datos nuevos para no usar la caché de reportes
+        results['generate_report'] = measure(report, touch, repeat=1)
+
+    return results
+
+
+def run_benchmarks(sizes: List[int], repeat: int = 3, report_max_rows: int = 1000,
+                   workdir: Optional[str] = None) -> Dict[str, Any]:
+    """
+    Mide el arranque, genera las matrices de cada tamaño y ejecuta todos los casos
+
+    Returns:
+        Dict con el entorno (commit, Python, plataforma) y resultados por
+        tamaño (el arranque, en resultados['arranque'])
+    """
+    root = workdir or tempfile.mkdtemp(prefix='isoapp-bench-')
+    import app as appmod
+
+    results = {}
+    try:
+        results['arranque'] = _startup_cases(root)
+        for name, values in results['arranque'].items():
+            print(f"[arranque] {name:<23} {values['segundos'] * 1000:>10.2f} ms "
+                  f"{values['memoria_pico'] / 1024 / 1024:>9.2f} MiB")
+
+        # Los proyectos sintéticos se sirven como /p/n<filas>/ (ver utils.projects)
+        application = appmod.create_app({'PROJECTS_DIR': root})
+        for rows in sizes:
+            project = f'n{rows}'
+            directory = os.path.join(root, project)
+            started = time.perf_counter()
+            generate_project(directory, rows)
+            print(f'[{rows} filas] matrices generadas en {time.perf_counter() - started:.1f} s')
+
+            cases = _processor_cases(directory, repeat)
+            cases.update(_endpoint_cases(application, project, rows, repeat, report_max_rows))
+            results[str(rows)] = cases
+            for name, values in cases.items():
+                print(f"  {name:<32} {values['segundos'] * 1000:>10.2f} ms "
+                      f"{values['memoria_pico'] / 1024 / 1024:>9.2f} MiB")
+    finally:
+        if workdir is None:
+            shutil.rmtree(root, ignore_errors=True)
+
+    return {
+        'commit': _git_commit(),
+        'fecha': datetime.now().isoformat(timespec='seconds'),
+        'python': platform.python_version(),
+        'plataforma': platform.platform(),
+        'repeticiones': repeat,
+        'resultados': results
+    }
+
+
+def _git_commit() -> str:
+    try:
+        return subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'],
+                                       stderr=subprocess.DEVNULL, text=True).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return 'sin-commit'
+
+
+def compare(baseline: Dict[str, Any], current: Dict[str, Any],
+            threshold: float = 0.25, min_seconds: float = 0.001) -> List[str]:
+    """
+    Imprime la variación de tiempo y memoria de cada caso respecto de otra
+    ejecución y retorna los casos más lentos que el umbral (ignorando los
+    que tardan menos de min_seconds en ambas, donde domina el ruido)
+    """
+    regressions = []
+    print(f"\nComparación con {baseline.get('commit')} ({baseline.get('fecha')})")
+    for size, cases in current['resultados'].items():
+        base_cases = baseline.get('resultados', {}).get(size)
+        if not base_cases:
+            continue
+        for name, values in cases.items():
+            base = base_cases.get(name)
+            if base is None:
+                continue
+            time_ratio = values['segundos'] / base['segundos'] if base['segundos'] else 1.0
+            memory_ratio = values['memoria_pico'] / base['memoria_pico'] if base['memoria_pico'] else 1.0
+            slower = (time_ratio > 1 + threshold
+                      and max(values['segundos'], base['segundos']) >= min_seconds)
+            mark = '  REGRESIÓN' if slower else ''
+            print(f'  {size:>8} {name:<32} tiempo x{time_ratio:>6.2f}  memoria x{memory_ratio:>6.2f}{mark}')
+            if slower:
+                regressions.append(f'{size}/{name}')
+    return regressions
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description='Benchmark de ISOapp con matrices sintéticas')
+    parser.add_argument('--sizes', default=','.join(str(s) for s in DEFAULT_SIZES),
+                        help='Filas de datos por matriz, separadas por comas (hasta 10^6)')
+    parser.add_argument('--repeat', type=int, default=3, help='Repeticiones de cada caso')
+    parser.add_argument('--report-max-rows', type=int, default=1000,
+                        help='Tamaño máximo con el que se mide la generación del reporte')
+    parser.add_argument('--output', help='Archivo de resultados (por defecto results/<commit>.json)')
+    parser.add_argument('--compare', help='Resultados de otra ejecución para comparar')
+    parser.add_argument('--threshold', type=float, default=0.25,
+                        help='Aumento de tiempo que se considera regresión (0.25 = 25%%)')
+    parser.add_argument('--workdir', help='Carpeta donde dejar las matrices generadas')
+    parser.add_argument('--import-budget', type=float,
+                        help='Segundos máximos de `import app` en un proceso nuevo (falla si se superan)')
+    args = parser.parse_args(argv)
+
+    sizes = [int(s) for s in args.sizes.split(',') if s.strip()]
+    result = run_benchmarks(sizes, args.repeat, args.report_max_rows, args.workdir)
+
+    output = args.output or os.path.join(RESULTS_DIR, f"{result['commit']}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, 'w', encoding='utf-8') as f:
+        json.dump(result, f, ensure_ascii=False, indent=2)
+    print(f'\nResultados guardados en {output}')
+
+    status = 0
+    if args.import_budget is not None:
+        imported = result['resultados']['arranque']['import_app']['segundos']
+        if imported > args.import_budget:
+            print(f'\n`import app` tarda {imported:.3f} s, más que el presupuesto de {args.import_budget:.3f} s')
+            status = 1
+
+    if args.compare:
+        with open(args.compare, 'r', encoding='utf-8') as f:
+            regressions = compare(json.load(f), result, args.threshold)
+        if regressions:
+            print(f"\n{len(regressions)} casos más lentos: {', '.join(regressions)}")
+            status = 1
+    return status
+
+
+if __name__ == '__main__':
+    sys.exit(main())
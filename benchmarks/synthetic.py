@@ -0,0 +1,143 @@
+"""
+Generador de matrices sintéticas con el mismo formato que los CSV reales:
+filas de metadatos, fila de encabezados (los marcadores que busca
+CSVProcessor) y codificación Latin-1
+"""
+import csv
+import os
+import random
+from typing import Dict, List
+
+from utils.csv_processor import CSVProcessor
+from utils.risk import classify_residual_risk
+
+
+ENCODING = 'latin-1'
+
+# Filas de metadatos antes de los encabezados y columna de la descripción,
+# como en los CSV del proyecto
+LAYOUT = {
+    'magerit': (8, 3),
+    'anexo_a': (6, 2),
+    'cobit': (6, 2),
+    'nist': (4, 3)
+}
+
+HEADERS = {
+    'magerit': ['Nº Activos', 'Tipo de Activo', 'Activo', 'Amenaza', 'Valor Económico del Activo',
+                'Frecuencia', 'Impacto', 'Riesgo Intrínseco', 'Salvaguarda', 'Valor Salvaguarda',
+                'Riesgo Residual'],
+    'anexo_a': ['Categoría', 'Control de Seguridad', 'Descripción del Control',
+                'Implementación en el Proyecto de Geotermia (CNN)', 'Responsable', '', ''],
+    'cobit': ['Proceso COBIT', 'Objetivo (Resumen)', 'Acciones Concretas en el Proyecto (Geotermia + CNN)',
+              'Contribución para dar respuesta a la situación', 'Indicadores / KPIs Sugeridos',
+              'Entregables / Evidencias', 'Escenario Negativo', 'Escenario Positivo'],
+    'nist': ['Función NIST', 'Control de Seguridad', 'Descripción',
+             'Implementación en el Proyecto de Geotermia (CNN)', 'Responsable']
+}
+
+TIPOS_ACTIVO = ['Datos Geoespaciales', 'Modelo de IA (CNN)', 'Infraestructura de TI',
+                'Software', 'Personal', 'Servicios en la Nube', 'Redes de Comunicación']
+AMENAZAS = ['Acceso no autorizado a datos', 'Modificación no autorizada del modelo',
+            'Fallo de servidor o acceso físico', 'Pérdida de información', 'Ataque de ransomware',
+            'Error humano en la configuración', 'Interrupción del servicio']
+SALVAGUARDAS = ['Backup de datos', 'Cifrado de información', 'Firewall', 'Control de acceso (RBAC)',
+                'Monitoreo continuo', 'Capacitación del personal', 'Plan de continuidad']
+FRECUENCIAS = [(1, '1 vez cada 6 meses'), (1.5, '1 vez cada 3 meses'), (2, '1 vez al mes'),
+               (2.5, '1 vez por semana')]
+CATEGORIAS = ['Controles Organizacionales', 'Controles de Personas', 'Controles Físicos',
+              'Controles de Tecnología']
+FUNCIONES_NIST = ['Identificar (Identify)', 'Proteger (Protect)', 'Detectar (Detect)',
+                  'Responder (Respond)', 'Recuperar (Recover)']
+PROCESOS_COBIT = ['EDM01 \x96 Gobierno TI', 'APO12 \x96 Gestionar riesgos', 'APO13 \x96 Gestionar seguridad',
+                  'BAI06 \x96 Gestionar cambios', 'DSS04 \x96 Gestionar continuidad', 'MEA01 \x96 Monitorizar desempeño']
+RESPONSABLES = ['Dirección de Seguridad de la Información', 'Dirección de TI', 'Recursos Humanos',
+                'Equipo de Desarrollo', 'Equipo de Gestión de Datos']
+PALABRAS = ('datos geoespaciales modelo red neuronal convolucional zonas geotérmicas acceso '
+            'seguridad información cifrado respaldo monitoreo incidentes riesgos políticas '
+            'proveedores nube servidores auditoría capacitación continuidad integridad').split()
+
+
+def _number(value: float) -> str:
+    """Número con coma decimal, como en los CSV ("3,5")"""
+    return f'{value:g}'.replace('.', ',')
+
+
+def _text(rng: random.Random, words: int) -> str:
+    return ' '.join(rng.choice(PALABRAS) for _ in range(words)).capitalize()
+
+
+def _metadata(csv_type: str) -> List[List[str]]:
+    rows, description_column = LAYOUT[csv_type]
+    width = len(HEADERS[csv_type])
+    title = ['' for _ in range(width)]
+    title[0] = f'Matriz sintética {csv_type} (benchmark)'
+    title[description_column] = 'Datos generados para medir el rendimiento; no corresponden a ningún proyecto.'
+    return [title] + [['' for _ in range(width)] for _ in range(rows - 1)]
+
+
+def magerit_row(rng: random.Random, number: int) -> List[str]:
+    """Fila de un activo de MAGERIT con sus riesgos calculados"""
+    frecuencia, frecuencia_texto = rng.choice(FRECUENCIAS)
+    impacto = rng.choice([1, 1.5, 2, 2.5, 3, 3.5, 4])
+    salvaguarda = rng.choice([30, 45, 60, 75, 85])
+    intrinseco = frecuencia * impacto
+    reduccion = round(intrinseco * salvaguarda / 100, 2)
+    residual = round(intrinseco - reduccion, 2)
+    nivel_salvaguarda = 'Muy alto' if salvaguarda >= 80 else 'Alto' if salvaguarda >= 60 else 'Normal'
+    tipo = rng.choice(TIPOS_ACTIVO)
+    return [
+        str(number),
+        tipo,
+        f'{tipo} {number}',
+        rng.choice(AMENAZAS),
+        f"Normal: {rng.randrange(500, 9000) * 1000:,} COP".replace(',', '.'),
+        frecuencia_texto,
+        f'Alto: {_number(impacto)}',
+        f'{_number(frecuencia)} * {_number(impacto)} = {_number(intrinseco)}',
+        ', '.join(rng.sample(SALVAGUARDAS, 2)),
+        f'{nivel_salvaguarda}: {salvaguarda}%',
+        f'{_number(intrinseco)} - {_number(reduccion)} = {_number(residual)} ({classify_residual_risk(residual)})'
+    ]
+
+
+def _data_rows(csv_type: str, rng: random.Random, rows: int) -> List[List[str]]:
+    if csv_type == 'magerit':
+        return [magerit_row(rng, number) for number in range(1, rows + 1)]
+    if csv_type == 'anexo_a':
+        return [[CATEGORIAS[i * len(CATEGORIAS) // rows], f'Control {i + 1}: {_text(rng, 3)}',
+                 _text(rng, 12), _text(rng, 16), rng.choice(RESPONSABLES), '', '']
+                for i in range(rows)]
+    if csv_type == 'cobit':
+        return [[f'{rng.choice(PROCESOS_COBIT)} {i + 1}'] + [_text(rng, 10) for _ in range(7)]
+                for i in range(rows)]
+    return [[rng.choice(FUNCIONES_NIST), f'Control {i + 1}: {_text(rng, 3)}', _text(rng, 12),
+             _text(rng, 16), rng.choice(RESPONSABLES)]
+            for i in range(rows)]
+
+
+def generate_matrix(csv_type: str, rows: int, seed: int = 0) -> List[List[str]]:
+    """Filas completas (metadatos, encabezados y datos) de una matriz sintética"""
+    rng = random.Random(f'{seed}-{csv_type}')
+    matrix = _metadata(csv_type) + [list(HEADERS[csv_type])] + _data_rows(csv_type, rng, rows)
+    if csv_type == 'magerit':
+        # Los CSV exportados terminan con filas vacías
+        matrix += [['' for _ in HEADERS['magerit']] for _ in range(3)]
+    return matrix
+
+
+def generate_project(directory: str, rows: int, seed: int = 0) -> Dict[str, str]:
+    """
+    Escribe las 4 matrices sintéticas con rows filas de datos cada una
+
+    Returns:
+        Dict tipo de matriz -> ruta del CSV generado
+    """
+    os.makedirs(directory, exist_ok=True)
+    paths = {}
+    for csv_type, filename in CSVProcessor.CSV_FILES.items():
+        path = os.path.join(directory, filename)
+        with open(path, 'w', encoding=ENCODING, newline='') as f:
+            csv.writer(f, lineterminator='\n').writerows(generate_matrix(csv_type, rows, seed))
+        paths[csv_type] = path
+    return paths
@@ -0,0 +1,89 @@
+"""
+Fixtures comunes: cada prueba trabaja sobre una copia de las matrices de
+ejemplo en una carpeta temporal
+"""
+import glob
+import os
+import shutil
+import sys
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from utils.csv_processor import CSVProcessor  # noqa: E402
+from utils.matrix_cache import MatrixCache  # noqa: E402
+
+
+# Datos mínimos de un alta de MAGERIT válida
+NEW_ASSET = {
+    'tipo_activo': 'Datos',
+    'activo': 'Registros de pozos',
+    'amenaza': 'Acceso no autorizado',
+    'valor_economico': '1000',
+    'frecuencia': 3,
+    'impacto': 4,
+    'salvaguarda': 'Cifrado',
+    'valor_salvaguarda_pct': '50'
+}
+
+
+def copy_matrices(directory):
+    """Copia los CSV de ejemplo a directory"""
+    os.makedirs(directory, exist_ok=True)
+    for path in glob.glob(os.path.join(ROOT, 'Matiz*.csv')):
+        shutil.copy(path, directory)
+    return str(directory)
+
+
+@pytest.fixture
+def project_dir(tmp_path):
+    return copy_matrices(tmp_path / 'proyecto')
+
+
+@pytest.fixture
+def processor(project_dir):
+    processor = CSVProcessor(project_dir, cache=MatrixCache())
+    yield processor
+    processor.stop_compaction_worker()
+
+
+@pytest.fixture
+def application(tmp_path):
+    """Aplicación con un proyecto 'demo' (rutas bajo /p/demo)"""
+    import app as appmod
+
+    root = tmp_path / 'proyectos'
+    copy_matrices(root / 'demo')
+    # El proyecto por defecto también en la carpeta temporal, no en la del repositorio
+    base = copy_matrices(tmp_path / 'base')
+    application = appmod.create_app({'BASE_PATH': base, 'PROJECTS_DIR': str(root), 'TESTING': True})
+    yield application
+    for project in application.extensions['isoapp']['projects'].loaded():
+        project.close()
+
+
+@pytest.fixture
+def client(application):
+    return application.test_client()
+
+
+def asset_row(processor, asset):
+    """Fila vigente de un activo de MAGERIT"""
+    for row in processor.get_magerit_data()['data']:
+        if row[0].strip() == str(asset):
+            return row
+    return None
+
+
+def reopen(processor):
+    """Otro CSVProcessor sobre la misma carpeta (como otro worker)"""
+    return CSVProcessor(processor.base_path, cache=MatrixCache())
+
+
+def matrix_version(client, prefix=''):
+    """Versión de MAGERIT que informa la API (prefix: /p/<proyecto>)"""
+    response = client.get(f'{prefix}/api/data/magerit')
+    assert response.status_code == 200
+    return int(response.headers['X-Matrix-Version'])
@@ -0,0 +1,71 @@
+"""
+Respuestas condicionales de las APIs de datos: ETag por codificación y 304
+"""
+import gzip
+import json
+
+
+def test_each_encoding_has_its_own_etag(client):
+    plain = client.get('/api/data/nist', headers={'Accept-Encoding': 'identity'})
+    packed = client.get('/api/data/nist', headers={'Accept-Encoding': 'gzip'})
+
+    assert 'Content-Encoding' not in plain.headers
+    assert packed.headers['Content-Encoding'] == 'gzip'
+    assert packed.headers['ETag'] == plain.headers['ETag'][:-1] + '-gzip"'
+    assert json.loads(gzip.decompress(packed.data)) == plain.get_json()
+
+
+def test_any_variant_revalidates(client):
+    plain = client.get('/api/data/nist', headers={'Accept-Encoding': 'identity'})
+    packed = client.get('/api/data/nist', headers={'Accept-Encoding': 'gzip'})
+
+    for response in (plain, packed):
+        etag = response.headers['ETag']
+        again = client.get('/api/data/nist', headers={'If-None-Match': etag, 'Accept-Encoding': 'gzip'})
+        assert again.status_code == 304
+        assert again.headers['ETag'] == etag
+        assert again.data == b''
+
+    weak = client.get('/api/data/nist', headers={'If-None-Match': 'W/' + packed.headers['ETag']})
+    assert weak.status_code == 304
+
+
+def test_write_changes_magerit_etag(client):
+    first = client.get('/api/data/magerit', headers={'Accept-Encoding': 'gzip'})
+    etag = first.headers['ETag']
+    assert client.get('/api/data/magerit', headers={'If-None-Match': etag}).status_code == 304
+
+    client.post('/api/magerit/update/1', json={'impacto': 2}, headers={'If-Match': etag})
+
+    after = client.get('/api/data/magerit', headers={'If-None-Match': etag})
+    assert after.status_code == 200
+    assert after.headers['ETag'] != etag
+
+
+def test_unknown_query_parameters_are_ignored(client):
+    full = client.get('/api/data/cobit')
+    busted = client.get('/api/data/cobit?_=123')
+
+    assert busted.status_code == 200
+    assert busted.get_json() == full.get_json()
+
+    page = client.get('/api/data/nist?limit=2&_=1').get_json()['data']
+    assert page == client.get('/api/data/nist?_=2&limit=2').get_json()['data']
+    assert len(page['data']) == 2
+
+
+def test_invalid_paging_is_still_rejected(client):
+    assert client.get('/api/data/nist?limit=abc').status_code == 400
+    assert client.get('/api/data/nist?fields=no-existe').status_code == 400
+
+
+def test_queries_do_not_evict_hot_responses(client, application):
+    caches = application.extensions['isoapp']
+    client.get('/api/data/all')
+    for offset in range(100):
+        client.get(f'/api/data/nist?limit=1&offset={offset}')
+
+    stats = caches['response_cache'].stats()
+    client.get('/api/data/all')
+    assert caches['response_cache'].stats()['hits'] == stats['hits'] + 1
+    assert caches['query_cache'].stats()['misses'] >= 100
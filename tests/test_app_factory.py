@@ -0,0 +1,64 @@
+"""
+Fábrica de la aplicación: importación liviana, configuración y precarga
+"""
+import json
+import subprocess
+import sys
+
+from conftest import ROOT, copy_matrices
+from utils.matrix_cache import matrix_cache
+
+
+def test_import_does_not_load_reports_or_create_app():
+    script = (
+        'import json, sys\n'
+        'import app\n'
+        'print(json.dumps({"modulos": sorted(m for m in ("reportlab", "pypdf", "numpy") if m in sys.modules),'
+        ' "app": "app" in vars(app)}))\n'
+    )
+    output = subprocess.run([sys.executable, '-c', script], cwd=ROOT, check=True,
+                            capture_output=True, text=True).stdout
+    result = json.loads(output.strip().splitlines()[-1])
+    assert result == {'modulos': [], 'app': False}
+
+
+def test_config_precedence(tmp_path, monkeypatch):
+    import app as appmod
+
+    base = copy_matrices(tmp_path / 'base')
+    monkeypatch.setenv('ISOAPP_MAX_PROJECTS', '3')
+    monkeypatch.setenv('ISOAPP_PROJECTS_MEMORY_MB', '64')
+    # El proyecto por defecto usa la caché de matrices del proceso
+    misses = matrix_cache.stats()['misses']
+    application = appmod.create_app({'BASE_PATH': base, 'PROJECTS_DIR': str(tmp_path / 'proyectos'),
+                                     'PROJECTS_MEMORY_MB': 32})
+    projects = application.extensions['isoapp']['projects']
+    try:
+        # Entorno sobre DEFAULT_CONFIG, y el diccionario sobre el entorno
+        assert projects.max_projects == 3
+        assert projects.memory_budget_bytes == 32 * 1024 * 1024
+        # Sin precarga, ninguna matriz se lee al crear la aplicación
+        assert matrix_cache.stats()['misses'] == misses
+    finally:
+        for project in projects.loaded():
+            project.close()
+
+
+def test_warm_up_prerenders_views(tmp_path):
+    import app as appmod
+
+    base = copy_matrices(tmp_path / 'base')
+    application = appmod.create_app({'BASE_PATH': base, 'PROJECTS_DIR': str(tmp_path / 'proyectos'),
+                                     'TESTING': True, 'WARM_UP': True})
+    response_cache = application.extensions['isoapp']['response_cache']
+    try:
+        assert 'reportlab' in sys.modules
+        warmed = response_cache.stats()
+        assert warmed['entries'] >= len(appmod.WARM_UP_PATHS)
+
+        response = application.test_client().get('/nist', headers={'Accept-Encoding': 'gzip'})
+        assert response.status_code == 200
+        assert response_cache.stats()['hits'] == warmed['hits'] + 1
+    finally:
+        for project in application.extensions['isoapp']['projects'].loaded():
+            project.close()
@@ -0,0 +1,83 @@
+"""
+Lotes de altas y ediciones de MAGERIT: resultado por operación, una sola
+escritura del diario y validación de las altas
+"""
+from conftest import NEW_ASSET, asset_row, matrix_version
+
+
+
+def test_batch_reports_each_operation(processor):
+    version = processor.get_magerit_version()
+
+    results = processor.apply_magerit_batch([
+        {'op': 'update', 'asset': 1, 'data': {'frecuencia': 2}},
+        {'op': 'update', 'asset': 999, 'data': {'frecuencia': 2}},
+        {'op': 'add', 'data': {'activo': 'Sin campos'}},
+        {'op': 'borrar', 'asset': 1},
+        {'op': 'update', 'asset': 1, 'data': {'impacto': 5}},
+        {'op': 'add', 'data': NEW_ASSET}
+    ])
+
+    assert [r['success'] for r in results] == [True, False, False, False, True, True]
+    assert 'N° 999' in results[1]['error']
+    # Una versión por operación aplicada, en una sola escritura del diario
+    assert processor.get_magerit_version() == version + 3
+    row = asset_row(processor, 1)
+    assert (row[5], row[6]) == ('2', 'Muy Alto: 5')
+
+
+def test_batch_without_valid_operations_does_not_write(processor):
+    version = processor.get_magerit_version()
+
+    results = processor.apply_magerit_batch([{'op': 'update', 'asset': 999, 'data': {}}])
+
+    assert results[0]['success'] is False
+    assert processor.get_magerit_version() == version
+
+
+def test_add_requires_fields(client):
+    response = client.post('/api/magerit/add', json={'activo': 'Incompleto'})
+
+    assert response.status_code == 400
+    assert 'tipo_activo' in response.get_json()['error']
+
+
+def test_batch_endpoint_reports_partial_failure(client):
+    version = matrix_version(client)
+
+    response = client.post('/api/magerit/batch', json={'operations': [
+        {'op': 'update', 'asset': 1, 'data': {'frecuencia': 2}},
+        {'op': 'update', 'asset': 999, 'data': {'frecuencia': 2}},
+        {'op': 'add', 'data': NEW_ASSET}
+    ]})
+
+    body = response.get_json()
+    assert response.status_code == 200
+    assert (body['applied'], body['failed']) == (2, 1)
+    assert body['version'] == version + 2
+    assert [r['success'] for r in body['results']] == [True, False, True]
+
+def test_batch_is_one_journal_write(processor, monkeypatch):
+    appends = []
+    append = processor.journal.append
+    monkeypatch.setattr(processor.journal, 'append', lambda records: appends.append(records) or append(records))
+
+    processor.apply_magerit_batch([
+        {'op': 'update', 'asset': 1, 'data': {'impacto': 1}},
+        {'op': 'add', 'data': NEW_ASSET}
+    ])
+
+    assert len(appends) == 1
+    assert [r['op'] for r in appends[0]] == ['update', 'add']
+    assert appends[0][0]['v'] + 1 == appends[0][1]['v']
+
+
+def test_batch_endpoint_rejects_stale_version(client):
+    version = matrix_version(client)
+    client.post('/api/magerit/update/1', json={'impacto': 2})
+
+    response = client.post('/api/magerit/batch', headers={'If-Match': f'"{version}"'},
+                           json={'operations': [{'op': 'add', 'data': NEW_ASSET}]})
+
+    assert response.status_code == 412
+    assert matrix_version(client) == version + 1
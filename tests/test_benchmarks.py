@@ -0,0 +1,39 @@
+"""
+Benchmark: las matrices sintéticas deben poder leerse como las reales y la
+comparación debe detectar regresiones por encima del umbral
+"""
+from benchmarks.run import compare, measure
+from benchmarks.synthetic import generate_matrix, generate_project
+from utils.csv_processor import CSVProcessor
+from utils.matrix_cache import MatrixCache
+
+
+def test_generated_project_is_readable(tmp_path):
+    generate_project(str(tmp_path), rows=50, seed=3)
+    processor = CSVProcessor(str(tmp_path), cache=MatrixCache())
+
+    assert len(processor.get_magerit_data()['data']) == 50
+    for csv_type in ('anexo_a', 'cobit', 'nist'):
+        assert len(processor.get_data(csv_type)['data']) == 50
+    risks = processor.calculate_magerit_matrix_risks()
+    assert risks['errores'] == []
+    # Los riesgos de cada fila coinciden con los que escribió el generador
+    written = [float(r[7].rsplit(' = ', 1)[1].replace(',', '.')) for r in processor.get_magerit_data()['data']]
+    assert written == risks['riesgo_intrinseco']
+
+
+def test_generation_is_deterministic():
+    assert generate_matrix('nist', 20, seed=1) == generate_matrix('nist', 20, seed=1)
+    assert generate_matrix('nist', 20, seed=1) != generate_matrix('nist', 20, seed=2)
+
+
+def test_measure_and_compare():
+    result = measure(lambda state: sum(range(1000)), repeat=2)
+    assert set(result) == {'segundos', 'mediana', 'memoria_pico'}
+
+    case = {'segundos': 0.01, 'mediana': 0.01, 'memoria_pico': 1000}
+    baseline = {'commit': 'a', 'fecha': 'hoy', 'resultados': {'100': {'leer': case, 'escribir': case}}}
+    current = {'resultados': {'100': {'leer': dict(case, segundos=0.02), 'escribir': case}}}
+
+    assert compare(baseline, current) == ['100/leer']
+    assert compare(baseline, current, threshold=1.5) == []
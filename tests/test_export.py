@@ -0,0 +1,75 @@
+"""
+Exportación completa de las matrices en /api/export/<csv_type>
+"""
+import csv
+import io
+import json
+import zipfile
+
+import pytest
+
+from utils.export import column_names
+
+
+def default_processor(application):
+    return application.extensions['isoapp']['projects'].default.processor
+
+
+@pytest.mark.parametrize('csv_type', ['magerit', 'anexo_a', 'cobit', 'nist'])
+def test_csv_export_matches_data(application, client, csv_type):
+    data = default_processor(application).get_data(csv_type)
+
+    response = client.get(f'/api/export/{csv_type}?format=csv')
+    assert response.status_code == 200
+    assert response.is_streamed
+    assert response.mimetype == 'text/csv'
+    assert response.headers['X-Data-Version'] == default_processor(application).get_data_version(csv_type)
+    assert 'attachment' in response.headers['Content-Disposition']
+
+    rows = list(csv.reader(io.StringIO(response.get_data(as_text=True))))
+    assert rows == [list(data['headers'])] + [list(row) for row in data['data']]
+
+
+def test_ndjson_export_numbers_blank_headers(application, client):
+    data = default_processor(application).get_data('anexo_a')
+    names = column_names(data['headers'])
+    assert 'columna_6' in names and len(set(names)) == len(names)
+
+    response = client.get('/api/export/anexo_a?format=ndjson')
+    assert response.status_code == 200
+    assert response.mimetype == 'application/x-ndjson'
+
+    records = [json.loads(line) for line in response.get_data(as_text=True).splitlines()]
+    assert len(records) == len(data['data'])
+    for record, row in zip(records, data['data']):
+        assert list(record) == names
+        assert list(record.values()) == [row[i] if i < len(row) else '' for i in range(len(names))]
+
+
+def test_xlsx_export_is_a_workbook_with_every_row(application, client):
+    data = default_processor(application).get_data('nist')
+
+    response = client.get('/api/export/nist?format=xlsx')
+    assert response.status_code == 200
+
+    with zipfile.ZipFile(io.BytesIO(response.get_data())) as archive:
+        assert archive.testzip() is None
+        sheet = archive.read('xl/worksheets/sheet1.xml').decode('utf-8')
+    assert sheet.count('<row ') == len(data['data']) + 1
+
+
+def test_export_applies_fields_and_filters(application, client):
+    rows = default_processor(application).get_data('nist')['data']
+    function = rows[0][0].strip()
+    expected = [[row[1]] for row in rows if row[0].strip() == function]
+
+    response = client.get('/api/export/nist', query_string={'fields': '1', 'funcion': function})
+    assert response.status_code == 200
+    exported = list(csv.reader(io.StringIO(response.get_data(as_text=True))))
+    assert exported[1:] == expected
+
+
+def test_invalid_format_is_rejected_before_streaming(client):
+    response = client.get('/api/export/nist?format=pdf')
+    assert response.status_code == 400
+    assert response.get_json()['success'] is False
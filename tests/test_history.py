@@ -0,0 +1,56 @@
+"""
+Historial de MAGERIT: trayectoria de un activo a través de puntos de
+control y reemplazos, leyendo solo sus deltas
+"""
+from conftest import asset_row
+
+
+def impacts(points):
+    return [(p['op'], p['impacto']) for p in points]
+
+
+def test_trajectory_across_checkpoints_and_replace(processor, monkeypatch):
+    # Un punto de control tras cada escritura
+    monkeypatch.setattr(processor.history, 'needs_checkpoint', lambda: True)
+    for value in (1, 2, 3):
+        processor.update_magerit_row(1, {'impacto': value})
+        processor.update_magerit_row(2, {'impacto': value})
+    # Quitar un activo guarda un reemplazo completo
+    rows = [row for row in processor.read_csv('magerit') if not row or row[0].strip() != '3']
+    for row in rows:
+        if row and row[0].strip() == '1':
+            row[6] = 'Muy Alto: 5'
+    processor.write_csv('magerit', rows)
+    processor.update_magerit_row(1, {'impacto': 4})
+
+    points = processor.get_magerit_trajectory(1)
+
+    assert len(processor.history.checkpoints()) > 2
+    assert impacts(points)[1:] == [('update', 1), ('update', 2), ('update', 3),
+                                   ('replace', 5), ('update', 4)]
+    assert points[-1]['version'] == processor.get_magerit_version()
+    assert asset_row(processor, 1)[6].endswith(': 4')
+
+
+def test_trajectory_reads_only_asset_lines(processor, monkeypatch):
+    processor.update_magerit_row(1, {'impacto': 2})
+    for value in range(20):
+        processor.update_magerit_row(2, {'frecuencia': 1 + value % 4})
+    processor.update_magerit_row(1, {'impacto': 3})
+    history = processor.history
+    read = []
+    original = history._read_deltas
+
+    def counting(offsets):
+        read.extend(offsets)
+        return original(offsets)
+
+    monkeypatch.setattr(history, '_read_deltas', counting)
+
+    points = history.trajectory(1)
+
+    assert len(read) == 2
+    assert impacts(points)[1:] == [('update', 2), ('update', 3)]
+
+    processor.update_magerit_row(1, {'impacto': 4})
+    assert impacts(history.trajectory(1))[-1] == ('update', 4)
@@ -0,0 +1,107 @@
+"""
+Diario de cambios de MAGERIT: registro de ediciones y altas, reconstrucción
+desde el diario, compactación y escrituras interrumpidas
+"""
+import pytest
+
+from utils.csv_processor import CSVProcessor
+from utils.journal import ChangeJournal
+from utils.matrix_cache import MatrixCache
+
+from conftest import NEW_ASSET, asset_row, reopen
+
+
+def test_update_goes_to_journal_and_is_replayed(processor):
+    processor.update_magerit_row(1, {'frecuencia': 4})
+
+    assert processor.journal.read()[0][-1]['asset'] == '1'
+    row = asset_row(reopen(processor), 1)
+    assert row[5] == '4'
+    assert row[7].startswith('4 * ')
+
+
+def test_add_uses_next_asset_number(processor):
+    last = max(int(row[0]) for row in processor.get_magerit_data()['data'])
+
+    row = processor.add_magerit_asset(NEW_ASSET)
+
+    assert row[0] == str(last + 1)
+    assert asset_row(reopen(processor), last + 1)[2] == NEW_ASSET['activo']
+
+
+def test_compaction_writes_csv_and_keeps_version(processor):
+    processor.update_magerit_row(2, {'impacto': 2})
+    version = processor.get_magerit_version()
+
+    assert processor.compact_magerit() is True
+    assert processor.compact_magerit() is False
+
+    records, _ = processor.journal.read()
+    assert [r['op'] for r in records] == ['base']
+    assert any(row[0].strip() == '2' and row[6] == 'Normal: 2' for row in processor.read_csv('magerit'))
+    fresh = reopen(processor)
+    assert fresh.get_magerit_version() == version
+    assert asset_row(fresh, 2) == asset_row(processor, 2)
+
+
+def test_compaction_threshold(project_dir):
+    processor = CSVProcessor(project_dir, cache=MatrixCache(), compaction_threshold=3)
+    for value in (1, 2, 3):
+        processor.update_magerit_row(1, {'frecuencia': value})
+
+    assert processor.journal.read()[0][-1]['op'] == 'base'
+    assert asset_row(reopen(processor), 1)[5] == '3'
+
+
+def test_invalid_number_is_rejected_without_writing(processor):
+    version = processor.get_magerit_version()
+
+    with pytest.raises(ValueError):
+        processor.update_magerit_row(1, {'frecuencia': 'mucho'})
+
+    assert processor.get_magerit_version() == version
+
+
+def test_add_twice_after_blank_row_in_data_block(processor):
+    # Una fila vacía en medio del bloque de datos, con activos después
+    rows = processor.read_csv('magerit')
+    position = next(i for i, row in enumerate(rows) if row and row[0].strip() == '2')
+    rows.insert(position + 1, [''] * len(rows[position]))
+    processor.write_csv('magerit', rows)
+    last = max(int(row[0]) for row in processor.get_magerit_data()['data'] if row[0].strip())
+
+    first = processor.add_magerit_asset(NEW_ASSET)
+    second = processor.add_magerit_asset(dict(NEW_ASSET, activo='Servidor SCADA'))
+
+    assert (first[0], second[0]) == (str(last + 1), str(last + 2))
+    processor.update_magerit_row(last + 2, {'impacto': 1})
+    fresh = reopen(processor)
+    assert asset_row(fresh, last + 1)[2] == NEW_ASSET['activo']
+    assert asset_row(fresh, last + 2)[6].endswith(': 1')
+
+
+def test_partial_line_is_dropped_before_next_append(processor):
+    processor.update_magerit_row(1, {'frecuencia': 2})
+    # Un proceso que murió a mitad de una escritura
+    with open(processor.journal.path, 'ab') as f:
+        f.write(b'{"op": "update", "asset": "1", "ro')
+
+    processor.update_magerit_row(2, {'frecuencia': 3})
+
+    fresh = reopen(processor)
+    assert (asset_row(fresh, 1)[5], asset_row(fresh, 2)[5]) == ('2', '3')
+    with open(processor.journal.path, 'rb') as f:
+        assert b'"ro{' not in f.read()
+
+
+def test_read_skips_damaged_lines(tmp_path):
+    journal = ChangeJournal(str(tmp_path / 'diario.jsonl'), fsync=False)
+    journal.append([{'v': 1}])
+    with open(journal.path, 'ab') as f:
+        f.write(b'{"v": 2, basura\n')
+    journal.append([{'v': 3}])
+
+    records, offset = journal.read()
+
+    assert [r['v'] for r in records] == [1, 3]
+    assert offset == journal.signature()[1]
@@ -0,0 +1,36 @@
+"""
+Cambios en vivo de MAGERIT: eventos posteriores a la versión del cliente,
+con el activo que modifican (la vista decide con eso si la edición abierta
+quedó desactualizada)
+"""
+import json
+
+from utils.live import ChangeFeed
+
+
+def events(payload):
+    parsed = []
+    for block in payload.decode('utf-8').split('\n\n'):
+        fields = dict(line.split(': ', 1) for line in block.splitlines() if ': ' in line)
+        if 'event' in fields:
+            parsed.append((fields['event'], int(fields['id']), json.loads(fields['data'])))
+    return parsed
+
+
+def test_wait_returns_events_after_cursor(processor):
+    processor.update_magerit_row(1, {'impacto': 2})
+    feed = ChangeFeed(processor, poll_seconds=60)
+    try:
+        cursor = feed.version
+        processor.update_magerit_row(2, {'impacto': 3})
+        processor.update_magerit_row(1, {'impacto': 4})
+        feed.poll()
+
+        version, payload = feed.wait(cursor, timeout=0)
+
+        assert version == cursor + 2
+        assert [(e, v, d['asset']) for e, v, d in events(payload)] == [
+            ('update', cursor + 1, '2'), ('update', cursor + 2, '1')]
+        assert feed.wait(cursor + 1, timeout=0)[1].count(b'event: update') == 1
+    finally:
+        feed.close()
@@ -0,0 +1,49 @@
+"""
+Índice de activos de MAGERIT: ubicación de cada activo, siguiente número
+libre y desplazamiento de las posiciones al insertar
+"""
+from utils.csv_processor import MageritIndex
+
+from conftest import NEW_ASSET, asset_row
+
+
+ROWS = [
+    ['Matriz MAGERIT'],
+    ['N° Activos', 'Tipo de Activo', 'Activo'],
+    ['1', 'Datos', 'A'],
+    ['2', 'Datos', 'B'],
+    [''],
+    ['4', 'Software', 'D'],
+    ['Notas']
+]
+
+
+def test_build_locates_assets():
+    index = MageritIndex.build(ROWS)
+
+    assert (index.find(1), index.find(' 4 '), index.find(3)) == (2, 5, None)
+    assert index.next_asset_number() == 5
+    # La primera fila vacía cierra el bloque de datos
+    assert index.end_of_data == 4
+
+
+def test_insert_before_last_position_shifts_later_rows():
+    rows = [list(row) for row in ROWS]
+    index = MageritIndex.build(rows)
+    position = index.end_of_data
+
+    rows.insert(position, ['5', 'Datos', 'E'])
+    index.register_insert(5, position)
+
+    assert {asset: index.find(asset) for asset in (1, 2, 4, 5)} == {1: 2, 2: 3, 4: 6, 5: 4}
+    assert all(rows[index.find(asset)][0] == str(asset) for asset in (1, 2, 4, 5))
+    assert (index.next_asset_number(), index.end_of_data) == (6, 5)
+
+
+def test_insert_at_end_of_data(processor):
+    row = processor.add_magerit_asset(NEW_ASSET)
+    index = processor._magerit_state.index
+
+    assert processor._magerit_state.rows[index.find(row[0])] == row
+    assert asset_row(processor, row[0]) == row
+    assert index.next_asset_number() == int(row[0]) + 1
@@ -0,0 +1,50 @@
+"""
+Registros de MAGERIT con los valores numéricos interpretados una sola vez:
+las columnas deben coincidir con interpretar cada fila y con el cálculo de
+un solo activo, también después de editar
+"""
+from utils.risk import parse_magerit_values
+
+from conftest import NEW_ASSET, reopen
+
+
+def apply_changes(processor):
+    processor.update_magerit_row(1, {'frecuencia': 5, 'impacto': 5})
+    processor.add_magerit_asset(NEW_ASSET)
+    processor.apply_magerit_batch([
+        {'op': 'update', 'asset': 2, 'data': {'valor_salvaguarda_pct': 90}},
+        {'op': 'add', 'data': dict(NEW_ASSET, activo='Modelo CNN', impacto=0.93)}
+    ])
+
+
+def test_columns_match_parsing_each_row(processor):
+    apply_changes(processor)
+
+    columns = processor.get_magerit_columns()
+    rows = {row[0]: row for row in processor.get_magerit_data()['data']}
+
+    assert columns['errores'] == []
+    for k, asset in enumerate(columns['activo']):
+        values = parse_magerit_values(rows[asset])
+        assert (columns['frecuencia'][k], columns['impacto'][k], columns['salvaguarda_pct'][k]) == values
+
+
+def test_columnar_risks_match_scalar_calculation(processor):
+    apply_changes(processor)
+
+    result = processor.calculate_magerit_matrix_risks()
+
+    assert len(result['activo']) == len(processor.get_magerit_data()['data'])
+    for k in range(len(result['activo'])):
+        scalar = processor.calculate_magerit_risk(result['frecuencia'][k], result['impacto'][k],
+                                                  result['salvaguarda_pct'][k])
+        assert result['riesgo_intrinseco'][k] == scalar['riesgo_intrinseco']
+        assert result['riesgo_residual'][k] == scalar['riesgo_residual']
+
+
+def test_numeric_columns_match_fresh_parse(processor):
+    processor.calculate_magerit_matrix_risks()
+
+    apply_changes(processor)
+
+    assert processor.calculate_magerit_matrix_risks() == reopen(processor).calculate_magerit_matrix_risks()
@@ -0,0 +1,71 @@
+"""
+Mapeo entre marcos: el índice de controles no se recalcula al editar
+MAGERIT y el resultado incremental coincide con el calculado desde cero
+"""
+import json
+import os
+
+from utils.mapping import ControlMapper, build_mapping
+from utils.search import MATRIX_TYPES
+
+from conftest import NEW_ASSET
+
+
+def from_scratch(processor, overrides=None):
+    matrices = {csv_type: processor.get_data(csv_type).get('data', []) for csv_type in MATRIX_TYPES}
+    return build_mapping(matrices, overrides)
+
+
+def test_edits_rescore_only_the_changed_assets(processor):
+    mapper = ControlMapper(processor)
+    mapper.refresh()
+    stats = mapper.stats()
+    mtime = os.stat(mapper.path).st_mtime_ns
+
+    processor.update_magerit_row(1, {'salvaguarda': 'Análisis de riesgos y continuidad del negocio'})
+    row = processor.add_magerit_asset(NEW_ASSET)
+
+    assert mapper.get_mapping() == from_scratch(processor)
+    current = mapper.stats()
+    assert current['recalculos'] == stats['recalculos'] == 1
+    assert current['activos_recalculados'] == stats['activos_recalculados'] + 2
+    assert os.stat(mapper.path).st_mtime_ns == mtime
+    assert mapper.related('magerit', row[0])['nist']
+
+
+def test_index_is_shared_between_processes(processor):
+    ControlMapper(processor).refresh()
+    other = ControlMapper(processor)
+
+    assert other.get_mapping() == from_scratch(processor)
+    assert other.stats()['recalculos'] == 0
+
+
+def test_overrides_are_applied(processor, project_dir):
+    mapping = from_scratch(processor)
+    nist = mapping['labels']['nist']
+    target = sorted(nist)[0]
+    with open(os.path.join(project_dir, ControlMapper.OVERRIDES_FILE), 'w', encoding='utf-8') as f:
+        json.dump({'1': {'nist': {'add': [nist[target]]}}}, f)
+
+    related = ControlMapper(processor).related('magerit', '1')
+
+    assert related['nist'][0] == {'id': target, 'nombre': nist[target], 'similitud': 1.0}
+
+
+def test_malformed_overrides_are_ignored(processor, project_dir, caplog):
+    with open(os.path.join(project_dir, ControlMapper.OVERRIDES_FILE), 'w', encoding='utf-8') as f:
+        f.write('{"1": {"nist": ')
+
+    mapper = ControlMapper(processor)
+
+    assert mapper.get_mapping() == from_scratch(processor)
+    assert 'Se ignora' in caplog.text
+
+
+def test_magerit_view_survives_malformed_overrides(client, application):
+    path = application.extensions['isoapp']['projects'].default.path
+    with open(os.path.join(path, ControlMapper.OVERRIDES_FILE), 'w', encoding='utf-8') as f:
+        f.write('[1, 2')
+
+    assert client.get('/magerit').status_code == 200
@@ -0,0 +1,35 @@
+"""
+Caché de matrices procesadas: una lectura repetida no vuelve a interpretar
+el CSV y cualquier cambio en el archivo (o en el diario de MAGERIT)
+invalida la entrada
+"""
+from conftest import asset_row, reopen
+
+
+def test_repeated_read_is_served_from_cache(processor):
+    first = processor.get_nist_data()
+    hits = processor.get_cache_stats()['hits']
+
+    assert processor.get_nist_data() is first
+    assert processor.get_cache_stats()['hits'] == hits + 1
+
+
+def test_file_written_elsewhere_is_read_again(processor):
+    before = processor.get_nist_data()
+    rows = processor.read_csv('nist')
+
+    reopen(processor).write_csv('nist', rows + [['Detectar', 'DE.CM-99', 'Monitoreo de pozos']])
+
+    after = processor.get_nist_data()
+    assert after is not before
+    assert after['data'][-1][:2] == ['Detectar', 'DE.CM-99']
+    assert len(after['data']) == len(before['data']) + 1
+
+
+def test_magerit_version_includes_journal(processor):
+    before = processor.get_magerit_data()
+
+    reopen(processor).update_magerit_row(1, {'impacto': 1})
+
+    assert processor.get_magerit_data() is not before
+    assert asset_row(processor, 1)[6].endswith(': 1')
@@ -0,0 +1,22 @@
+"""
+Índices de consulta de las matrices (filtros de /api/data): siguen las
+escrituras de MAGERIT sin volver a construirse desde cero
+"""
+
+
+def test_query_index_follows_updates(processor):
+    processor.update_magerit_row(1, {'frecuencia': 5, 'impacto': 5, 'valor_salvaguarda_pct': 0})
+
+    result = processor.query_data('magerit', filters={'clasificacion': ['Riesgo Alto']})
+
+    assert '1' in [row[0].strip() for row in result['data']]
+
+
+def test_paging_and_projection(processor):
+    full = processor.get_nist_data()
+
+    page = processor.query_data('nist', fields=['función nist', '1'], offset=1, limit=2)
+
+    assert page['headers'] == full['headers'][:2]
+    assert page['data'] == [row[:2] for row in full['data'][1:3]]
+    assert (page['total'], page['next_offset']) == (len(full['data']), 3)
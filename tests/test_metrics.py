@@ -0,0 +1,96 @@
+"""
+Registro de métricas y exportación en /metrics
+"""
+import pytest
+
+from conftest import copy_matrices
+from utils.metrics import Metrics, metrics
+
+
+def test_disabled_registry_records_nothing():
+    registry = Metrics(enabled=False)
+    registry.counter('total', 'Total')
+    registry.histogram('duracion', 'Duración', buckets=(1, 2))
+
+    registry.inc('total')
+    registry.observe('duracion', 1.5)
+    with registry.timer('duracion'):
+        pass
+
+    lines = registry.render().splitlines()
+    assert '# TYPE total counter' in lines
+    # Solo las declaraciones, sin muestras
+    assert all(line.startswith('#') for line in lines)
+
+
+def test_counter_and_histogram_render_as_prometheus_text():
+    registry = Metrics(enabled=True)
+    registry.counter('solicitudes_total', 'Solicitudes', ('ruta',))
+    registry.histogram('duracion', 'Duración', ('ruta',), buckets=(1, 2))
+
+    registry.inc('solicitudes_total', labels=('a',))
+    registry.inc('solicitudes_total', 2, labels=('a',))
+    registry.inc('solicitudes_total', labels=('con "comillas"',))
+    for value in (0.5, 1.5, 3):
+        registry.observe('duracion', value, ('a',))
+
+    lines = registry.render().splitlines()
+    assert '# TYPE solicitudes_total counter' in lines
+    assert 'solicitudes_total{ruta="a"} 3' in lines
+    assert 'solicitudes_total{ruta="con \\"comillas\\""} 1' in lines
+    assert '# TYPE duracion histogram' in lines
+    # Buckets acumulados; el de +Inf cuenta todas las observaciones
+    assert 'duracion_bucket{ruta="a",le="1.0"} 1' in lines
+    assert 'duracion_bucket{ruta="a",le="2.0"} 2' in lines
+    assert 'duracion_bucket{ruta="a",le="+Inf"} 3' in lines
+    assert 'duracion_sum{ruta="a"} 5.0' in lines
+    assert 'duracion_count{ruta="a"} 3' in lines
+
+
+def test_failing_collector_does_not_break_render():
+    registry = Metrics(enabled=True)
+
+    def broken():
+        raise RuntimeError('sin datos')
+
+    registry.add_collector(broken)
+    registry.add_collector(lambda: [('proyectos', 'gauge', 'Proyectos', [({'pool': 'x'}, 2)])])
+
+    lines = registry.render().splitlines()
+    assert '# TYPE proyectos gauge' in lines
+    assert 'proyectos{pool="x"} 2' in lines
+
+
+def test_endpoint_disabled_by_default(client):
+    response = client.get('/metrics')
+    assert response.status_code == 404
+    assert response.get_json()['success'] is False
+
+
+@pytest.fixture
+def metrics_client(tmp_path, monkeypatch):
+    """Aplicación creada con el registro global habilitado"""
+    import app as appmod
+
+    monkeypatch.setattr(metrics, 'enabled', True)
+    # Los collectors de esta aplicación no quedan registrados para las demás pruebas
+    monkeypatch.setattr(metrics, '_collectors', [])
+    base = copy_matrices(tmp_path / 'base')
+    application = appmod.create_app({'BASE_PATH': base, 'PROJECTS_DIR': str(tmp_path / 'proyectos'),
+                                     'TESTING': True})
+    yield application.test_client()
+    for project in application.extensions['isoapp']['projects'].loaded():
+        project.close()
+
+
+def test_endpoint_exports_requests_reads_and_caches(metrics_client):
+    assert metrics_client.get('/api/data/nist').status_code == 200
+
+    response = metrics_client.get('/metrics')
+    assert response.status_code == 200
+    assert response.mimetype == 'text/plain'
+    text = response.get_data(as_text=True)
+    assert 'isoapp_request_duration_seconds_count{endpoint="get_csv_data",method="GET",status="200"}' in text
+    assert 'isoapp_matrix_read_seconds_count{matrix="nist"' in text
+    assert 'isoapp_matrix_read_bytes_total{matrix="nist"' in text
+    assert 'isoapp_cache_hits_total{cache="matrices",project="default"}' in text
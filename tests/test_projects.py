@@ -0,0 +1,52 @@
+"""
+Proyectos: rutas por proyecto, memoria estimada y descarte por presupuesto
+"""
+import pytest
+
+from utils.projects import ProjectPool
+
+from conftest import copy_matrices, matrix_version
+
+
+@pytest.fixture
+def pool_root(tmp_path):
+    for name in ('uno', 'dos'):
+        copy_matrices(tmp_path / 'proyectos' / name)
+    return str(tmp_path / 'proyectos')
+
+
+@pytest.mark.parametrize('backend', ['csv', 'sqlite'])
+def test_memory_estimate_counts_stored_matrices(pool_root, project_dir, backend):
+    pool = ProjectPool(pool_root, default_path=project_dir, backend=backend)
+    try:
+        project = pool.get('uno')
+        assert project.processor.backend.footprint() > 0
+        assert project.memory_estimate() > 0
+    finally:
+        for project in pool.loaded():
+            project.close()
+
+
+@pytest.mark.parametrize('backend', ['csv', 'sqlite'])
+def test_memory_budget_evicts_least_recently_used(pool_root, project_dir, backend):
+    pool = ProjectPool(pool_root, default_path=project_dir, backend=backend)
+    try:
+        pool.memory_budget_bytes = pool.get('uno').memory_estimate() + 1
+
+        pool.get('dos')
+
+        assert pool.stats()['cargados'] == ['dos']
+        assert pool.evictions == 1
+    finally:
+        for project in pool.loaded():
+            project.close()
+
+
+def test_project_routes_write_to_their_own_folder(client):
+    base = matrix_version(client)
+    version = matrix_version(client, '/p/demo')
+
+    client.post('/p/demo/api/magerit/update/1', json={'impacto': 2})
+
+    assert matrix_version(client) == base
+    assert matrix_version(client, '/p/demo') == version + 1
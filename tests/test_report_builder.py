@@ -0,0 +1,39 @@
+"""
+Reporte por secciones: unión con pypdf y recuperación del pool de procesos
+"""
+from concurrent.futures.process import BrokenProcessPool
+
+import pytest
+
+from utils import report_builder
+from utils.report_builder import build_report_pdf_parallel, count_pdf_pages
+
+pytest.importorskip('pypdf')
+
+SECTIONS = ['anexo_a', 'cobit']
+
+
+def test_sections_render_in_worker_processes(processor):
+    all_data = processor.get_all_data()
+
+    serial = build_report_pdf_parallel(all_data, SECTIONS, parallel=False)
+    pages = count_pdf_pages(serial)
+    assert pages > 1
+
+    parallel = report_builder._pool.map(report_builder.build_section_pdf, SECTIONS,
+                                        [all_data[s] for s in SECTIONS])
+    assert [count_pdf_pages(p) > 0 for p in parallel] == [True, True]
+
+
+def test_broken_pool_falls_back_to_serial(processor, monkeypatch):
+    def broken(*args):
+        raise BrokenProcessPool('worker terminado')
+
+    monkeypatch.setattr(report_builder.os, 'cpu_count', lambda: 4)
+    monkeypatch.setattr(report_builder._pool, 'map', broken)
+    all_data = processor.get_all_data()
+
+    content = build_report_pdf_parallel(all_data, SECTIONS)
+
+    assert count_pdf_pages(content) == count_pdf_pages(
+        build_report_pdf_parallel(all_data, SECTIONS, parallel=False))
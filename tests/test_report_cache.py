@@ -0,0 +1,44 @@
+"""
+Caché de reportes PDF: la clave depende de las secciones y de la versión de
+los datos, y los PDF se comparten por disco entre workers
+"""
+from utils.report_cache import ReportCache, report_cache_key
+
+
+SECTIONS = ['resumen', 'magerit']
+
+
+def test_key_changes_with_data_version(processor):
+    before = report_cache_key(SECTIONS, processor.get_data_versions())
+    assert report_cache_key(list(reversed(SECTIONS)), processor.get_data_versions()) == before
+
+    processor.update_magerit_row(1, {'impacto': 1})
+
+    after = report_cache_key(SECTIONS, processor.get_data_versions())
+    assert after != before
+    assert report_cache_key(['resumen'], processor.get_data_versions()) != after
+
+
+def test_pdf_is_shared_through_disk(tmp_path):
+    cache = ReportCache(str(tmp_path))
+    cache.put('abc', b'%PDF-1.4 uno')
+
+    other = ReportCache(str(tmp_path))
+
+    assert other.get('abc') == b'%PDF-1.4 uno'
+    assert other.get('def') is None
+    assert (other.stats()['hits'], other.stats()['misses']) == (1, 1)
+
+
+def test_memory_and_disk_limits_evict_least_recently_used(tmp_path):
+    cache = ReportCache(str(tmp_path), max_memory_bytes=20, max_disk_bytes=20)
+    cache.put('a', b'x' * 10)
+    cache.put('b', b'y' * 10)
+    cache.get('a')
+
+    cache.put('c', b'z' * 10)
+
+    assert cache.stats()['memory_entries'] == 2
+    assert cache.stats()['memory_bytes'] == 20
+    assert ReportCache(str(tmp_path)).get('c') == b'z' * 10
+    assert len(list(tmp_path.glob('*.pdf'))) == 2
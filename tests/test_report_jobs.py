@@ -0,0 +1,123 @@
+"""
+Cola de reportes: estado compartido en disco y expiración de trabajos
+"""
+import os
+import threading
+import time
+
+from utils.report_jobs import ReportJobQueue
+
+
+def wait_finished(queue, job_id, timeout=5):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        job = queue.get(job_id)
+        if job['finished']:
+            return job
+        time.sleep(0.01)
+    raise AssertionError('el trabajo no terminó')
+
+
+def wait_idle(queue, timeout=5):
+    deadline = time.time() + timeout
+    while queue._pending and time.time() < deadline:
+        time.sleep(0.01)
+    assert queue._pending == 0
+
+
+def stale(queue, job_id, seconds=120):
+    """Simula un proceso que dejó de renovar el latido hace seconds segundos"""
+    past = time.time() - seconds
+    os.utime(queue._status_path(job_id), (past, past))
+
+
+def test_job_result_is_visible_to_other_queues(tmp_path):
+    queue = ReportJobQueue(str(tmp_path), max_workers=1)
+    job = queue.submit(lambda progress: b'%PDF-1.4', 'reporte.pdf')
+
+    assert wait_finished(queue, job['id'])['status'] == 'done'
+    other = ReportJobQueue(str(tmp_path))
+    with open(other.result_path(job['id']), 'rb') as f:
+        assert f.read() == b'%PDF-1.4'
+
+
+def test_orphaned_job_expires_as_failed(tmp_path):
+    queue = ReportJobQueue(str(tmp_path), timeout=60)
+    job = queue._new_job('reporte.pdf')
+    queue._save(job)
+    stale(queue, job['id'])
+
+    expired = queue.get(job['id'])
+
+    assert expired['status'] == 'failed'
+    assert expired['finished'] is not None
+    assert ReportJobQueue(str(tmp_path)).get(job['id'])['status'] == 'failed'
+
+
+def test_queued_job_with_heartbeat_does_not_expire(tmp_path):
+    queue = ReportJobQueue(str(tmp_path), timeout=60)
+    job = queue._new_job('reporte.pdf')
+    # Esperando detrás de otros trabajos desde hace más de timeout
+    job['created'] = time.time() - 120
+    queue._save(job)
+
+    assert queue.get(job['id'])['status'] == 'queued'
+
+
+def test_job_running_too_long_expires(tmp_path):
+    queue = ReportJobQueue(str(tmp_path), timeout=60)
+    job = queue._new_job('reporte.pdf')
+    job.update(status='running', started=time.time() - 120)
+    queue._save(job)
+
+    assert queue.get(job['id'])['status'] == 'failed'
+
+
+def test_heartbeat_keeps_running_job_alive(tmp_path):
+    queue = ReportJobQueue(str(tmp_path), max_workers=1, timeout=60)
+    queue.heartbeat_seconds = 0.01
+    release = threading.Event()
+    job = queue.submit(lambda progress: release.wait(5) and b'%PDF-1.4', 'reporte.pdf')
+    time.sleep(0.05)
+    stale(queue, job['id'])
+
+    time.sleep(0.1)
+    assert queue._load(job['id'])[1] > time.time() - 60
+    assert queue.get(job['id'])['status'] == 'running'
+    release.set()
+    assert wait_finished(queue, job['id'])['status'] == 'done'
+
+
+def test_worker_does_not_overwrite_expired_job(tmp_path):
+    queue = ReportJobQueue(str(tmp_path), max_workers=1)
+    started, release = threading.Event(), threading.Event()
+
+    def render(progress):
+        started.set()
+        release.wait(5)
+        return b'%PDF-1.4'
+
+    job = queue.submit(render, 'reporte.pdf')
+    started.wait(5)
+    # Otro worker lo da por vencido mientras se genera
+    assert ReportJobQueue(str(tmp_path), timeout=0).get(job['id'])['status'] == 'failed'
+
+    release.set()
+    wait_idle(queue)
+
+    assert queue.get(job['id'])['status'] == 'failed'
+    assert queue.result_path(job['id']) is None
+    assert not os.path.exists(queue._result_path(job['id']))
+
+
+def test_cleanup_removes_expired_orphans_after_ttl(tmp_path):
+    queue = ReportJobQueue(str(tmp_path), ttl=0, timeout=60)
+    job = queue._new_job('reporte.pdf')
+    queue._save(job)
+    stale(queue, job['id'])
+
+    queue.cleanup()
+    time.sleep(0.01)
+    queue.cleanup()
+
+    assert queue.get(job['id']) is None
@@ -0,0 +1,59 @@
+"""
+Cálculo de riesgos: el camino con NumPy, el de Python puro y el cálculo
+de un solo activo deben dar exactamente los mismos valores
+"""
+import itertools
+
+import pytest
+
+from utils import risk
+from utils.magerit_records import MageritRecord
+from utils.risk import calculate_risks_bulk, round_risk
+
+from conftest import NEW_ASSET
+
+
+FRECUENCIAS = [0.1, 0.25, 0.5, 1, 1.5, 2, 3, 4.5]
+IMPACTOS = [0.5, 0.93, 1, 1.75, 2.5, 3.5, 4.1, 5]
+SALVAGUARDAS = [0, 5, 12.5, 33, 50, 75, 85, 92, 100]
+VALUES = list(itertools.product(FRECUENCIAS, IMPACTOS, SALVAGUARDAS))
+
+
+def bulk(values):
+    return calculate_risks_bulk(*zip(*values))
+
+
+def test_round_risk_rounds_half_up_on_the_decimal_value():
+    assert round_risk(0.5 * 0.93) == 0.47
+    assert round_risk(1.005) == 1.01
+    assert round_risk(2.675) == 2.68
+    assert round_risk(5.25) == 5.25
+    assert round_risk(1.7449999) == 1.74
+
+
+def test_bulk_matches_scalar(processor):
+    pytest.importorskip('numpy')
+    result = bulk(VALUES)
+
+    for k, (f, i, s) in enumerate(VALUES):
+        scalar = processor.calculate_magerit_risk(f, i, s)
+        assert result['riesgo_intrinseco'][k] == scalar['riesgo_intrinseco'], (f, i, s)
+        assert result['riesgo_residual'][k] == scalar['riesgo_residual'], (f, i, s)
+
+
+def test_numpy_and_python_paths_match(monkeypatch):
+    pytest.importorskip('numpy')
+    expected = bulk(VALUES)
+
+    monkeypatch.setattr(risk, '_numpy', lambda: None)
+
+    assert bulk(VALUES) == expected
+
+
+def test_edited_row_matches_bulk():
+    record = MageritRecord.create(99, dict(NEW_ASSET, frecuencia=0.5, impacto=0.93,
+                                           valor_salvaguarda_pct=92))
+    result = calculate_risks_bulk([0.5], [0.93], [92])
+
+    assert record.riesgo_intrinseco == result['riesgo_intrinseco'][0] == 0.47
+    assert record.riesgo_residual == result['riesgo_residual'][0]
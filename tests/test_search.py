@@ -0,0 +1,57 @@
+"""
+Búsqueda de texto en las cuatro matrices: sin tildes ni mayúsculas, con
+prefijos, y al día con las altas y ediciones de MAGERIT que avisa el
+CSVProcessor
+"""
+import pytest
+
+from utils.search import SearchIndex
+
+from conftest import NEW_ASSET
+
+
+def test_search_ignores_accents_and_case(processor):
+    index = SearchIndex(processor)
+
+    plain = index.search('gestion')
+    accented = index.search('GESTIÓN')
+
+    assert plain['total'] > 0
+    assert accented['resultados'] == plain['resultados']
+    assert {'cobit', 'nist'} <= {r['matriz'] for r in plain['resultados']}
+
+
+def test_last_term_matches_as_prefix_and_filters_matrices(processor):
+    index = SearchIndex(processor)
+
+    found = index.search('autenticaci', matrices=['nist'])
+
+    assert found['total'] > 0
+    assert {r['matriz'] for r in found['resultados']} == {'nist'}
+    with pytest.raises(ValueError):
+        index.search('riesgo', matrices=['iso9001'])
+
+
+def test_change_listeners_receive_new_rows(processor):
+    calls = []
+    processor.add_change_listener(lambda rows, reset: calls.append((reset, [r[0] for r in rows])))
+
+    processor.update_magerit_row(3, {'impacto': 1})
+
+    assert calls[0][0] is True
+    assert calls[-1] == (False, ['3'])
+
+
+def test_search_index_sees_new_and_edited_rows(processor):
+    index = SearchIndex(processor)
+    assert index.search('pozos')['total'] == 0
+
+    row = processor.add_magerit_asset(NEW_ASSET)
+    found = index.search('pozos')['resultados']
+    assert [(r['matriz'], r['id']) for r in found] == [('magerit', row[0])]
+
+    processor.update_magerit_row(int(row[0]), {'salvaguarda': 'Telemetría blindada'})
+    assert [r['id'] for r in index.search('blindada')['resultados']] == [row[0]]
+
+    processor.update_magerit_row(int(row[0]), {'salvaguarda': 'Monitoreo'})
+    assert index.search('blindada')['total'] == 0
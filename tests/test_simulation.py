@@ -0,0 +1,44 @@
+"""
+Simulación Monte Carlo: límites de tamaño y recuperación del pool de procesos
+"""
+import os
+from concurrent.futures.process import BrokenProcessPool
+
+import pytest
+
+from utils import simulation
+from utils.process_pool import SharedProcessPool
+
+pytest.importorskip('numpy')
+
+
+def test_trials_are_capped_by_assets():
+    assets = 200
+    limit = simulation.MAX_ELEMENTS // assets
+
+    with pytest.raises(ValueError, match=str(limit)):
+        simulation.simulate_portfolio([str(k) for k in range(assets)], [1] * assets, [2] * assets,
+                                      [50] * assets, trials=limit + 1)
+
+
+def test_same_seed_gives_same_result_in_parallel_and_serial(monkeypatch):
+    monkeypatch.setattr(simulation, 'PARALLEL_MIN_ELEMENTS', 0)
+    monkeypatch.setattr(simulation, 'BLOCK_ELEMENTS', 1000)
+    args = (['1', '2', '3'], [1, 1.5, 2], [3.5, 2, 1], [85, 50, 0])
+
+    serial = simulation.simulate_portfolio(*args, trials=2000, seed=7, parallel=False)
+    parallel = simulation.simulate_portfolio(*args, trials=2000, seed=7)
+
+    assert parallel['activos'] == serial['activos']
+    assert parallel['portafolio'] == serial['portafolio']
+
+
+def test_broken_pool_is_recreated():
+    pool = SharedProcessPool(1, 'pruebas')
+    try:
+        with pytest.raises(BrokenProcessPool):
+            pool.map(os._exit, [1])
+        assert pool.restarts == 1
+        assert pool.map(abs, [-1, -2]) == [1, 2]
+    finally:
+        pool.reset()
@@ -0,0 +1,78 @@
+"""
+Estadísticas de riesgo que siguen los cambios de MAGERIT: tras cada
+escritura deben coincidir con las construidas desde cero
+"""
+from utils.csv_processor import CSVProcessor
+from utils.matrix_cache import MatrixCache
+from utils.stats import RiskStats
+
+from conftest import NEW_ASSET
+
+
+def apply_changes(processor):
+    processor.update_magerit_row(1, {'frecuencia': 5, 'impacto': 5})
+    processor.add_magerit_asset(NEW_ASSET)
+    processor.apply_magerit_batch([
+        {'op': 'update', 'asset': 2, 'data': {'valor_salvaguarda_pct': 90}},
+        {'op': 'update', 'asset': 2, 'data': {'impacto': 1}},
+        {'op': 'add', 'data': dict(NEW_ASSET, activo='Modelo CNN', tipo_activo='Software')}
+    ])
+
+
+def heatmap_cell(magerit, frecuencia, impacto):
+    heatmap = magerit['mapa_calor']
+    if frecuencia not in heatmap['frecuencias'] or impacto not in heatmap['impactos']:
+        return 0
+    return heatmap['conteos'][heatmap['frecuencias'].index(frecuencia)][heatmap['impactos'].index(impacto)]
+
+
+def test_risk_stats_match_recount(processor):
+    stats = RiskStats(processor)
+    before = stats.stats()['magerit']['activos']
+
+    apply_changes(processor)
+
+    current = stats.stats()
+    assert current == RiskStats(CSVProcessor(processor.base_path, cache=MatrixCache())).stats()
+    assert current['magerit']['activos'] == before + 2
+    assert current['magerit']['por_tipo']['Software']['activos'] >= 1
+
+
+def test_heatmap_moves_edited_asset(processor):
+    stats = RiskStats(processor)
+    before = stats.stats()['magerit']
+    cells = sum(map(sum, before['mapa_calor']['conteos']))
+    assert cells == before['activos'] - before['sin_valores']
+
+    processor.update_magerit_row(1, {'frecuencia': 5, 'impacto': 5})
+
+    after = stats.stats()['magerit']
+    assert heatmap_cell(after, 5.0, 5.0) == heatmap_cell(before, 5.0, 5.0) + 1
+    assert sum(map(sum, after['mapa_calor']['conteos'])) == cells
+
+
+def test_risk_stats_follow_other_process(processor):
+    stats = RiskStats(processor)
+    other = CSVProcessor(processor.base_path, cache=MatrixCache())
+
+    other.add_magerit_asset(NEW_ASSET)
+
+    assert stats.stats() == RiskStats(other).stats()
+
+
+def test_stats_endpoint_follows_writes(client):
+    first = client.get('/api/stats')
+    assert first.status_code == 200
+    data = first.get_json()['data']
+    assert data['nist']['total'] == sum(data['nist']['por_grupo'].values())
+    assert client.get('/api/stats', headers={'If-None-Match': first.headers['ETag']}).status_code == 304
+
+    assert client.post('/api/magerit/add', json=NEW_ASSET).status_code == 200
+
+    second = client.get('/api/stats')
+    assert second.headers['ETag'] != first.headers['ETag']
+    magerit = second.get_json()['data']['magerit']
+    assert magerit['activos'] == data['magerit']['activos'] + 1
+    previous_type = data['magerit']['por_tipo'].get('Datos', {'activos': 0})
+    assert magerit['por_tipo']['Datos']['activos'] == previous_type['activos'] + 1
+    assert heatmap_cell(magerit, 3.0, 4.0) == heatmap_cell(data['magerit'], 3.0, 4.0) + 1
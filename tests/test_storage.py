@@ -0,0 +1,93 @@
+"""
+Almacenamiento en SQLite: exportación sin pérdida y escrituras por fila
+"""
+from utils.csv_processor import CSVProcessor
+from utils.matrix_cache import MatrixCache
+from utils import storage
+from utils.storage import CSVBackend, SQLiteBackend, copy_matrix
+
+from conftest import NEW_ASSET, asset_row
+
+
+def sqlite_processor(project_dir):
+    return CSVProcessor(project_dir, cache=MatrixCache(), backend='sqlite')
+
+
+def test_import_keeps_rows_and_encoding(project_dir, tmp_path):
+    source = CSVBackend(project_dir, CSVProcessor.CSV_FILES)
+    target = SQLiteBackend(str(tmp_path / 'matrices.db'))
+
+    for csv_type in CSVProcessor.CSV_FILES:
+        copy_matrix(source, target, csv_type)
+        assert target.read_rows(csv_type) == source.read_rows(csv_type)
+        assert target.encoding(csv_type) == source.encoding(csv_type)
+
+
+def test_compaction_only_rewrites_changed_rows(project_dir):
+    processor = sqlite_processor(project_dir)
+    processor.update_magerit_row(2, {'impacto': 1})
+    backend = processor.backend
+    conn = backend._connect()
+    before = conn.total_changes
+
+    processor.compact_magerit()
+
+    # La fila editada y el número de generación
+    assert conn.total_changes - before == 2
+    assert asset_row(sqlite_processor(project_dir), 2) == asset_row(processor, 2)
+
+
+def test_rows_added_and_removed(tmp_path):
+    backend = SQLiteBackend(str(tmp_path / 'matrices.db'))
+    rows = [['meta'], ['Función NIST', 'Control'], ['ID', 'a'], ['PR', 'b']]
+    backend.write_rows('nist', rows)
+    generation = backend.signature('nist')[1]
+
+    backend.write_rows('nist', rows[:2] + [['RS', 'c']])
+
+    assert backend.read_rows('nist') == rows[:2] + [['RS', 'c']]
+    assert backend.signature('nist')[1] == generation + 1
+
+
+def test_rows_are_indexed_only_by_position(tmp_path):
+    backend = SQLiteBackend(str(tmp_path / 'matrices.db'))
+
+    indexes = backend._connect().execute(
+        "SELECT name FROM sqlite_master WHERE type = 'index' AND tbl_name = 'matrix_rows'").fetchall()
+
+    assert [name for (name,) in indexes] == ['sqlite_autoindex_matrix_rows_1']
+
+
+def test_first_open_imports_pending_csv_journal(project_dir):
+    csv = CSVProcessor(project_dir, cache=MatrixCache())
+    csv.update_magerit_row(1, {'impacto': 1})
+
+    processor = sqlite_processor(project_dir)
+
+    assert asset_row(processor, 1) == asset_row(csv, 1)
+    assert processor.journal.path != csv.journal.path
+    assert processor.journal.read()[0] == []
+
+
+def test_migration_does_not_replay_target_journal(project_dir):
+    processor = sqlite_processor(project_dir)
+    row = processor.add_magerit_asset(NEW_ASSET)
+    csv = CSVProcessor(project_dir, cache=MatrixCache())
+    csv.update_magerit_row(1, {'impacto': 1})
+
+    storage.main(['export', '--base-path', project_dir])
+
+    # El alta pendiente de SQLite llega a los CSV una sola vez y la edición
+    # pendiente de los CSV no se vuelve a aplicar sobre la copia
+    fresh = CSVProcessor(project_dir, cache=MatrixCache())
+    data = fresh.get_magerit_data()['data']
+    assert [r[0] for r in data].count(row[0]) == 1
+    assert asset_row(fresh, 1) == asset_row(processor, 1)
+
+
+def test_sqlite_processor_writes(project_dir):
+    processor = sqlite_processor(project_dir)
+    row = processor.add_magerit_asset(NEW_ASSET)
+    processor.compact_magerit()
+
+    assert asset_row(sqlite_processor(project_dir), row[0]) == row
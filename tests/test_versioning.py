@@ -0,0 +1,121 @@
+"""
+Escrituras concurrentes de MAGERIT: bloqueo entre procesos y control de
+versiones (If-Match, 412)
+"""
+import threading
+import time
+
+import pytest
+
+from utils.csv_processor import VersionConflictError
+from utils.locking import FileLock
+
+from conftest import asset_row, matrix_version, reopen
+
+
+
+def test_stale_version_is_rejected(processor):
+    version = processor.get_magerit_version()
+    processor.update_magerit_row(1, {'frecuencia': 2}, expected_version=version)
+
+    with pytest.raises(VersionConflictError) as error:
+        processor.update_magerit_row(1, {'frecuencia': 3}, expected_version=version)
+
+    assert error.value.current == version + 1
+    assert asset_row(processor, 1)[5] == '2'
+
+
+def test_writes_from_two_processors_are_serialized(processor):
+    other = reopen(processor)
+    version = processor.get_magerit_version()
+
+    def write(target, asset):
+        for value in range(10):
+            target.update_magerit_row(asset, {'frecuencia': 1 + value % 4})
+
+    threads = [threading.Thread(target=write, args=(processor, 1)),
+               threading.Thread(target=write, args=(other, 2))]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    records, _ = processor.journal.read()
+    versions = [r['v'] for r in records if r['op'] != 'base']
+    assert versions == list(range(version + 1, version + 21))
+    assert processor.get_magerit_version() == other.get_magerit_version() == version + 20
+
+
+def test_file_lock_is_reentrant_and_exclusive(tmp_path):
+    path = str(tmp_path / 'escritura.lock')
+    first, second = FileLock(path), FileLock(path)
+    acquired = threading.Event()
+
+    def take_second():
+        with second:
+            acquired.set()
+
+    with first:
+        with first:
+            thread = threading.Thread(target=take_second)
+            thread.start()
+            time.sleep(0.1)
+            assert not acquired.is_set()
+    thread.join(2)
+    assert acquired.is_set()
+
+
+def test_update_with_current_version(client):
+    version = matrix_version(client)
+
+    response = client.post('/api/magerit/update/1', json={'impacto': 2},
+                           headers={'If-Match': f'"{version}"'})
+
+    assert response.status_code == 200
+    assert response.get_json()['version'] == version + 1
+    assert response.headers['X-Matrix-Version'] == str(version + 1)
+
+
+def test_update_with_stale_version_returns_412(client):
+    version = matrix_version(client)
+    client.post('/api/magerit/update/1', json={'impacto': 2})
+
+    response = client.post('/api/magerit/update/1', json={'impacto': 4},
+                           headers={'If-Match': f'"{version}"'})
+
+    assert response.status_code == 412
+    body = response.get_json()
+    assert body['success'] is False
+    assert body['version'] == version + 1
+
+
+def test_get_etag_round_trips_as_if_match(client):
+    response = client.get('/api/data/magerit')
+    etag = response.headers['ETag']
+    assert etag.startswith(f'"{response.headers["X-Matrix-Version"]}.')
+
+    updated = client.post('/api/magerit/update/1', json={'impacto': 2}, headers={'If-Match': etag})
+    assert updated.status_code == 200
+
+    stale = client.post('/api/magerit/update/1', json={'impacto': 3}, headers={'If-Match': etag})
+    assert stale.status_code == 412
+
+
+def test_if_match_lists_and_weak_tags(client):
+    version = matrix_version(client)
+
+    response = client.post('/api/magerit/update/1', json={'impacto': 2},
+                           headers={'If-Match': f'"otro", W/"{version}"'})
+    assert response.status_code == 200
+
+    response = client.post('/api/magerit/update/1', json={'impacto': 2},
+                           headers={'If-Match': '*'})
+    assert response.status_code == 200
+
+
+def test_unparseable_if_match_returns_412(client):
+    for value in ('"3f2a9c"', 'W/"abc"', 'basura', '"-1", "2x"'):
+        response = client.post('/api/magerit/update/1', json={'impacto': 2},
+                               headers={'If-Match': value})
+        assert response.status_code == 412, value
+        assert response.get_json()['success'] is False
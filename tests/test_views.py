@@ -0,0 +1,46 @@
+"""
+Vistas HTML de los marcos: se renderizan una vez por versión de los datos
+y vuelven a renderizarse después de una escritura
+"""
+from contextlib import contextmanager
+
+from flask import template_rendered
+
+
+@contextmanager
+def rendered(application):
+    templates = []
+
+    def record(sender, template, context, **extra):
+        templates.append(template.name)
+
+    template_rendered.connect(record, application)
+    try:
+        yield templates
+    finally:
+        template_rendered.disconnect(record, application)
+
+
+def test_view_is_rendered_once_per_version(client, application):
+    with rendered(application) as templates:
+        first = client.get('/nist')
+        second = client.get('/nist')
+        again = client.get('/nist', headers={'If-None-Match': first.headers['ETag']})
+
+    assert templates == ['nist.html']
+    assert second.data == first.data
+    assert again.status_code == 304
+
+
+def test_write_renders_magerit_again(client, application):
+    first = client.get('/magerit')
+    assert b'Telemetr\xc3\xada blindada' not in first.data
+
+    client.post('/api/magerit/update/1', json={'salvaguarda': 'Telemetría blindada'})
+    with rendered(application) as templates:
+        after = client.get('/magerit', headers={'If-None-Match': first.headers['ETag']})
+
+    assert templates == ['magerit.html']
+    assert after.status_code == 200
+    assert after.headers['ETag'] != first.headers['ETag']
+    assert 'Telemetría blindada' in after.get_data(as_text=True)
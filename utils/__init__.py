@@ -1,6 +1,11 @@
 """
 Módulo de utilidades para ISOapp
 """
-from .csv_processor import CSVProcessor
+from .csv_processor import CSVProcessor, VersionConflictError
+from .matrix_cache import MatrixCache, matrix_cache
+from .storage import StorageBackend, CSVBackend, SQLiteBackend
+from .projects import Project, ProjectPool, ProjectNotFoundError
 
-__all__ = ['CSVProcessor']
+__all__ = ['CSVProcessor', 'VersionConflictError', 'MatrixCache', 'matrix_cache',
+           'StorageBackend', 'CSVBackend', 'SQLiteBackend',
+           'Project', 'ProjectPool', 'ProjectNotFoundError']
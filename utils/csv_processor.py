@@ -1,56 +1,651 @@
 """
 Módulo para procesar y calcular datos de los CSV de seguridad
 """
-import csv
+import hashlib
+import logging
 import os
-from typing import List, Dict, Any
+import threading
+import time
+from typing import Callable, List, Dict, Any, Hashable, Iterator, Optional, Tuple, Union
+
+from .history import MageritHistory, apply_delta
+from .journal import ChangeJournal
+from .locking import FileLock
+from .magerit_records import MageritColumns, MageritRecord, intern_row
+from .matrix_cache import MatrixCache, matrix_cache
+from .matrix_query import MatrixIndex, iter_matrix, query_matrix
+from .metrics import metrics
+from .risk import calculate_column_risks, calculate_risks_bulk, round_risk
+from .storage import HEADER_MARKERS, CSVBackend, SQLiteBackend, StorageBackend, copy_matrix
+
+
+logger = logging.getLogger(__name__)
+
+# Variantes del encabezado de MAGERIT (los CSV exportados usan 'º' en latin-1)
+MAGERIT_HEADER_MARKERS = HEADER_MARKERS['magerit']
+
+# Campos obligatorios para dar de alta un activo de MAGERIT
+MAGERIT_REQUIRED_FIELDS = ['tipo_activo', 'activo', 'amenaza', 'valor_economico',
+                           'frecuencia', 'impacto', 'salvaguarda', 'valor_salvaguarda_pct']
+
+
+class VersionConflictError(ValueError):
+    """
+    La versión esperada por el cliente no coincide con la versión actual.
+    expected es la versión recibida o, si no se pudo interpretar, el
+    valor de If-Match tal como llegó.
+    """
+    
+    def __init__(self, expected: Union[int, str], current: int):
+        super().__init__(
+            f"La matriz fue modificada por otro usuario (versión esperada {expected}, actual {current})"
+        )
+        self.expected = expected
+        self.current = current
+
+
+class MageritIndex:
+    """
+    Índice de las filas de MAGERIT para una versión del archivo.
+    Permite ubicar un activo, el siguiente número libre y el punto de
+    inserción sin recorrer todas las filas.
+    """
+    
+    def __init__(self, header_row_idx: int, positions: Dict[str, int],
+                 max_asset: int, end_of_data: int):
+        self.header_row_idx = header_row_idx
+        self.positions = positions
+        self.max_asset = max_asset
+        self.end_of_data = end_of_data
+        self.last_position = max(positions.values(), default=header_row_idx)
+    
+    @classmethod
+    def build(cls, rows: List[List[str]]) -> Optional['MageritIndex']:
+        """Construye el índice recorriendo las filas una sola vez"""
+        header_row_idx = None
+        for idx, row in enumerate(rows):
+            if len(row) > 0 and row[0] in MAGERIT_HEADER_MARKERS:
+                header_row_idx = idx
+                break
+        
+        if header_row_idx is None:
+            return None
+        
+        positions = {}
+        max_asset = 0
+        data_start_idx = header_row_idx + 1
+        end_of_data = None
+        
+        for idx in range(data_start_idx, len(rows)):
+            row = rows[idx]
+            key = row[0].strip() if len(row) > 0 and row[0] else ''
+            if not key:
+                # La primera fila vacía marca el fin del bloque de datos
+                if end_of_data is None:
+                    end_of_data = idx
+                continue
+            positions.setdefault(key, idx)
+            if key.isdigit():
+                max_asset = max(max_asset, int(key))
+        
+        if end_of_data is None:
+            end_of_data = len(rows)
+        
+        return cls(header_row_idx, positions, max_asset, end_of_data)
+    
+    def find(self, asset_num: Any) -> Optional[int]:
+        """Retorna la posición de la fila del activo o None"""
+        return self.positions.get(str(asset_num).strip())
+    
+    def next_asset_number(self) -> int:
+        """Retorna el número que le corresponde a un activo nuevo"""
+        return self.max_asset + 1
+    
+    def register_insert(self, asset_num: Any, insert_idx: int):
+        """Actualiza el índice tras insertar una fila en insert_idx"""
+        key = str(asset_num).strip()
+        # Solo las filas posteriores a un hueco se desplazan (caso poco común)
+        if insert_idx <= self.last_position:
+            for other, pos in self.positions.items():
+                if pos >= insert_idx:
+                    self.positions[other] = pos + 1
+            self.last_position += 1
+        
+        self.positions.setdefault(key, insert_idx)
+        self.last_position = max(self.last_position, insert_idx)
+        if key.isdigit():
+            self.max_asset = max(self.max_asset, int(key))
+        self.end_of_data = insert_idx + 1
+
+
+class MageritState:
+    """
+    Filas de MAGERIT en memoria: el CSV base más los registros del diario
+    de cambios aplicados encima
+    """
+    
+    def __init__(self, rows: List[List[str]], base_signature: Any):
+        # Los textos repetidos de las filas se comparten (ver intern_row)
+        self.rows = [intern_row(row) for row in rows]
+        self.index = MageritIndex.build(self.rows)
+        self._columns: Optional[MageritColumns] = None
+        self.base_signature = base_signature
+        self.journal_inode = None
+        self.journal_offset = 0
+        # Registros del diario que aún no se incorporaron al CSV
+        self.pending = 0
+        # Contador de versión: aumenta con cada cambio registrado
+        self.version = 0
+    
+    @property
+    def columns(self) -> MageritColumns:
+        """
+        Valores numéricos de las filas, interpretados la primera vez que se
+        necesitan y mantenidos con cada registro aplicado
+        """
+        if self._columns is None:
+            if self.index is None:
+                raise ValueError("No se encontraron los encabezados en MAGERIT")
+            self._columns = MageritColumns(self.rows, self.index.header_row_idx + 1)
+        return self._columns
+    
+    def record(self, position: int) -> MageritRecord:
+        """Activo de la fila de position, sin volver a interpretar sus textos"""
+        return self.columns.record(position, self.rows[position])
+    
+    def apply(self, record: Dict[str, Any], parsed: Optional[MageritRecord] = None):
+        """
+        Aplica un registro del diario. Es idempotente: un activo existente se
+        reemplaza y uno nuevo se inserta al final del bloque de datos.
+        parsed son los valores ya calculados de la fila (si no, se interpretan).
+        """
+        self.version = record.get('v', self.version)
+        if record.get('op') == 'base':
+            # Marca de compactación: solo fija la versión del CSV base
+            return
+        
+        if self.index is None:
+            raise ValueError("No se encontraron los encabezados en MAGERIT")
+        
+        row = intern_row(list(record['row']))
+        target_row_idx = self.index.find(record['asset'])
+        
+        if target_row_idx is not None:
+            self.rows[target_row_idx] = row
+            if self._columns is not None:
+                self._columns.set(target_row_idx, row, parsed)
+        else:
+            insert_idx = self.index.end_of_data
+            self.rows.insert(insert_idx, row)
+            self.index.register_insert(record['asset'], insert_idx)
+            if self._columns is not None:
+                self._columns.insert(insert_idx, row, parsed)
 
 
 class CSVProcessor:
     """Clase para manejar operaciones con los CSV"""
     
-    def __init__(self, base_path: str = '.'):
+    # Registros en el diario que disparan una compactación del CSV
+    COMPACTION_THRESHOLD = 500
+    
+    # Archivos CSV de cada matriz y base SQLite por defecto
+    CSV_FILES = {
+        'magerit': 'Matiz(MAGERIT).csv',
+        'anexo_a': 'Matiz(Anexo A).csv',
+        'cobit': 'Matiz(COBIT).csv',
+        'nist': 'Matiz(NIST).csv'
+    }
+    SQLITE_FILE = 'matrices.db'
+    
+    def __init__(self, base_path: str = '.', cache: Optional[MatrixCache] = None,
+                 compaction_threshold: Optional[int] = None,
+                 backend: Optional[Any] = None):
+        """
+        Args:
+            base_path: Carpeta de los CSV (y de .isoapp/)
+            cache: Caché de matrices (por defecto la compartida del proceso)
+            compaction_threshold: Cambios de MAGERIT que disparan una compactación
+            backend: Almacenamiento: 'csv' (por defecto), 'sqlite' (base
+                <base_path>/matrices.db, que se crea importando los CSV) o
+                una instancia de utils.storage.StorageBackend
+        """
         self.base_path = base_path
-        self.csv_files = {
-            'magerit': 'Matiz(MAGERIT).csv',
-            'anexo_a': 'Matiz(Anexo A).csv',
-            'cobit': 'Matiz(COBIT).csv',
-            'nist': 'Matiz(NIST).csv'
-        }
+        self.csv_files = dict(self.CSV_FILES)
+        self.cache = cache if cache is not None else matrix_cache
+        
+        if backend is None or backend == 'csv':
+            backend = CSVBackend(base_path, self.csv_files)
+        elif backend == 'sqlite':
+            backend = SQLiteBackend(os.path.join(base_path, self.SQLITE_FILE))
+            self._import_missing(backend)
+        elif not isinstance(backend, StorageBackend):
+            raise ValueError(f"Almacenamiento no válido: {backend}")
+        self.backend: StorageBackend = backend
+        
+        self.state_dir = os.path.join(base_path, '.isoapp')
+        # Diario, historial y bloqueo de MAGERIT son de cada almacenamiento: un
+        # diario pendiente de los CSV no debe aplicarse sobre la base SQLite
+        self.magerit_dir = (self.state_dir if backend.name == 'csv'
+                            else os.path.join(self.state_dir, backend.name))
+        # Diario de cambios de MAGERIT y estado en memoria construido a partir de él
+        self.journal = ChangeJournal(
+            os.path.join(self.magerit_dir, self.csv_files['magerit'] + '.journal')
+        )
+        self.compaction_threshold = compaction_threshold or self.COMPACTION_THRESHOLD
+        # Deltas y puntos de control de cada escritura de MAGERIT (el diario se vacía al compactar)
+        self.history = MageritHistory(os.path.join(self.magerit_dir, 'history'))
+        self._magerit_state: Optional[MageritState] = None
+        # Los lectores solo toman _state_lock (en proceso) y solo si la caché falla;
+        # los escritores toman primero _write_lock (entre procesos) y luego _state_lock
+        self._state_lock = threading.RLock()
+        self._write_lock = FileLock(
+            os.path.join(self.magerit_dir, self.csv_files['magerit'] + '.lock')
+        )
+        # Versión producida por la última escritura de cada hilo
+        self._local = threading.local()
+        self._compaction_event = threading.Event()
+        self._compactor: Optional[threading.Thread] = None
+        self._compactor_stop = threading.Event()
+        # Funciones notificadas con cada cambio aplicado a MAGERIT
+        self._change_listeners: List[Callable[[List[List[str]], bool], None]] = []
     
-    def read_csv(self, csv_type: str, encoding: str = 'utf-8-sig') -> List[List[str]]:
-        """Lee un archivo CSV y retorna todas las filas"""
-        file_path = os.path.join(self.base_path, self.csv_files[csv_type])
+    def _import_missing(self, backend: StorageBackend):
+        """
+        Copia a un almacenamiento nuevo las matrices que aún no tiene desde
+        los CSV (con los cambios pendientes del diario de MAGERIT de los CSV
+        ya incorporados)
+        """
+        source = CSVBackend(self.base_path, self.csv_files)
+        missing = [csv_type for csv_type in self.csv_files
+                   if backend.signature(csv_type) is None and source.signature(csv_type) is not None]
+        if 'magerit' in missing:
+            CSVProcessor(self.base_path, cache=self.cache, backend=source).compact_magerit()
+        for csv_type in missing:
+            copy_matrix(source, backend, csv_type)
+    
+    def get_file_path(self, csv_type: str) -> str:
+        """Retorna la ruta del archivo CSV de una matriz"""
+        return os.path.join(self.base_path, self.csv_files[csv_type])
+    
+    def _file_signature(self, csv_type: str) -> Optional[Hashable]:
+        """Retorna la firma de la versión almacenada de una matriz o None si no existe"""
+        return self.backend.signature(csv_type)
+    
+    def get_signature(self, csv_type: str) -> Optional[Tuple]:
+        """
+        Retorna la firma de versión de una matriz. Para MAGERIT incluye
+        también el diario de cambios pendientes de compactar.
+        """
+        signature = self._file_signature(csv_type)
+        if csv_type == 'magerit':
+            return (signature, self.journal.signature())
+        return signature
+    
+    def get_data_version(self, csv_type: str) -> str:
+        """
+        Retorna un identificador corto de la versión de los datos de una
+        matriz, apto para claves de caché y ETags
+        """
+        return hashlib.sha1(repr(self.get_signature(csv_type)).encode()).hexdigest()[:16]
+    
+    def get_data_versions(self) -> Dict[str, str]:
+        """Retorna la versión de datos de las 4 matrices"""
+        return {csv_type: self.get_data_version(csv_type) for csv_type in self.csv_files}
+    
+    def read_csv(self, csv_type: str) -> List[List[str]]:
+        """
+        Lee una matriz y retorna todas las filas.
+        Para MAGERIT son las filas del almacenamiento base, sin el diario de cambios.
+        """
+        if not metrics.enabled:
+            return self.backend.read_rows(csv_type)
+        labels = (csv_type, self.backend.name)
+        with metrics.timer('isoapp_matrix_read_seconds', labels):
+            rows = self.backend.read_rows(csv_type)
+        metrics.inc('isoapp_matrix_read_bytes_total', self.backend.size(csv_type), labels)
+        return rows
+    
+    def _write_rows(self, csv_type: str, rows: List[List[str]], encoding: str):
+        """Escribe la matriz completa en el almacenamiento (midiendo tiempo y bytes)"""
+        if not metrics.enabled:
+            self.backend.write_rows(csv_type, rows, encoding)
+            return
+        labels = (csv_type, self.backend.name)
+        with metrics.timer('isoapp_matrix_write_seconds', labels):
+            self.backend.write_rows(csv_type, rows, encoding)
+        metrics.inc('isoapp_matrix_write_bytes_total', self.backend.size(csv_type), labels)
+    
+    def write_csv(self, csv_type: str, data: List[List[str]], encoding: str = 'utf-8-sig'):
+        """
+        Reemplaza atómicamente todas las filas de una matriz (en CSV, archivo
+        temporal y renombrado). Para MAGERIT reemplaza también el diario de cambios.
+        """
+        if csv_type == 'magerit':
+            with self._write_lock, self._state_lock:
+                state = self._refresh_magerit_state()
+                version, now = state.version + 1, time.time()
+                self._write_rows(csv_type, data, encoding)
+                self.journal.reset([{'op': 'base', 'v': version, 'ts': now}])
+                self._record_replace(state, data, version, now)
+                self._magerit_state = None
+        else:
+            self._write_rows(csv_type, data, encoding)
+        
+        # Las versiones cacheadas de esta matriz ya no son válidas
+        self.cache.invalidate(self.backend.location(csv_type))
+    
+    def get_cache_stats(self) -> Dict[str, Any]:
+        """Retorna los contadores de la caché de matrices"""
+        return self.cache.stats()
+    
+    def _get_structured(self, csv_type: str, parser) -> Dict[str, Any]:
+        """
+        Retorna la matriz estructurada desde la caché o la procesa si el
+        archivo cambió. El resultado es compartido: no debe modificarse.
+        """
+        location = self.backend.location(csv_type)
+        signature = self.get_signature(csv_type)
+        
+        cached = self.cache.get(location, signature)
+        if cached is not None:
+            return cached
         
+        result = parser(self._load_rows(csv_type))
+        self.cache.put(location, signature, result)
+        return result
+    
+    def _load_rows(self, csv_type: str) -> List[List[str]]:
+        """Retorna las filas vigentes de una matriz (MAGERIT con el diario aplicado)"""
+        if csv_type == 'magerit':
+            with self._state_lock:
+                return list(self._refresh_magerit_state().rows)
+        return self.read_csv(csv_type)
+    
+    def _refresh_magerit_state(self) -> MageritState:
+        """
+        Sincroniza el estado en memoria de MAGERIT con el disco: recarga el
+        CSV base si cambió y aplica solo los registros nuevos del diario.
+        Debe llamarse con _state_lock tomado.
+        """
+        base_signature = self._file_signature('magerit')
+        journal_signature = self.journal.signature()
+        state = self._magerit_state
+        
+        if (state is None or state.base_signature != base_signature
+                or (journal_signature is None and state.journal_offset > 0)
+                or (journal_signature is not None and state.journal_inode is not None
+                    and journal_signature[0] != state.journal_inode)
+                or (journal_signature is not None and journal_signature[1] < state.journal_offset)):
+            state = MageritState(self.read_csv('magerit'), base_signature)
+            self._magerit_state = state
+            reloaded = True
+        else:
+            reloaded = False
+        
+        records = []
+        if journal_signature is not None and journal_signature[1] > state.journal_offset:
+            records, state.journal_offset = self.journal.read(state.journal_offset)
+            state.journal_inode = journal_signature[0]
+            for record in records:
+                state.apply(record)
+            state.pending += sum(1 for r in records if r.get('op') != 'base')
+        
+        if reloaded:
+            self._notify_change(self._parse_magerit(state.rows)['data'], reset=True)
+        elif records:
+            self._notify_change([r['row'] for r in records if r.get('op') != 'base'])
+        return state
+    
+    def add_change_listener(self, listener: Callable[[List[List[str]], bool], None]):
+        """
+        Registra una función que recibe las filas de MAGERIT que cambiaron
+        (altas y actualizaciones, propias o de otros procesos) y un indicador
+        reset. Con reset=True las filas son la matriz completa y reemplazan
+        a todo lo anterior; la función se llama una vez así al registrarse.
+        Se ejecuta con el estado bloqueado, por lo que debe ser rápida.
+        """
+        with self._state_lock:
+            self._change_listeners.append(listener)
+            state = self._refresh_magerit_state()
+            listener(self._parse_magerit(state.rows)['data'], True)
+    
+    def _notify_change(self, rows: List[List[str]], reset: bool = False):
+        """Avisa a los listeners de un cambio en MAGERIT (con _state_lock tomado)"""
+        if not rows and not reset:
+            return
+        for listener in self._change_listeners:
+            try:
+                listener(rows, reset)
+            except Exception as e:
+                logger.exception("Error al notificar un cambio de MAGERIT: %s", e)
+    
+    def get_magerit_version(self) -> int:
+        """Retorna la versión actual de la matriz MAGERIT"""
+        with self._state_lock:
+            return self._refresh_magerit_state().version
+    
+    def get_last_write_version(self) -> Optional[int]:
+        """
+        Retorna la versión que produjo la última escritura hecha desde el
+        hilo actual (no incluye cambios posteriores de otros escritores)
+        """
+        return getattr(self._local, 'version', None)
+    
+    def _check_version(self, state: MageritState, expected_version: Optional[int]):
+        """Lanza VersionConflictError si el cliente editó sobre una versión vieja"""
+        if expected_version is not None and int(expected_version) != state.version:
+            raise VersionConflictError(int(expected_version), state.version)
+    
+    def _commit_magerit(self, records: List[Dict[str, Any]],
+                        parsed: Optional[List[MageritRecord]] = None):
+        """
+        Anexa los registros al diario y los aplica al estado en memoria.
+        parsed son los activos de cada registro, con sus valores numéricos.
+        Debe llamarse con _write_lock y _state_lock tomados y el estado
+        recién sincronizado.
+        """
+        now = time.time()
+        state = self._magerit_state
+        version = state.version
+        for record in records:
+            version += 1
+            record['v'] = version
+            record.setdefault('ts', now)
+        previous = self._previous_rows(state, records)
+        self._start_history(state, now)
+        
+        start, end = self.journal.append(records)
+        self._local.version = version
+        # Antes de notificar: quien sigue el historial (ver utils.live) ya encuentra los deltas
+        self._record_history(records, previous)
+        
+        if state.journal_offset == start:
+            for position, record in enumerate(records):
+                state.apply(record, parsed[position] if parsed else None)
+            state.journal_offset = end
+            state.journal_inode = self.journal.signature()[0]
+            state.pending += len(records)
+            self._notify_change([record['row'] for record in records])
+        else:
+            # Otro proceso escribió en medio: se relee el diario en orden
+            self._refresh_magerit_state()
+        self._checkpoint_history(records[-1]['ts'])
+        
+        if self._magerit_state.pending >= self.compaction_threshold:
+            if self._compactor is not None and self._compactor.is_alive():
+                self._compaction_event.set()
+            else:
+                self.compact_magerit()
+    
+    def _previous_rows(self, state: MageritState,
+                       records: List[Dict[str, Any]]) -> Dict[str, Optional[List[str]]]:
+        """Fila vigente (o None) de cada activo de los registros, antes de aplicarlos"""
+        previous = {}
+        for record in records:
+            asset = str(record['asset']).strip()
+            if asset not in previous:
+                position = state.index.find(asset)
+                previous[asset] = state.rows[position] if position is not None else None
+        return previous
+    
+    def _record_history(self, records: List[Dict[str, Any]],
+                        previous: Dict[str, Optional[List[str]]]):
+        """
+        Guarda los deltas de una escritura en el historial. El cambio ya está
+        en el diario: un error aquí se registra pero no anula la escritura.
+        """
         try:
-            with open(file_path, 'r', encoding=encoding) as f:
-                reader = csv.reader(f)
-                return list(reader)
-        except UnicodeDecodeError:
-            # Intentar con latin-1 si utf-8 falla
-            with open(file_path, 'r', encoding='latin-1') as f:
-                reader = csv.reader(f)
-                return list(reader)
+            self.history.append(records, previous)
+        except Exception as e:
+            metrics.inc('isoapp_history_errors_total')
+            logger.exception("Error al guardar el historial de MAGERIT: %s", e)
     
-    def write_csv(self, csv_type: str, data: List[List[str]], encoding: str = 'utf-8-sig'):
-        """Escribe datos en un archivo CSV"""
-        file_path = os.path.join(self.base_path, self.csv_files[csv_type])
+    def _checkpoint_history(self, ts: float):
+        """Escribe un punto de control del historial con el estado actual si corresponde"""
+        try:
+            if self.history.needs_checkpoint():
+                state = self._magerit_state
+                self.history.checkpoint(state.rows, state.version, ts)
+        except Exception as e:
+            metrics.inc('isoapp_history_errors_total')
+            logger.exception("Error al guardar el historial de MAGERIT: %s", e)
+    
+    def _start_history(self, state: MageritState, ts: float):
+        """Punto de control inicial del historial: la matriz antes de la primera escritura"""
+        try:
+            if self.history.is_empty():
+                self.history.checkpoint(state.rows, state.version, ts)
+        except Exception as e:
+            metrics.inc('isoapp_history_errors_total')
+            logger.exception("Error al iniciar el historial de MAGERIT: %s", e)
+    
+    def _record_replace(self, state: MageritState, rows: List[List[str]], version: int, ts: float):
+        """
+        Historial de un reemplazo completo de MAGERIT (write_csv): deltas de
+        los activos modificados o agregados si con ellos se llega a las filas
+        nuevas, o un punto de control si cambió otra cosa (activos quitados,
+        encabezados)
+        """
+        self._start_history(state, ts)
+        try:
+            replayed = MageritState(list(state.rows), None)
+            new_index = MageritIndex.build(rows)
+            records = []
+            if replayed.index is not None and new_index is not None:
+                for asset, position in new_index.positions.items():
+                    current = replayed.index.find(asset)
+                    if current is None or replayed.rows[current] != rows[position]:
+                        op = 'add' if current is None else 'update'
+                        records.append({'op': op, 'asset': asset, 'row': rows[position], 'v': version, 'ts': ts})
+                for record in records:
+                    replayed.apply(record)
+            if replayed.index is not None and replayed.rows == rows:
+                if records:
+                    self.history.append(records, self._previous_rows(state, records))
+            else:
+                self.history.checkpoint(rows, version, ts, replace=True)
+        except Exception as e:
+            metrics.inc('isoapp_history_errors_total')
+            logger.exception("Error al guardar el historial de MAGERIT: %s", e)
+    
+    def get_magerit_at(self, ts: float) -> Dict[str, Any]:
+        """
+        MAGERIT como estaba en un instante, reconstruida desde el punto de
+        control anterior con los deltas que le siguen
         
-        with open(file_path, 'w', encoding=encoding, newline='') as f:
-            writer = csv.writer(f)
-            writer.writerows(data)
+        Returns:
+            Dict como get_magerit_data más version y ts (de la última escritura
+            anterior o igual al instante)
+        
+        Raises:
+            ValueError: Si el instante es anterior al inicio del historial
+        """
+        checkpoint = self.history.checkpoint_at(ts)
+        state = MageritState(self.history.load_checkpoint(checkpoint), None)
+        state.version, last_ts = checkpoint['v'], checkpoint['ts']
+        for delta in self.history.iter_deltas(checkpoint['offset']):
+            if delta['ts'] > ts or delta['op'] == 'replace':
+                break
+            position = state.index.find(delta['asset']) if state.index is not None else None
+            row = apply_delta(state.rows[position] if position is not None else None, delta)
+            state.apply({'op': delta['op'], 'asset': delta['asset'], 'row': row, 'v': delta['v']})
+            last_ts = delta['ts']
+        
+        result = dict(self._parse_magerit(state.rows))
+        result['version'] = state.version
+        result['ts'] = last_ts
+        return result
+    
+    def get_magerit_trajectory(self, asset: Any, since: Optional[float] = None,
+                               until: Optional[float] = None) -> List[Dict[str, Any]]:
+        """Evolución del riesgo de un activo (ver MageritHistory.trajectory)"""
+        return self.history.trajectory(asset, since, until)
+    
+    def compact_magerit(self) -> bool:
+        """
+        Incorpora el diario de cambios al CSV de MAGERIT (escritura atómica)
+        y lo vacía. Retorna True si había cambios pendientes.
+        """
+        with self._write_lock, self._state_lock:
+            state = self._refresh_magerit_state()
+            if state.pending == 0:
+                return False
+            
+            # Primero el CSV y luego el diario: si el proceso muere en medio,
+            # reaplicar el diario viejo sobre el CSV nuevo es idempotente
+            self._write_rows('magerit', state.rows, 'utf-8-sig')
+            self.journal.reset([{'op': 'base', 'v': state.version, 'ts': time.time()}])
+            
+            state.base_signature = self._file_signature('magerit')
+            state.journal_inode = self.journal.signature()[0]
+            state.journal_offset = 0
+            state.pending = 0
+            return True
+    
+    def start_compaction_worker(self, interval: float = 30.0):
+        """Inicia un hilo que compacta MAGERIT periódicamente o al superar el umbral"""
+        if self._compactor is not None and self._compactor.is_alive():
+            return
+        
+        stop = self._compactor_stop = threading.Event()
+        
+        def run():
+            while True:
+                self._compaction_event.wait(interval)
+                self._compaction_event.clear()
+                if stop.is_set():
+                    return
+                try:
+                    self.compact_magerit()
+                except Exception as e:
+                    logger.exception("Error al compactar MAGERIT: %s", e)
+        
+        self._compactor = threading.Thread(target=run, name='magerit-compactor', daemon=True)
+        self._compactor.start()
+    
+    def stop_compaction_worker(self, timeout: float = 5.0):
+        """Detiene el hilo de compactación (si está corriendo)"""
+        compactor = self._compactor
+        if compactor is None:
+            return
+        self._compactor_stop.set()
+        self._compaction_event.set()
+        compactor.join(timeout)
+        self._compactor = None
     
     def get_magerit_data(self) -> Dict[str, Any]:
         """
         Obtiene y procesa los datos de MAGERIT
         Retorna información estructurada con los activos y sus riesgos
         """
-        rows = self.read_csv('magerit')
-        
+        return self._get_structured('magerit', self._parse_magerit)
+    
+    def _parse_magerit(self, rows: List[List[str]]) -> Dict[str, Any]:
+        """Estructura las filas crudas de MAGERIT"""
         # Buscar la fila de encabezados
         header_row_idx = None
         for idx, row in enumerate(rows):
-            if len(row) > 0 and row[0] == 'N° Activos':
+            if len(row) > 0 and row[0] in MAGERIT_HEADER_MARKERS:
                 header_row_idx = idx
                 break
         
@@ -89,83 +684,104 @@ class CSVProcessor:
         riesgo_residual = riesgo_intrinseco - valor_salvaguarda
         
         return {
-            'riesgo_intrinseco': round(riesgo_intrinseco, 2),
-            'riesgo_residual': round(riesgo_residual, 2)
+            'riesgo_intrinseco': round_risk(riesgo_intrinseco),
+            'riesgo_residual': round_risk(riesgo_residual)
         }
     
-    def update_magerit_row(self, row_index: int, updated_data: Dict[str, Any]):
+    def calculate_magerit_risk_bulk(self, frecuencias: List[float], impactos: List[float],
+                                    salvaguardas_pct: List[float]) -> Dict[str, List[Any]]:
+        """
+        Calcula los riesgos de muchos activos en una sola pasada
+        
+        Args:
+            frecuencias: Valores de frecuencia
+            impactos: Valores de impacto
+            salvaguardas_pct: Porcentajes de efectividad de salvaguarda (0-100)
+        
+        Returns:
+            Dict con las listas riesgo_intrinseco, riesgo_residual y clasificacion
+        """
+        return calculate_risks_bulk(frecuencias, impactos, salvaguardas_pct)
+    
+    def calculate_magerit_matrix_risks(self, overrides: Optional[Dict[str, float]] = None) -> Dict[str, List[Any]]:
+        """
+        Recalcula los riesgos de todos los activos de MAGERIT
+        
+        Args:
+            overrides: Valores de frecuencia, impacto o salvaguarda_pct que
+                reemplazan a los de cada activo (opcional)
+        """
+        return calculate_column_risks(self.get_magerit_columns(), overrides)
+    
+    def get_magerit_columns(self) -> Dict[str, Any]:
+        """
+        Columnas numéricas de los activos de MAGERIT (activo, frecuencia,
+        impacto, salvaguarda_pct, riesgo_intrinseco y riesgo_residual) y la
+        lista errores, sin volver a interpretar los textos de las filas
+        (ver utils.magerit_records.MageritColumns.snapshot)
+        """
+        with self._state_lock:
+            state = self._refresh_magerit_state()
+            return state.columns.snapshot(state.rows)
+    
+    def simulate_magerit_risk(self, trials: int = 100_000, seed: Optional[int] = None,
+                              spreads: Optional[Dict[str, float]] = None,
+                              percentiles: Optional[List[float]] = None) -> Dict[str, Any]:
+        """
+        Ejecuta una simulación Monte Carlo del riesgo residual de todos los
+        activos de MAGERIT (ver utils.simulation.simulate_portfolio)
+        """
+        # NumPy y el pool de procesos solo se cargan al simular
+        from .simulation import simulate_portfolio
+        
+        values = calculate_column_risks(self.get_magerit_columns())
+        result = simulate_portfolio(values['activo'], values['frecuencia'], values['impacto'],
+                                    values['salvaguarda_pct'], trials=trials, seed=seed,
+                                    spreads=spreads, percentiles=percentiles)
+        result['omitidos'] = values['errores']
+        return result
+    
+    def update_magerit_row(self, row_index: int, updated_data: Dict[str, Any],
+                           expected_version: Optional[int] = None):
         """
         Actualiza una fila de MAGERIT y recalcula los riesgos
         
         Args:
             row_index: Índice de la fila a actualizar (basado en N° Activos)
             updated_data: Diccionario con los campos a actualizar
+            expected_version: Versión sobre la que editó el cliente (opcional);
+                si no coincide se lanza VersionConflictError
         """
-        rows = self.read_csv('magerit')
-        
-        # Encontrar la fila de encabezados
-        header_row_idx = None
-        for idx, row in enumerate(rows):
-            if len(row) > 0 and row[0] == 'N° Activos':
-                header_row_idx = idx
-                break
-        
-        if header_row_idx is None:
-            raise ValueError("No se encontraron los encabezados en MAGERIT")
-        
-        # Encontrar la fila de datos
-        data_start_idx = header_row_idx + 1
-        target_row_idx = None
-        
-        for idx, row in enumerate(rows[data_start_idx:], start=data_start_idx):
-            if len(row) > 0 and row[0] == str(row_index):
-                target_row_idx = idx
-                break
-        
-        if target_row_idx is None:
-            raise ValueError(f"No se encontró el activo N° {row_index}")
-        
-        # Actualizar los campos
-        row = rows[target_row_idx]
-        
-        if 'valor_economico' in updated_data:
-            row[4] = updated_data['valor_economico']
-        if 'frecuencia' in updated_data:
-            row[5] = str(updated_data['frecuencia'])
-        if 'impacto' in updated_data:
-            row[6] = str(updated_data['impacto'])
-        if 'salvaguarda' in updated_data:
-            row[8] = updated_data['salvaguarda']
-        if 'valor_salvaguarda' in updated_data:
-            row[9] = updated_data['valor_salvaguarda']
-        
-        # Recalcular riesgos si tenemos los valores necesarios
-        try:
-            frecuencia = float(updated_data.get('frecuencia', row[5]))
-            impacto = float(str(updated_data.get('impacto', row[6])).replace(',', '.'))
-            salvaguarda_str = updated_data.get('valor_salvaguarda', row[9])
+        with self._write_lock, self._state_lock:
+            state = self._refresh_magerit_state()
+            if state.index is None:
+                raise ValueError("No se encontraron los encabezados en MAGERIT")
+            self._check_version(state, expected_version)
             
-            # Extraer porcentaje de salvaguarda
-            salvaguarda_pct = 0
-            if '%' in str(salvaguarda_str):
-                salvaguarda_pct = float(str(salvaguarda_str).split(':')[1].strip().replace('%', ''))
+            target_row_idx = state.index.find(row_index)
             
-            # Calcular riesgos
-            risks = self.calculate_magerit_risk(frecuencia, impacto, salvaguarda_pct)
+            if target_row_idx is None:
+                raise ValueError(f"No se encontró el activo N° {row_index}")
             
-            # Actualizar las columnas de riesgo
-            row[7] = f"{frecuencia} * {impacto} = {risks['riesgo_intrinseco']}"
-            row[10] = f"{risks['riesgo_intrinseco']} - {risks['riesgo_intrinseco'] * salvaguarda_pct / 100:.2f} = {risks['riesgo_residual']} (Riesgo {'Bajo' if risks['riesgo_residual'] < 2 else 'Medio-Bajo' if risks['riesgo_residual'] < 3 else 'Alto'})"
+            # Las filas del estado son compartidas con los lectores: update genera una nueva
+            record = state.record(target_row_idx)
+            row = self._apply_magerit_update(record, updated_data)
             
-        except (ValueError, IndexError) as e:
-            print(f"Error al calcular riesgos: {e}")
-        
-        # Guardar cambios
-        self.write_csv('magerit', rows)
+            # Registrar el cambio en el diario
+            self._commit_magerit([{'op': 'update', 'asset': row[0], 'row': row}], [record])
         
-        return rows[target_row_idx]
+        return row
     
-    def add_magerit_asset(self, asset_data: Dict[str, Any]):
+    def _apply_magerit_update(self, record: MageritRecord, updated_data: Dict[str, Any]) -> List[str]:
+        """Aplica los campos editados sobre el activo y retorna su fila con los riesgos recalculados"""
+        row = record.update(updated_data)
+        if record.riesgo_residual is None:
+            metrics.inc('isoapp_risk_calculation_errors_total')
+            logger.warning("No se pudieron calcular los riesgos del activo N° %s", row[0])
+        return row
+    
+    def add_magerit_asset(self, asset_data: Dict[str, Any],
+                          expected_version: Optional[int] = None):
         """
         Agrega un nuevo activo a MAGERIT
         
@@ -179,102 +795,96 @@ class CSVProcessor:
                 - impacto: Impacto de la amenaza
                 - salvaguarda: Salvaguardas implementadas
                 - valor_salvaguarda_pct: Porcentaje de efectividad de salvaguarda
+            expected_version: Versión sobre la que editó el cliente (opcional)
         """
-        rows = self.read_csv('magerit')
-        
-        # Encontrar la fila de encabezados
-        header_row_idx = None
-        for idx, row in enumerate(rows):
-            if len(row) > 0 and row[0] == 'N° Activos':
-                header_row_idx = idx
-                break
-        
-        if header_row_idx is None:
-            raise ValueError("No se encontraron los encabezados en MAGERIT")
-        
-        # Encontrar el último número de activo
-        max_activo_num = 0
-        data_start_idx = header_row_idx + 1
-        
-        for row in rows[data_start_idx:]:
-            if len(row) > 0 and row[0] and row[0].strip().isdigit():
-                max_activo_num = max(max_activo_num, int(row[0]))
-        
-        # Nuevo número de activo
-        new_activo_num = max_activo_num + 1
-        
-        # Calcular riesgos
-        frecuencia = float(asset_data['frecuencia'])
-        impacto = float(asset_data['impacto'])
-        salvaguarda_pct = float(asset_data['valor_salvaguarda_pct'])
+        with self._write_lock, self._state_lock:
+            state = self._refresh_magerit_state()
+            if state.index is None:
+                raise ValueError("No se encontraron los encabezados en MAGERIT")
+            self._check_version(state, expected_version)
+            
+            # Nuevo número de activo
+            record = MageritRecord.create(state.index.next_asset_number(), asset_data)
+            new_row = record.row
+            
+            # Registrar el alta en el diario
+            self._commit_magerit([{'op': 'add', 'asset': new_row[0], 'row': new_row}], [record])
         
-        risks = self.calculate_magerit_risk(frecuencia, impacto, salvaguarda_pct)
+        return new_row
+    
+    def apply_magerit_batch(self, operations: List[Dict[str, Any]],
+                            expected_version: Optional[int] = None) -> List[Dict[str, Any]]:
+        """
+        Aplica varias altas y actualizaciones de MAGERIT con una sola
+        sincronización y una sola escritura en el diario
         
-        # Clasificar el riesgo residual
-        if risks['riesgo_residual'] < 2:
-            clasificacion = "Riesgo Bajo"
-        elif risks['riesgo_residual'] < 3:
-            clasificacion = "Riesgo Medio-Bajo"
-        elif risks['riesgo_residual'] < 4:
-            clasificacion = "Riesgo Medio-Alto"
-        else:
-            clasificacion = "Riesgo Alto"
-        
-        # Determinar nivel de impacto en texto
-        if impacto <= 1.5:
-            nivel_impacto = "Bajo"
-        elif impacto <= 2.5:
-            nivel_impacto = "Normal"
-        elif impacto <= 3.5:
-            nivel_impacto = "Alto"
-        else:
-            nivel_impacto = "Muy Alto"
-        
-        # Determinar nivel de salvaguarda
-        if salvaguarda_pct >= 80:
-            nivel_salvaguarda = "Muy alto"
-        elif salvaguarda_pct >= 60:
-            nivel_salvaguarda = "Alto"
-        elif salvaguarda_pct >= 40:
-            nivel_salvaguarda = "Normal"
-        else:
-            nivel_salvaguarda = "Bajo"
-        
-        # Crear nueva fila
-        new_row = [
-            str(new_activo_num),
-            asset_data['tipo_activo'],
-            asset_data['activo'],
-            asset_data['amenaza'],
-            asset_data['valor_economico'],
-            asset_data.get('frecuencia_texto', str(frecuencia)),
-            f"{nivel_impacto}: {impacto}".replace('.', ','),
-            f"{frecuencia} * {impacto} = {risks['riesgo_intrinseco']}".replace('.', ','),
-            asset_data['salvaguarda'],
-            f"{nivel_salvaguarda}: {salvaguarda_pct:.0f}%",
-            f"{risks['riesgo_intrinseco']} - {risks['riesgo_intrinseco'] * salvaguarda_pct / 100:.2f} = {risks['riesgo_residual']} ({clasificacion})".replace('.', ',')
-        ]
-        
-        # Encontrar la primera fila vacía después de los datos
-        insert_idx = data_start_idx
-        for idx in range(data_start_idx, len(rows)):
-            if len(rows[idx]) > 0 and rows[idx][0] and rows[idx][0].strip():
-                insert_idx = idx + 1
-            else:
-                break
+        Args:
+            operations: Lista de operaciones, cada una con:
+                - op: 'add' o 'update'
+                - asset: N° del activo (solo para 'update')
+                - data: Campos del activo (como en add_magerit_asset/update_magerit_row)
+            expected_version: Versión sobre la que editó el cliente (opcional)
         
-        # Insertar la nueva fila
-        rows.insert(insert_idx, new_row)
+        Returns:
+            Lista con el resultado de cada operación, en el mismo orden
+        """
+        results = []
         
-        # Guardar cambios
-        self.write_csv('magerit', rows)
+        with self._write_lock, self._state_lock:
+            state = self._refresh_magerit_state()
+            if state.index is None:
+                raise ValueError("No se encontraron los encabezados en MAGERIT")
+            self._check_version(state, expected_version)
+            
+            # Activos modificados dentro del lote (un activo puede editarse varias veces)
+            changed: Dict[str, MageritRecord] = {}
+            records, parsed = [], []
+            next_asset = state.index.next_asset_number()
+            
+            for position, operation in enumerate(operations):
+                try:
+                    op = operation.get('op')
+                    data = operation.get('data') or {}
+                    
+                    if op == 'add':
+                        missing = [f for f in MAGERIT_REQUIRED_FIELDS if f not in data or not data[f]]
+                        if missing:
+                            raise ValueError(f"Campo requerido faltante: {missing[0]}")
+                        record = MageritRecord.create(next_asset, data)
+                        row = record.row
+                        next_asset += 1
+                    elif op == 'update':
+                        asset = str(operation.get('asset', '')).strip()
+                        if asset in changed:
+                            record = changed[asset].copy()
+                        else:
+                            target_row_idx = state.index.find(asset)
+                            if target_row_idx is None:
+                                raise ValueError(f"No se encontró el activo N° {asset}")
+                            record = state.record(target_row_idx)
+                        row = self._apply_magerit_update(record, data)
+                    else:
+                        raise ValueError(f"Operación no válida: {op}")
+                except (ValueError, TypeError, KeyError, AttributeError) as e:
+                    results.append({'index': position, 'success': False, 'error': str(e)})
+                    continue
+                
+                changed[row[0]] = record
+                records.append({'op': op, 'asset': row[0], 'row': row})
+                parsed.append(record)
+                results.append({'index': position, 'success': True, 'asset': row[0], 'data': row})
+            
+            if records:
+                self._commit_magerit(records, parsed)
         
-        return new_row
+        return results
     
     def get_anexo_a_data(self) -> Dict[str, Any]:
         """Obtiene y estructura los datos de ISO 27001 (Anexo A)"""
-        rows = self.read_csv('anexo_a')
-        
+        return self._get_structured('anexo_a', self._parse_anexo_a)
+    
+    def _parse_anexo_a(self, rows: List[List[str]]) -> Dict[str, Any]:
+        """Estructura las filas crudas de ISO 27001 (Anexo A)"""
         # Buscar encabezados
         header_row_idx = None
         for idx, row in enumerate(rows):
@@ -293,8 +903,10 @@ class CSVProcessor:
     
     def get_cobit_data(self) -> Dict[str, Any]:
         """Obtiene y estructura los datos de COBIT"""
-        rows = self.read_csv('cobit')
-        
+        return self._get_structured('cobit', self._parse_cobit)
+    
+    def _parse_cobit(self, rows: List[List[str]]) -> Dict[str, Any]:
+        """Estructura las filas crudas de COBIT"""
         # Buscar encabezados
         header_row_idx = None
         for idx, row in enumerate(rows):
@@ -313,8 +925,10 @@ class CSVProcessor:
     
     def get_nist_data(self) -> Dict[str, Any]:
         """Obtiene y estructura los datos de NIST"""
-        rows = self.read_csv('nist')
-        
+        return self._get_structured('nist', self._parse_nist)
+    
+    def _parse_nist(self, rows: List[List[str]]) -> Dict[str, Any]:
+        """Estructura las filas crudas de NIST"""
         # Buscar encabezados
         header_row_idx = None
         for idx, row in enumerate(rows):
@@ -331,6 +945,62 @@ class CSVProcessor:
             'data': [row for row in rows[header_row_idx + 1:] if len(row) > 0 and row[0]]
         }
     
+    def get_data(self, csv_type: str) -> Dict[str, Any]:
+        """Obtiene los datos estructurados de una matriz por su tipo"""
+        loaders = {
+            'magerit': self.get_magerit_data,
+            'anexo_a': self.get_anexo_a_data,
+            'cobit': self.get_cobit_data,
+            'nist': self.get_nist_data
+        }
+        if csv_type not in loaders:
+            raise ValueError(f"Tipo de CSV no válido: {csv_type}")
+        return loaders[csv_type]()
+    
+    def get_matrix_index(self, csv_type: str) -> MatrixIndex:
+        """
+        Retorna los índices por columna de la versión actual de la matriz,
+        construyéndolos solo cuando la matriz cambió
+        """
+        location = self.backend.location(csv_type)
+        signature = self.get_signature(csv_type)
+        rows = self.get_data(csv_type).get('data', [])
+        
+        # Si la matriz cambió entre la firma y la lectura, el índice en caché
+        # no corresponde a estas filas y se reconstruye
+        index = self.cache.get(location, signature, kind='index')
+        if index is None or index.rows is not rows:
+            index = MatrixIndex(csv_type, rows)
+            self.cache.put(location, signature, index, kind='index')
+        return index
+    
+    def query_data(self, csv_type: str, filters: Optional[Dict[str, List[str]]] = None,
+                   fields: Optional[List[str]] = None, offset: int = 0,
+                   limit: Optional[int] = None) -> Dict[str, Any]:
+        """
+        Obtiene una página de una matriz con filtros y proyección de columnas
+        (ver utils.matrix_query.query_matrix)
+        """
+        index = self.get_matrix_index(csv_type)
+        data = self.get_data(csv_type)
+        if index.rows is not data.get('data', []):
+            index = MatrixIndex(csv_type, data.get('data', []))
+        return query_matrix(data, index, filters, fields, offset, limit)
+    
+    def iter_data(self, csv_type: str, filters: Optional[Dict[str, List[str]]] = None,
+                  fields: Optional[List[str]] = None) -> Tuple[List[str], Iterator[List[str]]]:
+        """
+        Encabezados y filas de la versión actual de una matriz, para
+        exportarla completa (ver utils.matrix_query.iter_matrix)
+        """
+        data = self.get_data(csv_type)
+        index = None
+        if filters:
+            index = self.get_matrix_index(csv_type)
+            if index.rows is not data.get('data', []):
+                index = MatrixIndex(csv_type, data.get('data', []))
+        return iter_matrix(data, index, filters, fields)
+    
     def get_all_data(self) -> Dict[str, Dict[str, Any]]:
         """Obtiene todos los datos de los 4 CSV"""
         return {
@@ -0,0 +1,195 @@
+"""
+Exportación de matrices completas en CSV, NDJSON y XLSX como generadores
+de bloques de bytes: las filas se serializan a medida que se envían, por lo
+que la memoria usada no depende del tamaño de la matriz
+"""
+import csv
+import io
+import json
+import re
+import zipfile
+from typing import Callable, Dict, Iterable, Iterator, List, Sequence
+from xml.sax.saxutils import escape
+
+
+# Bytes acumulados antes de entregar un bloque al servidor
+CHUNK_BYTES = 64 * 1024
+
+EXPORT_FORMATS = {
+    'csv': 'text/csv',
+    'ndjson': 'application/x-ndjson',
+    'xlsx': 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
+}
+
+# Caracteres de control que XML no admite
+_XML_INVALID = re.compile('[\x00-\x08\x0b\x0c\x0e-\x1f]')
+
+
+def column_names(headers: Sequence[str]) -> List[str]:
+    """
+    Nombres únicos de las columnas para NDJSON: los encabezados vacíos o
+    repetidos se numeran (columna_6, Responsable_2)
+    """
+    names, seen = [], set()
+    for position, header in enumerate(headers):
+        name = ' '.join(str(header).split()) or f'columna_{position + 1}'
+        base, suffix = name, 2
+        while name in seen:
+            name = f'{base}_{suffix}'
+            suffix += 1
+        seen.add(name)
+        names.append(name)
+    return names
+
+
+def iter_csv(headers: Sequence[str], rows: Iterable[Sequence[str]]) -> Iterator[bytes]:
+    """CSV en UTF-8 con una fila de encabezados"""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer, lineterminator='\r\n')
+    writer.writerow(headers)
+    for row in rows:
+        writer.writerow(row)
+        if buffer.tell() >= CHUNK_BYTES:
+            yield buffer.getvalue().encode('utf-8')
+            buffer.seek(0)
+            buffer.truncate()
+    yield buffer.getvalue().encode('utf-8')
+
+
+def iter_ndjson(headers: Sequence[str], rows: Iterable[Sequence[str]]) -> Iterator[bytes]:
+    """Un objeto JSON por línea, con los encabezados como claves (ver column_names)"""
+    names = column_names(headers)
+    chunk: List[str] = []
+    size = 0
+    for row in rows:
+        line = json.dumps({name: row[i] if i < len(row) else '' for i, name in enumerate(names)},
+                          ensure_ascii=False)
+        chunk.append(line)
+        size += len(line) + 1
+        if size >= CHUNK_BYTES:
+            yield ('\n'.join(chunk) + '\n').encode('utf-8')
+            chunk, size = [], 0
+    if chunk:
+        yield ('\n'.join(chunk) + '\n').encode('utf-8')
+
+
+class _ChunkWriter:
+    """
+    Destino de zipfile sin seek ni tell: zipfile escribe entonces los
+    tamaños de cada archivo después de sus datos, y los bytes escritos se
+    retiran con take()
+    """
+
+    def __init__(self):
+        self._chunks: List[bytes] = []
+        self.size = 0
+
+    def write(self, data: bytes) -> int:
+        self._chunks.append(bytes(data))
+        self.size += len(data)
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def take(self) -> bytes:
+        data = b''.join(self._chunks)
+        self._chunks = []
+        self.size = 0
+        return data
+
+
+def _column_letter(position: int) -> str:
+    letters = ''
+    position += 1
+    while position:
+        position, remainder = divmod(position - 1, 26)
+        letters = chr(65 + remainder) + letters
+    return letters
+
+
+def _xlsx_row(number: int, values: Sequence[str], letters: List[str]) -> str:
+    while len(letters) < len(values):
+        letters.append(_column_letter(len(letters)))
+    cells = ''.join(
+        f'<c r="{letters[i]}{number}" t="inlineStr"><is><t xml:space="preserve">'
+        f'{escape(_XML_INVALID.sub("", str(value)))}</t></is></c>'
+        for i, value in enumerate(values) if value != ''
+    )
+    return f'<row r="{number}">{cells}</row>'
+
+
+_XLSX_PARTS = {
+    '[Content_Types].xml': (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+        '<Types xmlns="http://schemas.openxmlformats.org/package/2006/content-types">'
+        '<Default Extension="rels" ContentType="application/vnd.openxmlformats-package.relationships+xml"/>'
+        '<Default Extension="xml" ContentType="application/xml"/>'
+        '<Override PartName="/xl/workbook.xml" '
+        'ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet.main+xml"/>'
+        '<Override PartName="/xl/worksheets/sheet1.xml" '
+        'ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.worksheet+xml"/>'
+        '</Types>'
+    ),
+    '_rels/.rels': (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+        '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+        '<Relationship Id="rId1" '
+        'Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/officeDocument" '
+        'Target="xl/workbook.xml"/>'
+        '</Relationships>'
+    ),
+    'xl/_rels/workbook.xml.rels': (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+        '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+        '<Relationship Id="rId1" '
+        'Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/worksheet" '
+        'Target="worksheets/sheet1.xml"/>'
+        '</Relationships>'
+    )
+}
+
+
+def iter_xlsx(headers: Sequence[str], rows: Iterable[Sequence[str]],
+              sheet_name: str = 'Datos') -> Iterator[bytes]:
+    """
+    Libro de Excel de una hoja con textos en línea (sin tabla de cadenas
+    compartidas, que obligaría a guardar todos los valores antes de
+    escribir). El ZIP se genera sobre un destino sin seek, por lo que cada
+    bloque puede enviarse apenas se comprime.
+    """
+    output = _ChunkWriter()
+    with zipfile.ZipFile(output, 'w', compression=zipfile.ZIP_DEFLATED) as archive:
+        for name, content in _XLSX_PARTS.items():
+            archive.writestr(name, content)
+        archive.writestr('xl/workbook.xml', (
+            '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+            '<workbook xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main" '
+            'xmlns:r="http://schemas.openxmlformats.org/officeDocument/2006/relationships">'
+            f'<sheets><sheet name="{escape(sheet_name[:31])}" sheetId="1" r:id="rId1"/></sheets>'
+            '</workbook>'
+        ))
+        yield output.take()
+
+        letters: List[str] = []
+        # Sin force_zip64 la hoja puede ocupar hasta 2 GiB sin comprimir
+        with archive.open('xl/worksheets/sheet1.xml', 'w') as sheet:
+            sheet.write(
+                b'<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+                b'<worksheet xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main">'
+                b'<sheetData>'
+            )
+            sheet.write(_xlsx_row(1, headers, letters).encode('utf-8'))
+            for number, row in enumerate(rows, start=2):
+                sheet.write(_xlsx_row(number, row, letters).encode('utf-8'))
+                if output.size >= CHUNK_BYTES:
+                    yield output.take()
+            sheet.write(b'</sheetData></worksheet>')
+    yield output.take()
+
+
+EXPORTERS: Dict[str, Callable[..., Iterator[bytes]]] = {
+    'csv': iter_csv,
+    'ndjson': iter_ndjson,
+    'xlsx': iter_xlsx
+}
@@ -0,0 +1,315 @@
+"""
+Historial de cambios de MAGERIT: cada escritura guarda solo las celdas que
+cambiaron de cada fila (deltas) y, cada tanto, un punto de control con la
+matriz completa comprimida. La matriz de cualquier momento se reconstruye
+desde el punto de control anterior aplicando los deltas que le siguen.
+"""
+import bisect
+import gzip
+import heapq
+import json
+import os
+import tempfile
+import threading
+from datetime import datetime, timezone
+from typing import Any, Dict, Iterator, List, Optional, Sequence, Tuple, Union
+
+from .journal import ChangeJournal, parse_line
+from .magerit_records import NUMERIC_FIELDS, parse_values
+from .matrix_query import residual_risk_class
+
+
+# Bytes de deltas a partir de los cuales se escribe otro punto de control
+# (además, nunca menos que el tamaño comprimido del punto de control anterior)
+CHECKPOINT_MIN_BYTES = 64 * 1024
+
+
+def parse_timestamp(value: Union[str, float]) -> float:
+    """
+    Instante de una consulta: segundos desde epoch o fecha ISO 8601
+    ("2025-03-01T10:30:00", "2025-03-01T10:30:00Z"; sin zona horaria se
+    toma la hora local del servidor)
+    """
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        pass
+    try:
+        return datetime.fromisoformat(str(value).strip()).timestamp()
+    except ValueError:
+        raise ValueError(f"Fecha no válida: {value}") from None
+
+
+def format_timestamp(ts: float) -> str:
+    """Fecha ISO 8601 en UTC de un instante"""
+    return datetime.fromtimestamp(ts, timezone.utc).isoformat()
+
+
+def row_delta(previous: Optional[Sequence[str]], row: Sequence[str]) -> Dict[str, Any]:
+    """
+    Delta de una fila: sin fila anterior, la fila completa; si no, las
+    celdas que cambiaron como [[columna, valor], ...] y el largo nuevo
+    """
+    if previous is None:
+        return {'row': list(row)}
+    cells = [[i, value] for i, value in enumerate(row)
+             if i >= len(previous) or previous[i] != value]
+    delta: Dict[str, Any] = {'cells': cells}
+    if len(row) != len(previous):
+        delta['n'] = len(row)
+    return delta
+
+
+def apply_delta(previous: Optional[Sequence[str]], delta: Dict[str, Any]) -> List[str]:
+    """Fila resultante de aplicar un delta (ver row_delta) sobre la anterior"""
+    if 'row' in delta:
+        return list(delta['row'])
+    row = list(previous or [])
+    size = delta.get('n', len(row))
+    del row[size:]
+    row.extend([''] * (size - len(row)))
+    for i, value in delta['cells']:
+        row[i] = value
+    return row
+
+
+def _find_asset(rows: Sequence[Sequence[str]], asset: str) -> Optional[List[str]]:
+    for row in rows:
+        if row and row[0].strip() == asset:
+            return list(row)
+    return None
+
+
+def _risk_point(row: Optional[Sequence[str]], version: int, ts: float, op: str) -> Dict[str, Any]:
+    # Sin fila: el activo se quitó al reemplazar la matriz
+    values = parse_values(list(row)) if row is not None else None
+    point = {'version': version, 'ts': ts, 'fecha': format_timestamp(ts), 'op': op}
+    point.update(zip(NUMERIC_FIELDS, values or (None,) * len(NUMERIC_FIELDS)))
+    point['clasificacion'] = (residual_risk_class(row) or None) if row is not None else None
+    return point
+
+
+class MageritHistory:
+    """
+    Deltas y puntos de control de MAGERIT en una carpeta (.isoapp/history).
+    Los escritores lo usan con el bloqueo de escritura de MAGERIT tomado,
+    por lo que los registros quedan en orden de versión aunque escriban
+    varios procesos; los lectores no toman ningún bloqueo.
+
+    - magerit-deltas.jsonl: una línea por fila modificada ({v, ts, op,
+      asset} más el delta); 'replace' marca un reemplazo completo
+    - magerit-checkpoints.jsonl: {v, ts, file, offset, bytes} de cada punto
+      de control; offset es el largo del archivo de deltas en ese momento
+    - magerit-<versión>.json.gz: las filas de cada punto de control
+
+    Para las trayectorias se guarda en memoria, por activo, el
+    desplazamiento de cada una de sus líneas de deltas (y los de los
+    reemplazos); el índice se completa con lo que se agregó al archivo desde
+    la última consulta, y cada trayectoria lee solo las líneas de su activo.
+    """
+
+    def __init__(self, directory: str, fsync: bool = True):
+        self.directory = directory
+        self.fsync = fsync
+        self.deltas = ChangeJournal(os.path.join(directory, 'magerit-deltas.jsonl'), fsync)
+        self.index = ChangeJournal(os.path.join(directory, 'magerit-checkpoints.jsonl'), fsync)
+        self._checkpoints: List[Dict[str, Any]] = []
+        self._index_signature = None
+        self._offsets: Dict[str, List[int]] = {}
+        self._replace_offsets: List[int] = []
+        # (inodo, bytes indexados) del archivo de deltas
+        self._indexed: Tuple[Optional[int], int] = (None, 0)
+        self._offsets_lock = threading.Lock()
+
+    def checkpoints(self) -> List[Dict[str, Any]]:
+        """Puntos de control en orden (releídos si otro proceso agregó alguno)"""
+        signature = self.index.signature()
+        if signature != self._index_signature:
+            self._checkpoints = self.index.read()[0] if signature else []
+            self._index_signature = signature
+        return self._checkpoints
+
+    def is_empty(self) -> bool:
+        return not self.checkpoints()
+
+    # ---- escritura (con el bloqueo de escritura de MAGERIT tomado) ----
+
+    def append(self, records: List[Dict[str, Any]],
+               previous: Dict[str, Optional[List[str]]]):
+        """
+        Guarda los deltas de los registros del diario (con su versión y
+        fecha). previous tiene la fila de cada activo antes del primer
+        registro que lo modifica (None para las altas).
+        """
+        rows = dict(previous)
+        deltas = []
+        for record in records:
+            asset = str(record['asset']).strip()
+            delta = row_delta(rows.get(asset), record['row'])
+            if 'cells' in delta and not delta['cells'] and 'n' not in delta:
+                continue
+            delta.update(v=record['v'], ts=record['ts'], op=record['op'], asset=asset)
+            deltas.append(delta)
+            rows[asset] = record['row']
+        if deltas:
+            self.deltas.append(deltas)
+
+    def needs_checkpoint(self) -> bool:
+        """True si los deltas desde el último punto de control ya pesan más que él"""
+        checkpoints = self.checkpoints()
+        if not checkpoints:
+            return True
+        last = checkpoints[-1]
+        signature = self.deltas.signature()
+        size = signature[1] if signature else 0
+        return size - last['offset'] >= max(last['bytes'], CHECKPOINT_MIN_BYTES)
+
+    def checkpoint(self, rows: Sequence[Sequence[str]], version: int, ts: float,
+                   replace: bool = False):
+        """
+        Guarda un punto de control con las filas de una versión. Con
+        replace=True la matriz se reemplazó completa y los deltas anteriores
+        no llevan a ella: se marca en el archivo de deltas.
+        """
+        os.makedirs(self.directory, exist_ok=True)
+        if replace:
+            self.deltas.append([{'op': 'replace', 'v': version, 'ts': ts}])
+        name = f'magerit-{version:010d}.json.gz'
+        payload = gzip.compress(json.dumps(rows, ensure_ascii=False).encode('utf-8'), compresslevel=5)
+
+        fd, tmp_path = tempfile.mkstemp(dir=self.directory, prefix='.checkpoint-')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                f.write(payload)
+                f.flush()
+                if self.fsync:
+                    os.fsync(f.fileno())
+            os.replace(tmp_path, os.path.join(self.directory, name))
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.unlink(tmp_path)
+            raise
+
+        signature = self.deltas.signature()
+        self.index.append([{'v': version, 'ts': ts, 'file': name,
+                            'offset': signature[1] if signature else 0, 'bytes': len(payload)}])
+
+    # ---- lectura ----
+
+    def checkpoint_at(self, ts: float) -> Dict[str, Any]:
+        """
+        Último punto de control anterior o igual a ts
+
+        Raises:
+            ValueError: Si ts es anterior al inicio del historial
+        """
+        found = None
+        for checkpoint in self.checkpoints():
+            if checkpoint['ts'] > ts:
+                break
+            found = checkpoint
+        if found is None:
+            raise ValueError("No hay historial de MAGERIT para esa fecha")
+        return found
+
+    def load_checkpoint(self, checkpoint: Dict[str, Any]) -> List[List[str]]:
+        """Filas de un punto de control"""
+        with gzip.open(os.path.join(self.directory, checkpoint['file']), 'rb') as f:
+            return json.loads(f.read().decode('utf-8'))
+
+    def iter_deltas(self, offset: int = 0) -> Iterator[Dict[str, Any]]:
+        """Deltas guardados a partir de un desplazamiento, leídos línea a línea"""
+        try:
+            f = open(self.deltas.path, 'rb')
+        except FileNotFoundError:
+            return
+        with f:
+            f.seek(offset)
+            for line in f:
+                # Una línea sin salto final es una escritura en curso
+                if not line.endswith(b'\n'):
+                    break
+                delta = parse_line(line, self.deltas.path) if line.strip() else None
+                if delta is not None:
+                    yield delta
+
+    def _delta_offsets(self, asset: str, start: int) -> List[int]:
+        """
+        Desplazamientos, en orden, de las líneas de deltas de un activo y de
+        los reemplazos a partir de start (actualiza antes el índice)
+        """
+        with self._offsets_lock:
+            signature = self.deltas.signature()
+            inode, size = signature if signature else (None, 0)
+            indexed_inode, offset = self._indexed
+            if inode != indexed_inode or size < offset:
+                # Archivo nuevo o truncado: se indexa desde el principio
+                self._offsets, self._replace_offsets, offset = {}, [], 0
+            if size > offset:
+                with open(self.deltas.path, 'rb') as f:
+                    f.seek(offset)
+                    for line in f:
+                        if not line.endswith(b'\n'):
+                            break
+                        delta = parse_line(line, self.deltas.path) if line.strip() else None
+                        if delta is not None:
+                            if delta['op'] == 'replace':
+                                self._replace_offsets.append(offset)
+                            else:
+                                self._offsets.setdefault(delta['asset'], []).append(offset)
+                        offset += len(line)
+            self._indexed = (inode, offset)
+
+            own = self._offsets.get(asset, [])
+            replaces = self._replace_offsets
+            return list(heapq.merge(own[bisect.bisect_left(own, start):],
+                                    replaces[bisect.bisect_left(replaces, start):]))
+
+    def _read_deltas(self, offsets: List[int]) -> Iterator[Dict[str, Any]]:
+        """Deltas de las líneas que empiezan en cada desplazamiento"""
+        if not offsets:
+            return
+        with open(self.deltas.path, 'rb') as f:
+            for offset in offsets:
+                f.seek(offset)
+                yield json.loads(f.readline().decode('utf-8'))
+
+    def trajectory(self, asset: Any, since: Optional[float] = None,
+                   until: Optional[float] = None) -> List[Dict[str, Any]]:
+        """
+        Valores y clasificación del riesgo de un activo en cada versión que
+        lo modificó (entre since y until), empezando por su estado en since
+        o al inicio del historial. Parte del punto de control anterior a
+        since y lee solo los deltas del activo y los reemplazos.
+        """
+        asset = str(asset).strip()
+        checkpoints = self.checkpoints()
+        if not checkpoints:
+            return []
+        start = self.checkpoint_at(since) if since is not None and since >= checkpoints[0]['ts'] else checkpoints[0]
+        by_version = {c['v']: c for c in checkpoints}
+
+        row = _find_asset(self.load_checkpoint(start), asset)
+        version, ts = start['v'], start['ts']
+        points = []
+        for delta in self._read_deltas(self._delta_offsets(asset, start['offset'])):
+            if until is not None and delta['ts'] > until:
+                break
+            if delta['op'] == 'replace':
+                if delta['v'] not in by_version:
+                    # El punto de control del reemplazo no llegó a escribirse
+                    continue
+                new_row = _find_asset(self.load_checkpoint(by_version[delta['v']]), asset)
+            else:
+                new_row = apply_delta(row, delta)
+            if since is not None and delta['ts'] <= since:
+                row, version, ts = new_row, delta['v'], delta['ts']
+                continue
+            if not points and row is not None:
+                points.append(_risk_point(row, version, since if since is not None else ts, 'inicial'))
+            if new_row != row:
+                points.append(_risk_point(new_row, delta['v'], delta['ts'], delta['op']))
+            row = new_row
+        if not points and row is not None:
+            points.append(_risk_point(row, version, since if since is not None else ts, 'inicial'))
+        return points
@@ -0,0 +1,126 @@
+"""
+Diario de cambios (write-ahead log) de solo-anexado para las matrices
+"""
+import json
+import logging
+import os
+import tempfile
+from typing import Any, Dict, List, Optional, Tuple
+
+
+# Bloque con el que se busca hacia atrás el último salto de línea
+_TAIL_CHUNK = 64 * 1024
+
+logger = logging.getLogger(__name__)
+
+
+def parse_line(line: bytes, path: str) -> Optional[Dict[str, Any]]:
+    """Registro de una línea del diario; None (y un aviso) si no se puede interpretar"""
+    try:
+        return json.loads(line.decode('utf-8'))
+    except (UnicodeDecodeError, ValueError):
+        logger.warning("Se ignora una línea dañada de %s: %r", path, line[:80])
+        return None
+
+
+def _drop_partial_line(f) -> int:
+    """
+    Recorta el archivo (abierto en a+b) hasta después del último salto de
+    línea: quita lo que dejó una escritura interrumpida. Retorna el tamaño.
+    """
+    size = f.seek(0, os.SEEK_END)
+    end = size
+    while end > 0:
+        start = max(0, end - _TAIL_CHUNK)
+        f.seek(start)
+        chunk = f.read(end - start)
+        newline = chunk.rfind(b'\n')
+        if newline >= 0:
+            end = start + newline + 1
+            break
+        end = start
+    if end != size:
+        f.truncate(end)
+    return end
+
+
+class ChangeJournal:
+    """
+    Registra cada edición como una línea JSON al final de un archivo.
+    Escribir un cambio cuesta lo mismo sin importar el tamaño de la matriz;
+    los lectores aplican los registros sobre el CSV base y una compactación
+    periódica los incorpora al CSV y vacía el diario.
+    """
+
+    def __init__(self, path: str, fsync: bool = True):
+        self.path = path
+        self.fsync = fsync
+
+    def signature(self) -> Optional[Tuple[int, int]]:
+        """Retorna (inodo, tamaño) del diario o None si no existe"""
+        try:
+            stat = os.stat(self.path)
+        except FileNotFoundError:
+            return None
+        return (stat.st_ino, stat.st_size)
+
+    def append(self, records: List[Dict[str, Any]]) -> Tuple[int, int]:
+        """
+        Anexa los registros en una sola escritura y retorna los
+        desplazamientos (inicio, fin) donde quedaron. Debe llamarse con el
+        bloqueo de escritura tomado: una línea incompleta al final (de un
+        proceso que murió a mitad de una escritura) se descarta antes.
+        """
+        payload = ''.join(json.dumps(r, ensure_ascii=False) + '\n' for r in records).encode('utf-8')
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+
+        with open(self.path, 'a+b') as f:
+            _drop_partial_line(f)
+            f.write(payload)
+            f.flush()
+            if self.fsync:
+                os.fsync(f.fileno())
+            end = f.tell()
+        return end - len(payload), end
+
+    def read(self, offset: int = 0) -> Tuple[List[Dict[str, Any]], int]:
+        """
+        Lee los registros completos a partir de un desplazamiento.
+        Una línea sin salto final (escritura en curso) se ignora y el
+        desplazamiento retornado queda antes de ella; una línea dañada se
+        ignora con un aviso.
+        """
+        try:
+            with open(self.path, 'rb') as f:
+                f.seek(offset)
+                chunk = f.read()
+        except FileNotFoundError:
+            return [], 0
+
+        end = chunk.rfind(b'\n') + 1
+        records = []
+        for line in chunk[:end].splitlines():
+            if line.strip():
+                record = parse_line(line, self.path)
+                if record is not None:
+                    records.append(record)
+        return records, offset + end
+
+    def reset(self, records: Optional[List[Dict[str, Any]]] = None):
+        """Reemplaza atómicamente el diario por uno vacío (o con los registros dados)"""
+        directory = os.path.dirname(self.path)
+        os.makedirs(directory, exist_ok=True)
+        payload = ''.join(json.dumps(r, ensure_ascii=False) + '\n' for r in records or [])
+
+        fd, tmp_path = tempfile.mkstemp(dir=directory, prefix='.journal-')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                f.write(payload.encode('utf-8'))
+                f.flush()
+                if self.fsync:
+                    os.fsync(f.fileno())
+            os.replace(tmp_path, self.path)
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.unlink(tmp_path)
+            raise
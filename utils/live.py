@@ -0,0 +1,185 @@
+"""
+Cambios de MAGERIT en vivo (Server-Sent Events): un hilo por proyecto sigue
+el archivo de deltas del historial, que comparten todos los workers, y
+publica cada alta o edición una sola vez en un buffer circular; los
+clientes conectados esperan en una misma Condition y reciben los eventos
+posteriores a su versión.
+"""
+import json
+import logging
+import threading
+from collections import deque
+from typing import Any, Deque, Dict, Iterator, List, Optional, Tuple
+
+
+# Intervalo de lectura del historial (los cambios del propio proceso despiertan antes al hilo)
+POLL_SECONDS = 0.5
+# Segundos sin eventos tras los que se envía un comentario para mantener viva la conexión
+KEEPALIVE_SECONDS = 15.0
+# Eventos que se conservan para los clientes que se reconectan (Last-Event-ID)
+BUFFER_EVENTS = 1024
+# Espera antes de reconectar que se sugiere al navegador (milisegundos)
+RETRY_MS = 3000
+
+logger = logging.getLogger(__name__)
+
+
+def format_event(event: str, version: int, data: Dict[str, Any]) -> bytes:
+    """Evento SSE con la versión como id"""
+    payload = json.dumps(data, ensure_ascii=False, separators=(',', ':'))
+    return f'id: {version}\nevent: {event}\ndata: {payload}\n\n'.encode('utf-8')
+
+
+class ChangeFeed:
+    """
+    Eventos de MAGERIT de un CSVProcessor:
+
+    - add / update: {version, ts, op, asset} más la fila completa (row) en
+      las altas o las celdas que cambiaron ([[columna, valor], ...] y el
+      largo nuevo n si cambió) en las ediciones
+    - reset: la matriz se reemplazó o el cliente quedó demasiado atrás;
+      debe volver a pedirla completa
+
+    Cada evento se serializa una vez al publicarse, sin importar cuántos
+    clientes lo reciban.
+    """
+
+    def __init__(self, processor, buffer_events: int = BUFFER_EVENTS,
+                 poll_seconds: float = POLL_SECONDS):
+        self.processor = processor
+        self.history = processor.history
+        self.poll_seconds = poll_seconds
+        self._events: Deque[Tuple[int, bytes]] = deque(maxlen=buffer_events)
+        self._condition = threading.Condition()
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self.clients = 0
+        self.published = 0
+
+        # Primero el largo del historial y después la versión: un cambio en
+        # medio se publica igual (con versión <= floor, que nadie pide)
+        signature = self.history.deltas.signature()
+        self._offset = signature[1] if signature else 0
+        self.version = processor.get_magerit_version()
+        # Versión desde la que el buffer tiene todos los eventos
+        self.floor = self.version
+
+        # Las escrituras de este proceso despiertan al hilo sin esperar el intervalo
+        processor.add_change_listener(lambda rows, reset: self._wake.set())
+        self._thread = threading.Thread(target=self._run, name='isoapp-live', daemon=True)
+        self._thread.start()
+
+    # ---- publicación ----
+
+    def _run(self):
+        while not self._stop.is_set():
+            self._wake.wait(self.poll_seconds)
+            self._wake.clear()
+            try:
+                self.poll()
+            except Exception as e:
+                logger.exception("Error al leer el historial de MAGERIT: %s", e)
+
+    def poll(self):
+        """Publica los deltas que se agregaron al historial desde la última lectura"""
+        signature = self.history.deltas.signature()
+        size = signature[1] if signature else 0
+        if size == self._offset:
+            return
+        if size < self._offset:
+            # El historial se borró: los clientes deben recargar la matriz
+            self._offset = 0
+            version = self.processor.get_magerit_version()
+            self._publish([(version, format_event('reset', version, {'version': version}))])
+            return
+
+        deltas, self._offset = self.history.deltas.read(self._offset)
+        events = []
+        for delta in deltas:
+            version = delta['v']
+            if delta['op'] == 'replace':
+                events.append((version, format_event('reset', version, {'version': version})))
+                continue
+            data = {'version': version, 'ts': delta['ts'], 'op': delta['op'], 'asset': delta['asset']}
+            for key in ('row', 'cells', 'n'):
+                if key in delta:
+                    data[key] = delta[key]
+            events.append((version, format_event(delta['op'], version, data)))
+        self._publish(events)
+
+    def _publish(self, events: List[Tuple[int, bytes]]):
+        if not events:
+            return
+        with self._condition:
+            for version, payload in events:
+                if len(self._events) == self._events.maxlen:
+                    # El evento descartado ya no puede reenviarse
+                    self.floor = max(self.floor, self._events[0][0])
+                self._events.append((version, payload))
+                self.version = max(self.version, version)
+            self.published += len(events)
+            self._condition.notify_all()
+
+    # ---- clientes ----
+
+    def _after(self, cursor: int) -> Tuple[int, bytes]:
+        """(nueva versión del cliente, eventos posteriores a cursor); con _condition tomada"""
+        if cursor < self.floor:
+            return self.version, format_event('reset', self.version, {'version': self.version})
+        pending = []
+        for version, payload in reversed(self._events):
+            if version <= cursor:
+                break
+            pending.append(payload)
+        pending.reverse()
+        return max(cursor, self.version), b''.join(pending)
+
+    def wait(self, cursor: int, timeout: float = KEEPALIVE_SECONDS) -> Tuple[int, bytes]:
+        """
+        Espera hasta timeout segundos eventos posteriores a la versión
+        cursor. Retorna la nueva versión del cliente y los eventos (vacío si
+        no hubo ninguno o el feed se cerró).
+        """
+        with self._condition:
+            if self.version <= cursor and cursor >= self.floor and not self._stop.is_set():
+                self._condition.wait(timeout)
+            return self._after(cursor)
+
+    def stream(self, cursor: Optional[int] = None,
+               keepalive: float = KEEPALIVE_SECONDS) -> Iterator[bytes]:
+        """
+        Respuesta SSE de un cliente: los eventos posteriores a cursor (por
+        defecto, desde la versión actual) hasta que se desconecte o el
+        feed se cierre
+        """
+        with self._condition:
+            self.clients += 1
+        try:
+            if cursor is None:
+                cursor = self.version
+            yield f'retry: {RETRY_MS}\n\n'.encode('utf-8')
+            while not self._stop.is_set():
+                cursor, payload = self.wait(cursor, keepalive)
+                # Un comentario cuando no hay eventos: detecta clientes desconectados
+                yield payload or b': keepalive\n\n'
+        finally:
+            with self._condition:
+                self.clients -= 1
+
+    def stats(self) -> Dict[str, Any]:
+        """Clientes conectados, eventos publicados y versión actual"""
+        with self._condition:
+            return {
+                'clientes': self.clients,
+                'eventos_publicados': self.published,
+                'eventos_en_buffer': len(self._events),
+                'version': self.version
+            }
+
+    def close(self, timeout: float = 5.0):
+        """Detiene el hilo y termina las respuestas abiertas (los clientes se reconectan)"""
+        self._stop.set()
+        self._wake.set()
+        with self._condition:
+            self._condition.notify_all()
+        self._thread.join(timeout)
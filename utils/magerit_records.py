@@ -0,0 +1,329 @@
+"""
+Activos de MAGERIT con sus valores numéricos (frecuencia, impacto, % de
+salvaguarda y riesgos) interpretados una sola vez, al cargar la matriz o al
+aplicar un cambio. Los valores se guardan en columnas (array('d')) paralelas
+a las filas, y los textos de una fila ("Alto: 3,5", "1,5 * 3,5 = 5,25") se
+generan solo al escribir el activo.
+"""
+import math
+import re
+import sys
+from array import array
+from typing import Any, Dict, List, Optional, Sequence
+
+from .risk import classify_residual_risk, parse_magerit_values, round_risk
+
+
+# Posición de cada columna en las filas de MAGERIT
+COL_NUMERO = 0
+COL_TIPO_ACTIVO = 1
+COL_ACTIVO = 2
+COL_AMENAZA = 3
+COL_VALOR_ECONOMICO = 4
+COL_FRECUENCIA = 5
+COL_IMPACTO = 6
+COL_RIESGO_INTRINSECO = 7
+COL_SALVAGUARDA = 8
+COL_VALOR_SALVAGUARDA = 9
+COL_RIESGO_RESIDUAL = 10
+ROW_WIDTH = 11
+
+# Columnas con pocos valores distintos: se internan para que las filas
+# compartan el mismo objeto str
+REPEATED_COLUMNS = (COL_TIPO_ACTIVO, COL_AMENAZA, COL_FRECUENCIA, COL_IMPACTO,
+                    COL_SALVAGUARDA, COL_VALOR_SALVAGUARDA)
+
+NUMERIC_FIELDS = ('frecuencia', 'impacto', 'salvaguarda_pct', 'riesgo_intrinseco', 'riesgo_residual')
+
+# Estado de cada fila en MageritColumns
+NOT_ASSET, PARSED, UNPARSED = 0, 1, 2
+_MISSING = (math.nan,) * len(NUMERIC_FIELDS)
+
+_RESULT = re.compile(r'=\s*(-?\d+(?:[.,]\d+)?)')
+_NUMBER = re.compile(r'-?\d+(?:[.,]\d+)?')
+
+
+def format_number(value: float) -> str:
+    """Número como en los CSV: hasta 2 decimales y coma decimal ("3,5", "5,25", "3")"""
+    return f'{round(float(value), 2):g}'.replace('.', ',')
+
+
+def impact_level(impacto: float) -> str:
+    """Nivel de impacto en texto (Bajo, Normal, Alto, Muy Alto)"""
+    if impacto <= 1.5:
+        return 'Bajo'
+    if impacto <= 2.5:
+        return 'Normal'
+    if impacto <= 3.5:
+        return 'Alto'
+    return 'Muy Alto'
+
+
+def safeguard_level(salvaguarda_pct: float) -> str:
+    """Nivel de la salvaguarda en texto (Bajo, Normal, Alto, Muy alto)"""
+    if salvaguarda_pct >= 80:
+        return 'Muy alto'
+    if salvaguarda_pct >= 60:
+        return 'Alto'
+    if salvaguarda_pct >= 40:
+        return 'Normal'
+    return 'Bajo'
+
+
+def parse_number(value: Any) -> float:
+    """
+    Número de un valor ingresado: 3.5, "3,5" o un texto con nivel ("Alto:
+    3,5", "Alto: 75%"), del que se toma el número después de ':'
+    """
+    if isinstance(value, (int, float)):
+        return float(value)
+    found = _NUMBER.findall(str(value).split(':')[-1])
+    if not found:
+        raise ValueError(f"Valor numérico no válido: {value}")
+    return float(found[0].replace(',', '.'))
+
+
+def _provided(data: Dict[str, Any], field: str) -> bool:
+    # Un campo vacío o null (por ejemplo un número que el formulario no pudo leer) no cambia el valor
+    return data.get(field) not in (None, '')
+
+
+def intern_row(row: List[str]) -> List[str]:
+    """Interna (en la misma lista) las columnas con valores repetidos"""
+    for column in REPEATED_COLUMNS:
+        if column < len(row):
+            row[column] = sys.intern(row[column])
+    return row
+
+
+def parse_values(row: List[str], memo: Optional[Dict[tuple, Optional[tuple]]] = None) -> Optional[tuple]:
+    """
+    Valores de NUMERIC_FIELDS de una fila (None si no se pueden interpretar).
+    memo guarda el resultado de cada combinación de textos: las filas
+    repiten pocas combinaciones y cada una se interpreta una sola vez.
+    """
+    key = tuple(row[COL_IMPACTO:COL_SALVAGUARDA]) + tuple(row[COL_VALOR_SALVAGUARDA:])
+    if memo is not None and key in memo:
+        return memo[key]
+    try:
+        record = MageritRecord.parse(row)
+        values = tuple(getattr(record, field) for field in NUMERIC_FIELDS)
+    except ValueError:
+        values = None
+    if memo is not None:
+        memo[key] = values
+    return values
+
+
+class MageritRecord:
+    """
+    Un activo: los textos de su fila (row, compartida y de solo lectura) y
+    sus valores numéricos. update() y create() generan una fila nueva.
+    """
+
+    __slots__ = ('row',) + NUMERIC_FIELDS
+
+    def __init__(self, row: List[str], frecuencia: Optional[float] = None,
+                 impacto: Optional[float] = None, salvaguarda_pct: Optional[float] = None,
+                 riesgo_intrinseco: Optional[float] = None, riesgo_residual: Optional[float] = None):
+        self.row = row
+        self.frecuencia = frecuencia
+        self.impacto = impacto
+        self.salvaguarda_pct = salvaguarda_pct
+        self.riesgo_intrinseco = riesgo_intrinseco
+        self.riesgo_residual = riesgo_residual
+
+    @classmethod
+    def parse(cls, row: List[str]) -> 'MageritRecord':
+        """
+        Interpreta los valores de una fila. Los riesgos se toman del resultado
+        de cada expresión ("= 5,25") y, si falta, se calculan.
+
+        Raises:
+            ValueError: Si frecuencia, impacto o salvaguarda no se pueden interpretar
+        """
+        try:
+            frecuencia, impacto, salvaguarda_pct = parse_magerit_values(row)
+        except IndexError:
+            raise ValueError(f"Fila incompleta del activo N° {row[0] if row else ''}")
+        intrinseco = _RESULT.findall(row[COL_RIESGO_INTRINSECO])
+        residual = _RESULT.findall(row[COL_RIESGO_RESIDUAL]) if len(row) > COL_RIESGO_RESIDUAL else []
+        riesgo_intrinseco = (float(intrinseco[-1].replace(',', '.')) if intrinseco
+                             else round_risk(frecuencia * impacto))
+        riesgo_residual = (float(residual[-1].replace(',', '.')) if residual
+                           else round_risk(riesgo_intrinseco - riesgo_intrinseco * (salvaguarda_pct / 100)))
+        return cls(row, frecuencia, impacto, salvaguarda_pct, riesgo_intrinseco, riesgo_residual)
+
+    @classmethod
+    def create(cls, number: int, data: Dict[str, Any]) -> 'MageritRecord':
+        """Activo nuevo con sus textos y riesgos calculados (campos de MAGERIT_REQUIRED_FIELDS)"""
+        frecuencia = parse_number(data['frecuencia'])
+        impacto = parse_number(data['impacto'])
+        salvaguarda_pct = parse_number(data['valor_salvaguarda_pct'])
+        row = [''] * ROW_WIDTH
+        row[COL_NUMERO] = str(number)
+        row[COL_TIPO_ACTIVO] = data['tipo_activo']
+        row[COL_ACTIVO] = data['activo']
+        row[COL_AMENAZA] = data['amenaza']
+        row[COL_VALOR_ECONOMICO] = data['valor_economico']
+        row[COL_FRECUENCIA] = data.get('frecuencia_texto') or format_number(frecuencia)
+        row[COL_IMPACTO] = f'{impact_level(impacto)}: {format_number(impacto)}'
+        row[COL_SALVAGUARDA] = data['salvaguarda']
+        row[COL_VALOR_SALVAGUARDA] = f'{safeguard_level(salvaguarda_pct)}: {salvaguarda_pct:.0f}%'
+        record = cls(intern_row(row), frecuencia, impacto, salvaguarda_pct)
+        record._render_risks()
+        return record
+
+    def copy(self) -> 'MageritRecord':
+        """Otro registro con la misma fila y valores (para editarlo sin alterar este)"""
+        return MageritRecord(self.row, *(getattr(self, field) for field in NUMERIC_FIELDS))
+
+    @property
+    def clasificacion(self) -> str:
+        """Clasificación del riesgo residual ('' si no se conoce)"""
+        return classify_residual_risk(self.riesgo_residual) if self.riesgo_residual is not None else ''
+
+    def update(self, data: Dict[str, Any]) -> List[str]:
+        """
+        Aplica los campos editados (valor_economico, salvaguarda,
+        frecuencia[_texto], impacto, valor_salvaguarda o
+        valor_salvaguarda_pct) y retorna la fila nueva. Solo se regeneran
+        los textos de los valores que cambiaron y, si cambió alguno, los de
+        los riesgos; si faltan valores para calcularlos, los riesgos quedan
+        en None.
+
+        Raises:
+            ValueError: Si un valor numérico no es válido
+        """
+        row = list(self.row) + [''] * (ROW_WIDTH - len(self.row))
+        if 'valor_economico' in data:
+            row[COL_VALOR_ECONOMICO] = data['valor_economico']
+        if 'salvaguarda' in data:
+            row[COL_SALVAGUARDA] = data['salvaguarda']
+        if _provided(data, 'frecuencia_texto'):
+            row[COL_FRECUENCIA] = data['frecuencia_texto']
+
+        changed = False
+        if _provided(data, 'frecuencia'):
+            frecuencia = parse_number(data['frecuencia'])
+            if frecuencia != self.frecuencia:
+                self.frecuencia = frecuencia
+                if not _provided(data, 'frecuencia_texto'):
+                    row[COL_FRECUENCIA] = format_number(frecuencia)
+                changed = True
+        if _provided(data, 'impacto'):
+            impacto = parse_number(data['impacto'])
+            if impacto != self.impacto:
+                self.impacto = impacto
+                row[COL_IMPACTO] = f'{impact_level(impacto)}: {format_number(impacto)}'
+                changed = True
+        if _provided(data, 'valor_salvaguarda_pct'):
+            salvaguarda_pct = parse_number(data['valor_salvaguarda_pct'])
+            if salvaguarda_pct != self.salvaguarda_pct:
+                row[COL_VALOR_SALVAGUARDA] = f'{safeguard_level(salvaguarda_pct)}: {salvaguarda_pct:.0f}%'
+        elif _provided(data, 'valor_salvaguarda'):
+            # El texto ingresado ("Alto: 75%") se conserva tal cual
+            salvaguarda_pct = parse_number(data['valor_salvaguarda'])
+            row[COL_VALOR_SALVAGUARDA] = data['valor_salvaguarda']
+        else:
+            salvaguarda_pct = self.salvaguarda_pct
+        if salvaguarda_pct != self.salvaguarda_pct:
+            self.salvaguarda_pct = salvaguarda_pct
+            changed = True
+
+        self.row = intern_row(row)
+        if changed:
+            if None in (self.frecuencia, self.impacto, self.salvaguarda_pct):
+                self.riesgo_intrinseco = self.riesgo_residual = None
+            else:
+                self._render_risks()
+        return self.row
+
+    def _render_risks(self):
+        """Calcula los riesgos y genera los textos de sus columnas"""
+        # Las mismas operaciones que calculate_risks_bulk, para que coincidan
+        valor = self.frecuencia * self.impacto
+        intrinseco = round_risk(valor)
+        residual = round_risk(valor - valor * (self.salvaguarda_pct / 100))
+        reduccion = round_risk(intrinseco - residual)
+        self.riesgo_intrinseco, self.riesgo_residual = intrinseco, residual
+        self.row[COL_RIESGO_INTRINSECO] = (f'{format_number(self.frecuencia)} * '
+                                           f'{format_number(self.impacto)} = {format_number(intrinseco)}')
+        self.row[COL_RIESGO_RESIDUAL] = (f'{format_number(intrinseco)} - {format_number(reduccion)} = '
+                                         f'{format_number(residual)} ({classify_residual_risk(residual)})')
+
+
+class MageritColumns:
+    """
+    Valores numéricos de todas las filas de la matriz (metadatos y
+    encabezados incluidos, con NaN), en columnas paralelas a las filas.
+    Ocupan 41 bytes por fila y permiten recorrer la matriz sin volver a
+    interpretar textos.
+    """
+
+    def __init__(self, rows: Sequence[List[str]], data_start: int):
+        self.status = bytearray()
+        self.values = {field: array('d') for field in NUMERIC_FIELDS}
+        parsed: Dict[tuple, Optional[tuple]] = {}
+        for position, row in enumerate(rows):
+            status, values = self._parse(row, position >= data_start, parsed)
+            self.status.append(status)
+            for column, value in zip(self.values.values(), values):
+                column.append(value)
+
+    @staticmethod
+    def _parse(row: List[str], is_data: bool, parsed: Optional[Dict[tuple, tuple]] = None):
+        """(estado, valores de NUMERIC_FIELDS) de una fila"""
+        if not is_data or not (row and row[0] and row[0].strip()):
+            return NOT_ASSET, _MISSING
+        values = parse_values(row, parsed)
+        return (UNPARSED, _MISSING) if values is None else (PARSED, values)
+
+    def _entry(self, row: List[str], record: Optional[MageritRecord]):
+        if record is None:
+            return self._parse(row, True)
+        return PARSED, tuple(math.nan if getattr(record, field) is None else getattr(record, field)
+                             for field in NUMERIC_FIELDS)
+
+    def insert(self, position: int, row: List[str], record: Optional[MageritRecord] = None):
+        """Agrega los valores de una fila nueva en position (record evita interpretarla)"""
+        status, values = self._entry(row, record)
+        self.status.insert(position, status)
+        for column, value in zip(self.values.values(), values):
+            column.insert(position, value)
+
+    def set(self, position: int, row: List[str], record: Optional[MageritRecord] = None):
+        """Reemplaza los valores de la fila de position"""
+        status, values = self._entry(row, record)
+        self.status[position] = status
+        for column, value in zip(self.values.values(), values):
+            column[position] = value
+
+    def record(self, position: int, row: List[str]) -> MageritRecord:
+        """Activo de la fila de position, con sus valores ya interpretados"""
+        if self.status[position] != PARSED:
+            return MageritRecord(row)
+        values = (self.values[field][position] for field in NUMERIC_FIELDS)
+        return MageritRecord(row, *(None if math.isnan(value) else value for value in values))
+
+    def snapshot(self, rows: Sequence[List[str]]) -> Dict[str, Any]:
+        """
+        Columnas de los activos interpretados (activo y los NUMERIC_FIELDS,
+        como array('d')) y la lista errores de los que no se pudieron
+        interpretar, en el orden de las filas
+        """
+        positions = [position for position, status in enumerate(self.status) if status == PARSED]
+        result: Dict[str, Any] = {'activo': [rows[position][0] for position in positions]}
+        for field in NUMERIC_FIELDS:
+            result[field] = array('d', map(self.values[field].__getitem__, positions))
+        errores = []
+        if UNPARSED in self.status:
+            for position, status in enumerate(self.status):
+                if status != UNPARSED:
+                    continue
+                try:
+                    MageritRecord.parse(rows[position])
+                except ValueError as e:
+                    errores.append({'activo': rows[position][0], 'error': str(e)})
+        result['errores'] = errores
+        return result
@@ -0,0 +1,482 @@
+"""
+Relación entre las filas de las cuatro matrices (activos de MAGERIT,
+controles del Anexo A, procesos COBIT y controles NIST) por similitud de texto
+"""
+import gzip
+import json
+import logging
+import math
+import os
+import tempfile
+import threading
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from .search import MATRIX_TYPES, tokenize
+
+
+MAPPING_FORMAT = 2
+# Matrices de solo lectura: su vocabulario define el IDF del mapeo
+CONTROL_TYPES = MATRIX_TYPES[1:]
+# Vecinos que se guardan por fila y por matriz, y similitud mínima
+TOP_K = 5
+MIN_SCORE = 0.05
+# Los términos presentes en más de esta fracción de las filas no aportan
+MAX_DF_RATIO = 0.5
+STEM_LENGTH = 6
+
+# Columnas cuyo texto describe cada fila, y la que la identifica
+MAPPING_COLUMNS: Dict[str, Tuple[Tuple[int, ...], int]] = {
+    'magerit': ((1, 2, 3, 8), 2),   # tipo, activo, amenaza y salvaguardas
+    'anexo_a': ((1, 2, 3), 1),      # control, descripción e implementación
+    'cobit': ((0, 1, 2, 3), 0),     # proceso, objetivo, acciones y contribución
+    'nist': ((1, 2, 3), 1)          # control, descripción e implementación
+}
+
+DocId = Tuple[str, str]
+
+logger = logging.getLogger(__name__)
+
+
+def _terms(text: str) -> Dict[str, int]:
+    """
+    Términos de un texto truncados a STEM_LENGTH caracteres, una raíz
+    aproximada que une variantes como "cifrado"/"cifrar" o "datos"/"dato"
+    """
+    counts: Dict[str, int] = {}
+    for token in tokenize(text):
+        if len(token) < 3 or token.isdigit():
+            continue
+        stem = token[:STEM_LENGTH]
+        counts[stem] = counts.get(stem, 0) + 1
+    return counts
+
+
+def _doc_key(csv_type: str, position: int, row: List[str]) -> str:
+    """Clave de la fila: N° de activo en MAGERIT, posición en las demás matrices"""
+    return row[0].strip() if csv_type == 'magerit' else str(position)
+
+
+def _cell(row: List[str], position: int) -> str:
+    return row[position] if len(row) > position else ''
+
+
+def _document(csv_type: str, position: int, row: List[str]) -> Tuple[str, str, Dict[str, int]]:
+    """Clave, nombre y términos de una fila"""
+    columns, label_column = MAPPING_COLUMNS[csv_type]
+    return (_doc_key(csv_type, position, row), _cell(row, label_column).strip(),
+            _terms(' '.join(_cell(row, c) for c in columns)))
+
+
+def _vector(terms: Dict[str, int], idf: Dict[str, float]) -> Dict[str, float]:
+    """Vector TF-IDF normalizado (tf sublineal); vacío si no tiene términos del vocabulario"""
+    weights = {t: (1 + math.log(c)) * idf[t] for t, c in terms.items() if t in idf}
+    norm = math.sqrt(sum(w * w for w in weights.values()))
+    if norm == 0:
+        return {}
+    return {t: w / norm for t, w in weights.items()}
+
+
+def _postings(vectors: Dict[str, Dict[str, Dict[str, float]]]) -> Dict[str, List[Tuple[DocId, float]]]:
+    """Índice invertido término -> [(fila, peso), ...]"""
+    postings: Dict[str, List[Tuple[DocId, float]]] = {}
+    for csv_type, by_key in vectors.items():
+        for key, vector in by_key.items():
+            for term, weight in vector.items():
+                postings.setdefault(term, []).append(((csv_type, key), weight))
+    return postings
+
+
+def _scores(vector: Dict[str, float], postings: Dict[str, List[Tuple[DocId, float]]],
+            exclude: str) -> Dict[DocId, float]:
+    """Similitud (producto punto) con las filas de otras matrices que comparten términos"""
+    scores: Dict[DocId, float] = {}
+    for term, weight in vector.items():
+        for doc_id, other_weight in postings.get(term, ()):
+            if doc_id[0] != exclude:
+                scores[doc_id] = scores.get(doc_id, 0.0) + weight * other_weight
+    return scores
+
+
+def _top(items: Iterable[Tuple[str, float]]) -> List[List[Any]]:
+    """Las TOP_K filas más parecidas como [[clave, similitud], ...]"""
+    ranked = sorted(([key, round(score, 4)] for key, score in items), key=lambda item: (-item[1], item[0]))
+    return ranked[:TOP_K]
+
+
+def _group(scores: Dict[DocId, float]) -> Dict[str, List[List[Any]]]:
+    """Filas relacionadas por matriz, con similitud de al menos MIN_SCORE"""
+    by_matrix: Dict[str, List[Tuple[str, float]]] = {}
+    for (csv_type, key), score in scores.items():
+        if score >= MIN_SCORE:
+            by_matrix.setdefault(csv_type, []).append((key, score))
+    return {csv_type: _top(items) for csv_type, items in by_matrix.items()}
+
+
+def build_control_index(matrices: Dict[str, List[List[str]]]) -> Dict[str, Any]:
+    """
+    Índice de las matrices de solo lectura (Anexo A, COBIT y NIST): IDF
+    suavizado de su vocabulario, vector TF-IDF de cada fila y filas
+    relacionadas entre ellas. Los activos de MAGERIT se comparan con estos
+    vectores (ver AssetMapping), por lo que editarlos no cambia el índice.
+
+    Returns:
+        Dict con labels, vectors (matriz -> clave -> término -> peso), idf
+        y neighbors (matriz -> clave -> matriz -> [[clave, similitud], ...])
+    """
+    labels: Dict[str, Dict[str, str]] = {}
+    counts: Dict[DocId, Dict[str, int]] = {}
+    for csv_type in CONTROL_TYPES:
+        labels[csv_type] = {}
+        for position, row in enumerate(matrices.get(csv_type, [])):
+            key, label, terms = _document(csv_type, position, row)
+            labels[csv_type][key] = label
+            counts[(csv_type, key)] = terms
+
+    # Frecuencia de documento e IDF suavizado
+    n_docs = len(counts)
+    df: Dict[str, int] = {}
+    for terms in counts.values():
+        for term in terms:
+            df[term] = df.get(term, 0) + 1
+    max_df = max(2, int(n_docs * MAX_DF_RATIO))
+    idf = {term: math.log((1 + n_docs) / (1 + d)) + 1 for term, d in df.items() if d <= max_df}
+
+    vectors: Dict[str, Dict[str, Dict[str, float]]] = {csv_type: {} for csv_type in CONTROL_TYPES}
+    for (csv_type, key), terms in counts.items():
+        vector = _vector(terms, idf)
+        if vector:
+            vectors[csv_type][key] = vector
+
+    # Producto punto solo entre filas que comparten términos (matriz dispersa)
+    postings = _postings(vectors)
+    neighbors = {csv_type: {key: {} for key in labels[csv_type]} for csv_type in CONTROL_TYPES}
+    for csv_type, by_key in vectors.items():
+        for key, vector in by_key.items():
+            neighbors[csv_type][key] = _group(_scores(vector, postings, csv_type))
+
+    return {'labels': labels, 'vectors': vectors, 'idf': idf, 'neighbors': neighbors}
+
+
+def _apply_overrides(scores: Dict[DocId, float], changes: Dict[str, Any],
+                     by_label: Dict[str, Dict[str, str]]):
+    """
+    Fija (similitud 1) o elimina las relaciones de un activo indicadas a
+    mano: {"nist": {"add": ["Análisis de riesgos"], "remove": [...]}}.
+    Los controles se indican por su nombre; lo que no se reconoce se ignora.
+    """
+    for csv_type, change in changes.items():
+        if not isinstance(change, dict):
+            continue
+        for action, value in (('add', 1.0), ('remove', None)):
+            names = change.get(action)
+            if not isinstance(names, list):
+                continue
+            for name in names:
+                key = by_label.get(csv_type, {}).get(' '.join(tokenize(str(name))))
+                if key is None:
+                    continue
+                if value is None:
+                    scores.pop((csv_type, key), None)
+                else:
+                    scores[(csv_type, key)] = value
+
+
+class AssetMapping:
+    """
+    Relaciones de los activos de MAGERIT con un índice de controles fijo
+    (ver build_control_index). Cada activo se compara por separado, así un
+    alta o una edición recalcula solo su fila; las listas de activos de cada
+    control se ordenan al consultarlas.
+    """
+
+    def __init__(self, base: Dict[str, Any], overrides: Optional[Dict[str, Any]] = None):
+        self.base = base
+        self.overrides = {str(asset).strip(): changes for asset, changes in (overrides or {}).items()}
+        self.postings = _postings(base['vectors'])
+        self.by_label = {
+            csv_type: {' '.join(tokenize(label)): key for key, label in keys.items()}
+            for csv_type, keys in base['labels'].items()
+        }
+        self.labels: Dict[str, str] = {}
+        self.neighbors: Dict[str, Dict[str, List[List[Any]]]] = {}
+        # Similitudes de cada activo y, por control, las de cada activo
+        self.scores: Dict[str, Dict[DocId, float]] = {}
+        self.control_assets: Dict[DocId, Dict[str, float]] = {}
+        self.rescored = 0
+
+    def reset(self, rows: Iterable[List[str]]):
+        """Compara todos los activos de la matriz"""
+        self.labels, self.neighbors, self.scores, self.control_assets = {}, {}, {}, {}
+        for row in rows:
+            self.update(row)
+
+    def update(self, row: List[str]):
+        """Compara un activo nuevo o editado"""
+        key, label, terms = _document('magerit', 0, row)
+        for doc_id in self.scores.pop(key, {}):
+            self.control_assets[doc_id].pop(key, None)
+
+        scores = _scores(_vector(terms, self.base['idf']), self.postings, 'magerit')
+        changes = self.overrides.get(key)
+        if isinstance(changes, dict):
+            _apply_overrides(scores, changes, self.by_label)
+        scores = {doc_id: score for doc_id, score in scores.items() if score >= MIN_SCORE}
+
+        self.labels[key] = label
+        self.neighbors[key] = _group(scores)
+        self.scores[key] = scores
+        for doc_id, score in scores.items():
+            self.control_assets.setdefault(doc_id, {})[key] = score
+        self.rescored += 1
+
+    def keys(self, csv_type: str) -> List[str]:
+        """Claves de las filas de una matriz"""
+        if csv_type == 'magerit':
+            return list(self.labels)
+        return list(self.base['labels'].get(csv_type, {}))
+
+    def label(self, csv_type: str, key: str) -> str:
+        return self.labels[key] if csv_type == 'magerit' else self.base['labels'][csv_type][key]
+
+    def related(self, csv_type: str, key: str) -> Optional[Dict[str, List[List[Any]]]]:
+        """Filas relacionadas de una fila por matriz (None si la fila no existe)"""
+        if csv_type == 'magerit':
+            return self.neighbors.get(key)
+        row = self.base['neighbors'].get(csv_type, {}).get(key)
+        if row is None:
+            return None
+        assets = self.control_assets.get((csv_type, key))
+        return dict(row, magerit=_top(assets.items())) if assets else row
+
+    def mapping(self) -> Dict[str, Any]:
+        """Mapeo completo: labels y neighbors de las 4 matrices"""
+        return {
+            'labels': dict(self.base['labels'], magerit=dict(self.labels)),
+            'neighbors': {csv_type: {key: self.related(csv_type, key) for key in self.keys(csv_type)}
+                          for csv_type in MATRIX_TYPES}
+        }
+
+
+def build_mapping(matrices: Dict[str, List[List[str]]],
+                  overrides: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+    """
+    Calcula desde cero la similitud TF-IDF (coseno) entre las filas de
+    matrices distintas y retorna, para cada fila, sus filas más parecidas
+    de cada una de las otras matrices
+
+    Args:
+        matrices: Filas de datos de cada matriz
+        overrides: Relaciones fijadas a mano entre activos de MAGERIT y
+            controles ({"<N° activo>": {"nist": {"add": [...], "remove": [...]}}})
+
+    Returns:
+        Dict con labels (nombre de cada fila) y neighbors
+        (matriz -> clave -> matriz -> [[clave, similitud], ...])
+    """
+    assets = AssetMapping(build_control_index(matrices), overrides)
+    assets.reset(matrices.get('magerit', []))
+    return assets.mapping()
+
+
+class ControlMapper:
+    """
+    Mantiene el mapeo entre matrices. El índice de las matrices de solo
+    lectura se guarda comprimido en .isoapp/ (control_mapping.json.gz) con
+    sus versiones y solo se recalcula cuando cambia alguna de ellas. Los
+    activos de MAGERIT se comparan con ese índice en memoria: cada alta o
+    edición recalcula solo su fila, y un cambio en el archivo de relaciones
+    manuales, las de todos los activos.
+    """
+
+    OVERRIDES_FILE = 'mapping_overrides.json'
+
+    def __init__(self, processor):
+        self.processor = processor
+        self.path = os.path.join(processor.state_dir, 'control_mapping.json.gz')
+        self.overrides_path = os.path.join(processor.base_path, self.OVERRIDES_FILE)
+        self._assets: Optional[AssetMapping] = None
+        self._base_versions: Optional[Dict[str, str]] = None
+        self._overrides_version: Optional[str] = None
+        # Filas de MAGERIT por N° de activo y las que cambiaron desde la última consulta
+        self._rows: Dict[str, List[str]] = {}
+        self._pending: Dict[str, List[str]] = {}
+        self._pending_reset = False
+        self._pending_lock = threading.Lock()
+        self._listening = False
+        self._lock = threading.Lock()
+        self.rebuilds = 0
+
+    def _overrides_signature(self) -> str:
+        try:
+            st = os.stat(self.overrides_path)
+        except FileNotFoundError:
+            return ''
+        return f'{st.st_mtime_ns}-{st.st_size}'
+
+    def versions(self) -> Dict[str, str]:
+        """Versiones de las 4 matrices y del archivo de relaciones manuales"""
+        versions = self.processor.get_data_versions()
+        versions['overrides'] = self._overrides_signature()
+        return versions
+
+    def _load(self) -> Optional[Dict[str, Any]]:
+        try:
+            with gzip.open(self.path, 'rt', encoding='utf-8') as f:
+                base = json.load(f)
+        except (FileNotFoundError, OSError, ValueError):
+            return None
+        return base if base.get('format') == MAPPING_FORMAT else None
+
+    def _save(self, base: Dict[str, Any]):
+        os.makedirs(self.processor.state_dir, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=self.processor.state_dir, prefix='.mapping-')
+        try:
+            with os.fdopen(fd, 'wb') as raw, gzip.GzipFile(fileobj=raw, mode='wb', mtime=0) as f:
+                f.write(json.dumps(base, ensure_ascii=False, separators=(',', ':')).encode('utf-8'))
+            os.replace(tmp_path, self.path)
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.unlink(tmp_path)
+            raise
+
+    def _read_overrides(self) -> Dict[str, Any]:
+        """Relaciones manuales; un archivo con errores se ignora (y se registra)"""
+        try:
+            with open(self.overrides_path, 'r', encoding='utf-8') as f:
+                overrides = json.load(f)
+        except FileNotFoundError:
+            return {}
+        except (OSError, ValueError) as e:
+            logger.warning("Se ignora %s: %s", self.overrides_path, e)
+            return {}
+        if not isinstance(overrides, dict):
+            logger.warning("Se ignora %s: debe ser un objeto JSON", self.overrides_path)
+            return {}
+        return overrides
+
+    def _control_index(self, versions: Dict[str, str]) -> Dict[str, Any]:
+        """Índice de las matrices de solo lectura, del disco si otro worker ya lo calculó"""
+        base = self._load()
+        if base is None or base['versions'] != versions:
+            base = build_control_index({csv_type: self.processor.get_data(csv_type).get('data', [])
+                                        for csv_type in CONTROL_TYPES})
+            base['format'] = MAPPING_FORMAT
+            base['versions'] = versions
+            self._save(base)
+            self.rebuilds += 1
+        return base
+
+    def _on_magerit_change(self, rows: List[List[str]], reset: bool):
+        """Anota las filas de MAGERIT que cambiaron (llamado por el CSVProcessor con su estado bloqueado)"""
+        with self._pending_lock:
+            if reset:
+                self._pending = {}
+                self._pending_reset = True
+            for row in rows:
+                self._pending[row[0].strip()] = row
+
+    def _pull(self) -> Tuple[Dict[str, str], str]:
+        """Trae los cambios de MAGERIT (sin tomar _lock) y retorna las versiones del índice"""
+        if not self._listening:
+            with self._lock:
+                if not self._listening:
+                    # Se llama de inmediato con la matriz completa
+                    self.processor.add_change_listener(self._on_magerit_change)
+                    self._listening = True
+        else:
+            # Lee el diario: los cambios de otros procesos llegan por _on_magerit_change
+            self.processor.get_magerit_version()
+        return ({csv_type: self.processor.get_data_version(csv_type) for csv_type in CONTROL_TYPES},
+                self._overrides_signature())
+
+    def _current(self, base_versions: Dict[str, str], overrides_version: str) -> AssetMapping:
+        """Aplica los cambios pendientes y retorna el mapeo al día (con _lock tomado)"""
+        assets = self._assets
+        full = (assets is None or base_versions != self._base_versions
+                or overrides_version != self._overrides_version)
+        if full:
+            base = (assets.base if assets is not None and base_versions == self._base_versions
+                    else self._control_index(base_versions))
+            assets = AssetMapping(base, self._read_overrides())
+            self._base_versions, self._overrides_version = base_versions, overrides_version
+
+        with self._pending_lock:
+            pending, reset = self._pending, self._pending_reset
+            self._pending, self._pending_reset = {}, False
+        if reset:
+            self._rows = pending
+        else:
+            self._rows.update(pending)
+
+        if full or reset:
+            assets.reset(self._rows.values())
+        else:
+            for row in pending.values():
+                assets.update(row)
+        self._assets = assets
+        return assets
+
+    def refresh(self):
+        """Pone el mapeo al día (por ejemplo, en la precarga)"""
+        versions = self._pull()
+        with self._lock:
+            self._current(*versions)
+
+    def get_mapping(self) -> Dict[str, Any]:
+        """Retorna el mapeo vigente completo (labels y neighbors de las 4 matrices)"""
+        versions = self._pull()
+        with self._lock:
+            return self._current(*versions).mapping()
+
+    def related(self, csv_type: str, key: str, limit: int = TOP_K) -> Dict[str, List[Dict[str, Any]]]:
+        """
+        Filas de las otras matrices relacionadas con una fila
+
+        Args:
+            csv_type: Matriz de la fila ('magerit', 'anexo_a', 'cobit', 'nist')
+            key: N° de activo en MAGERIT o posición de la fila en las demás
+            limit: Máximo de filas por matriz
+
+        Returns:
+            Dict matriz -> [{'id', 'nombre', 'similitud'}, ...]
+        """
+        if csv_type not in MATRIX_TYPES:
+            raise ValueError(f"Tipo de CSV no válido: {csv_type}")
+        versions = self._pull()
+        with self._lock:
+            return self._related(self._current(*versions), csv_type, str(key).strip(), limit)
+
+    def related_all(self, csv_type: str, limit: int = 1) -> Dict[str, Dict[str, List[Dict[str, Any]]]]:
+        """Filas relacionadas de todas las filas de una matriz (para las vistas)"""
+        versions = self._pull()
+        with self._lock:
+            assets = self._current(*versions)
+            return {key: self._related(assets, csv_type, key, limit) for key in assets.keys(csv_type)}
+
+    @staticmethod
+    def _related(assets: AssetMapping, csv_type: str, key: str,
+                 limit: int) -> Dict[str, List[Dict[str, Any]]]:
+        row = assets.related(csv_type, key)
+        if row is None:
+            raise KeyError(f"No existe la fila {key} en {csv_type}")
+        return {
+            other: [
+                {'id': target, 'nombre': assets.label(other, target), 'similitud': score}
+                for target, score in row.get(other, [])[:limit]
+            ]
+            for other in MATRIX_TYPES if other != csv_type
+        }
+
+    def stats(self) -> Dict[str, Any]:
+        """Tamaño del mapeo y cantidad de recálculos del índice y de activos"""
+        with self._lock:
+            assets = self._assets
+            pairs = 0
+            if assets is not None:
+                pairs = sum(len(items) for csv_type in MATRIX_TYPES for key in assets.keys(csv_type)
+                            for items in assets.related(csv_type, key).values())
+            return {
+                'recalculos': self.rebuilds,
+                'activos_recalculados': assets.rescored if assets is not None else 0,
+                'relaciones': pairs
+            }
@@ -0,0 +1,72 @@
+"""
+Caché en memoria de las matrices ya procesadas
+"""
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, Hashable, Optional
+
+
+class MatrixCache:
+    """
+    Caché compartida por proceso para los resultados de leer y estructurar
+    los CSV. Cada entrada se asocia a una ruta de archivo y a una firma de
+    versión (mtime/tamaño); si la firma cambia, la entrada se considera
+    obsoleta y se vuelve a procesar el archivo.
+    """
+
+    def __init__(self, max_files: int = 64):
+        self.max_files = max_files
+        self._entries: 'OrderedDict[str, Dict[str, tuple]]' = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+
+    def get(self, path: str, signature: Hashable, kind: str = 'data') -> Optional[Any]:
+        """Retorna el valor cacheado si la firma coincide, o None"""
+        with self._lock:
+            kinds = self._entries.get(path)
+            entry = kinds.get(kind) if kinds else None
+            if entry is None or entry[0] != signature:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(path)
+            self.hits += 1
+            return entry[1]
+
+    def put(self, path: str, signature: Hashable, value: Any, kind: str = 'data'):
+        """Guarda un valor asociado a la firma actual del archivo"""
+        with self._lock:
+            kinds = self._entries.setdefault(path, {})
+            # Descartar variantes calculadas sobre una versión anterior
+            for other in [k for k, e in kinds.items() if e[0] != signature]:
+                del kinds[other]
+            kinds[kind] = (signature, value)
+            self._entries.move_to_end(path)
+            while len(self._entries) > self.max_files:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, path: Optional[str] = None):
+        """Elimina las entradas de un archivo (o todas si no se indica)"""
+        with self._lock:
+            if path is None:
+                self._entries.clear()
+            else:
+                self._entries.pop(path, None)
+            self.invalidations += 1
+
+    def stats(self) -> Dict[str, Any]:
+        """Retorna los contadores de aciertos y fallos"""
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'invalidations': self.invalidations,
+                'entries': sum(len(k) for k in self._entries.values()),
+                'hit_rate': round(self.hits / total, 4) if total else 0.0
+            }
+
+
+# Instancia compartida por todos los CSVProcessor del proceso
+matrix_cache = MatrixCache()
@@ -0,0 +1,195 @@
+"""
+Paginación, proyección de columnas y filtros sobre las matrices estructuradas
+"""
+import re
+import unicodedata
+from typing import Any, Callable, Dict, Iterator, List, Optional, Sequence, Tuple
+
+from .risk import classify_residual_risk
+
+
+MAX_PAGE_SIZE = 1000
+
+_CLASS_IN_TEXT = re.compile(r'\(([^)]+)\)\s*$')
+_LAST_NUMBER = re.compile(r'=\s*(-?\d+(?:[.,]\d+)?)')
+
+
+def normalize_value(text: str) -> str:
+    """Normaliza un valor para compararlo sin mayúsculas, tildes ni espacios extra"""
+    decomposed = unicodedata.normalize('NFKD', text)
+    folded = ''.join(ch for ch in decomposed if not unicodedata.combining(ch))
+    return ' '.join(folded.casefold().split())
+
+
+def residual_risk_class(row: Sequence[str]) -> str:
+    """
+    Clasificación del riesgo residual de una fila de MAGERIT: la que indica
+    el texto ("... = 1,75 (Riesgo Medio-Bajo)") o, si falta, la calculada
+    """
+    text = row[10] if len(row) > 10 else ''
+    match = _CLASS_IN_TEXT.search(text)
+    if match:
+        return match.group(1).strip()
+    number = _LAST_NUMBER.search(text)
+    if number:
+        return classify_residual_risk(float(number.group(1).replace(',', '.')))
+    return ''
+
+
+def _column(position: int) -> Callable[[Sequence[str]], str]:
+    return lambda row: row[position] if len(row) > position else ''
+
+
+# Filtros disponibles en cada matriz: nombre -> función que extrae el valor de la fila
+MATRIX_FILTERS: Dict[str, Dict[str, Callable[[Sequence[str]], str]]] = {
+    'magerit': {
+        'tipo_activo': _column(1),
+        'clasificacion': residual_risk_class
+    },
+    'anexo_a': {
+        'categoria': _column(0),
+        'responsable': _column(4)
+    },
+    'cobit': {
+        'proceso': _column(0)
+    },
+    'nist': {
+        'funcion': _column(0),
+        'responsable': _column(4)
+    }
+}
+
+
+class MatrixIndex:
+    """
+    Índices invertidos por columna (valor normalizado -> posiciones de las
+    filas) de una versión de la matriz. Se construyen una vez por versión y
+    permiten filtrar sin recorrer todas las filas.
+    """
+
+    def __init__(self, csv_type: str, rows: Sequence[Sequence[str]]):
+        self.csv_type = csv_type
+        self.rows = rows
+        self.size = len(rows)
+        self.postings: Dict[str, Dict[str, List[int]]] = {}
+        self.values: Dict[str, Dict[str, int]] = {}
+
+        for name, extract in MATRIX_FILTERS.get(csv_type, {}).items():
+            postings: Dict[str, List[int]] = {}
+            values: Dict[str, int] = {}
+            for position, row in enumerate(rows):
+                value = extract(row).strip()
+                postings.setdefault(normalize_value(value), []).append(position)
+                values[value] = values.get(value, 0) + 1
+            self.postings[name] = postings
+            self.values[name] = values
+
+    def select(self, filters: Dict[str, List[str]]) -> List[int]:
+        """
+        Posiciones de las filas que cumplen todos los filtros (dentro de un
+        mismo filtro basta con que coincida uno de los valores)
+        """
+        selected = None
+        for name, wanted in filters.items():
+            if name not in self.postings:
+                valid = ', '.join(sorted(self.postings)) or 'ninguno'
+                raise ValueError(f"Filtro '{name}' no válido para {self.csv_type} (disponibles: {valid})")
+            matches = set()
+            for value in wanted:
+                matches.update(self.postings[name].get(normalize_value(value), ()))
+            selected = matches if selected is None else selected & matches
+        if selected is None:
+            return list(range(self.size))
+        return sorted(selected)
+
+
+def _resolve_fields(headers: Sequence[str], fields: Sequence[str]) -> List[int]:
+    """Convierte nombres de columna (o posiciones) en posiciones"""
+    by_name = {normalize_value(h): i for i, h in reversed(list(enumerate(headers))) if h}
+    positions = []
+    for field in fields:
+        key = field.strip()
+        if key.isdigit() and int(key) < len(headers):
+            positions.append(int(key))
+        elif normalize_value(key) in by_name:
+            positions.append(by_name[normalize_value(key)])
+        else:
+            raise ValueError(f"Columna '{field}' no existe")
+    return positions
+
+
+def query_matrix(data: Dict[str, Any], index: MatrixIndex,
+                 filters: Optional[Dict[str, List[str]]] = None,
+                 fields: Optional[Sequence[str]] = None,
+                 offset: int = 0, limit: Optional[int] = None) -> Dict[str, Any]:
+    """
+    Aplica filtros, proyección de columnas y paginación a una matriz
+    estructurada
+
+    Args:
+        data: Matriz estructurada (metadata, headers, data)
+        index: Índice de la misma versión de la matriz
+        filters: Valores aceptados por cada filtro (ver MATRIX_FILTERS)
+        fields: Columnas a incluir, por nombre de encabezado o posición
+        offset: Primera fila a retornar dentro del resultado filtrado
+        limit: Cantidad máxima de filas (hasta MAX_PAGE_SIZE)
+
+    Returns:
+        Dict con metadata, headers y data (solo la página pedida) más
+        total, offset, limit y next_offset (None en la última página)
+    """
+    if offset < 0:
+        raise ValueError("offset no puede ser negativo")
+    if limit is not None and not 1 <= limit <= MAX_PAGE_SIZE:
+        raise ValueError(f"limit debe estar entre 1 y {MAX_PAGE_SIZE}")
+
+    headers = data.get('headers', [])
+    rows = data.get('data', [])
+    positions = index.select(filters or {})
+    total = len(positions)
+    end = total if limit is None else min(offset + limit, total)
+    page = [rows[p] for p in positions[offset:end]]
+
+    if fields:
+        columns = _resolve_fields(headers, fields)
+        headers = [headers[c] for c in columns]
+        page = [[row[c] if c < len(row) else '' for c in columns] for row in page]
+
+    return {
+        'metadata': data.get('metadata', []),
+        'headers': headers,
+        'data': page,
+        'total': total,
+        'offset': offset,
+        'limit': limit,
+        'next_offset': end if end < total else None
+    }
+
+
+def iter_matrix(data: Dict[str, Any], index: Optional[MatrixIndex],
+                filters: Optional[Dict[str, List[str]]] = None,
+                fields: Optional[Sequence[str]] = None) -> Tuple[List[str], Iterator[List[str]]]:
+    """
+    Encabezados y filas (todas, sin paginar) de una matriz con filtros y
+    proyección de columnas; las filas se recorren a medida que se piden, sin
+    copiar la matriz. Filtros y columnas se validan antes de retornar.
+
+    Args:
+        data: Matriz estructurada (metadata, headers, data)
+        index: Índice de la misma versión de la matriz (solo se usa con filtros)
+        filters: Valores aceptados por cada filtro (ver MATRIX_FILTERS)
+        fields: Columnas a incluir, por nombre de encabezado o posición
+    """
+    headers = list(data.get('headers', []))
+    rows = data.get('data', [])
+    positions = index.select(filters) if filters else None
+    columns = _resolve_fields(headers, fields) if fields else None
+    if columns is not None:
+        headers = [headers[c] for c in columns]
+
+    def generate() -> Iterator[List[str]]:
+        selected = rows if positions is None else (rows[p] for p in positions)
+        for row in selected:
+            yield row if columns is None else [row[c] if c < len(row) else '' for c in columns]
+
+    return headers, generate()
@@ -0,0 +1,190 @@
+"""
+Métricas de rendimiento (latencia de rutas, lectura/escritura de matrices,
+reportes y cachés) en formato de texto de Prometheus
+"""
+import bisect
+import logging
+import os
+import threading
+import time
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterable, Iterator, List, Optional, Sequence, Tuple
+
+
+# Límites de los buckets de latencia (segundos)
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+# Límites de los buckets de tamaño (bytes)
+SIZE_BUCKETS = tuple(2 ** n for n in range(10, 31, 2))
+# Límites de los buckets de páginas de los reportes
+PAGE_BUCKETS = (1, 2, 5, 10, 20, 50, 100, 200, 500, 1000)
+
+# Muestra de un collector: (etiquetas, valor)
+Sample = Tuple[Dict[str, str], float]
+# Métrica de un collector: (nombre, tipo, descripción, muestras)
+CollectedMetric = Tuple[str, str, str, Iterable[Sample]]
+
+logger = logging.getLogger(__name__)
+
+
+def _escape(value: str) -> str:
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _labels(names: Sequence[str], values: Sequence[str], extra: str = '') -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+def _number(value: float) -> str:
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class _Metric:
+    def __init__(self, name: str, kind: str, help_text: str, label_names: Sequence[str],
+                 buckets: Optional[Sequence[float]] = None):
+        self.name = name
+        self.kind = kind
+        self.help = help_text
+        self.label_names = tuple(label_names)
+        self.buckets = tuple(buckets) if buckets else None
+        # Contador: etiquetas -> valor; histograma: etiquetas -> [conteos por bucket, suma, total]
+        self.values: Dict[Tuple[str, ...], object] = {}
+
+
+class Metrics:
+    """
+    Registro de contadores e histogramas. Deshabilitado, observe/inc/timer
+    retornan de inmediato y la aplicación no registra sus hooks, por lo que
+    el costo es una comparación por llamada.
+    """
+
+    def __init__(self, enabled: bool = False, slow_request_seconds: float = 1.0):
+        self.enabled = enabled
+        self.slow_request_seconds = slow_request_seconds
+        self._metrics: Dict[str, _Metric] = {}
+        self._collectors: List[Callable[[], Iterable[CollectedMetric]]] = []
+        self._lock = threading.Lock()
+
+    def counter(self, name: str, help_text: str, label_names: Sequence[str] = ()):
+        """Declara un contador (valor que solo aumenta)"""
+        self._metrics[name] = _Metric(name, 'counter', help_text, label_names)
+
+    def histogram(self, name: str, help_text: str, label_names: Sequence[str] = (),
+                  buckets: Sequence[float] = LATENCY_BUCKETS):
+        """Declara un histograma con los límites de bucket indicados"""
+        self._metrics[name] = _Metric(name, 'histogram', help_text, label_names, buckets)
+
+    def add_collector(self, collector: Callable[[], Iterable[CollectedMetric]]):
+        """
+        Registra una función que se llama al exportar y retorna métricas
+        calculadas en ese momento (por ejemplo, contadores de las cachés)
+        """
+        self._collectors.append(collector)
+
+    def inc(self, name: str, value: float = 1, labels: Sequence[str] = ()):
+        """Suma value al contador name"""
+        if not self.enabled:
+            return
+        metric = self._metrics[name]
+        key = tuple(labels)
+        with self._lock:
+            metric.values[key] = metric.values.get(key, 0) + value
+
+    def observe(self, name: str, value: float, labels: Sequence[str] = ()):
+        """Registra una observación en el histograma name"""
+        if not self.enabled:
+            return
+        metric = self._metrics[name]
+        key = tuple(labels)
+        position = bisect.bisect_left(metric.buckets, value)
+        with self._lock:
+            entry = metric.values.get(key)
+            if entry is None:
+                entry = metric.values[key] = [[0] * len(metric.buckets), 0.0, 0]
+            if position < len(metric.buckets):
+                entry[0][position] += 1
+            entry[1] += value
+            entry[2] += 1
+
+    @contextmanager
+    def timer(self, name: str, labels: Sequence[str] = ()) -> Iterator[None]:
+        """Mide la duración del bloque en el histograma name"""
+        if not self.enabled:
+            yield
+            return
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - started, labels)
+
+    def render(self) -> str:
+        """Todas las métricas en formato de texto de Prometheus (versión 0.0.4)"""
+        lines: List[str] = []
+        with self._lock:
+            snapshot = [
+                (metric, {key: (value if metric.kind == 'counter' else [list(value[0]), value[1], value[2]])
+                          for key, value in metric.values.items()})
+                for metric in self._metrics.values()
+            ]
+
+        for metric, values in snapshot:
+            lines.append(f'# HELP {metric.name} {metric.help}')
+            lines.append(f'# TYPE {metric.name} {metric.kind}')
+            for key in sorted(values):
+                if metric.kind == 'counter':
+                    lines.append(f'{metric.name}{_labels(metric.label_names, key)} {_number(values[key])}')
+                    continue
+                counts, total, count = values[key]
+                cumulative = 0
+                for limit, bucket_count in zip(metric.buckets, counts):
+                    cumulative += bucket_count
+                    le = f'le="{_number(float(limit))}"'
+                    lines.append(f'{metric.name}_bucket{_labels(metric.label_names, key, le)} {cumulative}')
+                inf = 'le="+Inf"'
+                lines.append(f'{metric.name}_bucket{_labels(metric.label_names, key, inf)} {count}')
+                lines.append(f'{metric.name}_sum{_labels(metric.label_names, key)} {_number(total)}')
+                lines.append(f'{metric.name}_count{_labels(metric.label_names, key)} {count}')
+
+        for collector in self._collectors:
+            try:
+                collected = list(collector())
+            except Exception:
+                logger.exception('Error al calcular métricas')
+                continue
+            for name, kind, help_text, samples in collected:
+                lines.append(f'# HELP {name} {help_text}')
+                lines.append(f'# TYPE {name} {kind}')
+                for labels, value in samples:
+                    names = sorted(labels)
+                    lines.append(f'{name}{_labels(names, [labels[n] for n in names])} {_number(value)}')
+
+        return '\n'.join(lines) + '\n'
+
+
+# Registro del proceso (ISOAPP_METRICS=1 lo habilita; cada worker exporta el suyo)
+metrics = Metrics(
+    enabled=os.environ.get('ISOAPP_METRICS', '') not in ('', '0', 'false', 'no'),
+    slow_request_seconds=float(os.environ.get('ISOAPP_SLOW_REQUEST_SECONDS', 1.0))
+)
+
+metrics.histogram('isoapp_request_duration_seconds', 'Duración de las solicitudes HTTP por ruta',
+                  ('endpoint', 'method', 'status'))
+metrics.counter('isoapp_slow_requests_total', 'Solicitudes más lentas que ISOAPP_SLOW_REQUEST_SECONDS',
+                ('endpoint',))
+metrics.histogram('isoapp_matrix_read_seconds', 'Duración de la lectura de una matriz', ('matrix', 'storage'))
+metrics.counter('isoapp_matrix_read_bytes_total', 'Bytes de matrices leídos', ('matrix', 'storage'))
+metrics.histogram('isoapp_matrix_write_seconds', 'Duración de la escritura completa de una matriz',
+                  ('matrix', 'storage'))
+metrics.counter('isoapp_matrix_write_bytes_total', 'Bytes de matrices escritos', ('matrix', 'storage'))
+metrics.counter('isoapp_risk_calculation_errors_total',
+                'Filas de MAGERIT cuyos riesgos no se pudieron recalcular')
+metrics.counter('isoapp_history_errors_total',
+                'Escrituras de MAGERIT que no se pudieron guardar en el historial')
+metrics.histogram('isoapp_report_build_seconds', 'Duración de la generación de un reporte PDF')
+metrics.histogram('isoapp_report_pages', 'Páginas de los reportes generados', buckets=PAGE_BUCKETS)
+metrics.histogram('isoapp_report_bytes', 'Tamaño de los reportes generados', buckets=SIZE_BUCKETS)
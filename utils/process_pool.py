@@ -0,0 +1,69 @@
+"""
+Pool de procesos compartido por los trabajos pesados de un módulo
+(simulaciones, secciones del reporte)
+"""
+import logging
+import multiprocessing
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Any, Callable, Iterable, List, Optional
+
+
+logger = logging.getLogger(__name__)
+
+
+def _context():
+    """
+    forkserver (spawn donde no existe): los workers no se crean con fork
+    desde un proceso web que ya tiene hilos y bloqueos tomados
+    """
+    methods = multiprocessing.get_all_start_methods()
+    return multiprocessing.get_context('forkserver' if 'forkserver' in methods else 'spawn')
+
+
+class SharedProcessPool:
+    """
+    ProcessPoolExecutor que se crea la primera vez que se usa y se
+    descarta si un worker muere (BrokenProcessPool): la siguiente llamada
+    arma uno nuevo en lugar de fallar para siempre.
+    """
+
+    def __init__(self, max_workers: int, name: str):
+        self.max_workers = max_workers
+        self.name = name
+        self._pool: Optional[ProcessPoolExecutor] = None
+        self._lock = threading.Lock()
+        self.restarts = 0
+
+    def get(self) -> ProcessPoolExecutor:
+        """Retorna el pool, creándolo si no existe"""
+        with self._lock:
+            if self._pool is None:
+                self._pool = ProcessPoolExecutor(max_workers=self.max_workers, mp_context=_context())
+            return self._pool
+
+    def map(self, fn: Callable[..., Any], *iterables: Iterable[Any]) -> List[Any]:
+        """
+        Como ProcessPoolExecutor.map, esperando todos los resultados
+
+        Raises:
+            BrokenProcessPool: Si un worker murió; el pool ya quedó descartado
+        """
+        pool = self.get()
+        try:
+            return list(pool.map(fn, *iterables))
+        except BrokenProcessPool:
+            logger.warning("Se reinicia el pool de procesos de %s: un worker terminó inesperadamente", self.name)
+            self.reset(pool)
+            raise
+
+    def reset(self, broken: Optional[ProcessPoolExecutor] = None):
+        """Descarta el pool (solo si sigue siendo broken, cuando se indica)"""
+        with self._lock:
+            pool = self._pool
+            if pool is None or (broken is not None and pool is not broken):
+                return
+            self._pool = None
+            self.restarts += 1
+        pool.shutdown(wait=False, cancel_futures=True)
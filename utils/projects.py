@@ -0,0 +1,260 @@
+"""
+Proyectos: cada proyecto es una carpeta con sus propias matrices. Los
+CSVProcessor de los proyectos se cargan al primer uso y se mantienen en un
+pool LRU acotado por cantidad y por memoria estimada.
+"""
+import json
+import logging
+import os
+import re
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, List, Optional, Union
+
+from .csv_processor import CSVProcessor
+from .live import ChangeFeed
+from .mapping import ControlMapper
+from .matrix_cache import MatrixCache, matrix_cache
+from .report_cache import ReportCache
+from .search import SearchIndex
+from .stats import RiskStats
+from .storage import StorageBackend
+
+
+DEFAULT_PROJECT_TITLE = 'Geotermia con CNN'
+# Archivo opcional de la carpeta del proyecto: {"nombre": "..."}
+PROJECT_FILE = 'proyecto.json'
+
+# Memoria que ocupa un proyecto cargado (filas, índices de consulta, índice
+# de búsqueda y mapeo) por cada byte de sus matrices en disco; medido con
+# tracemalloc sobre las matrices de ejemplo
+MEMORY_FACTOR = 20
+# Memoria de las cachés de reportes de cada proyecto del pool
+PROJECT_REPORT_MEMORY = 4 * 1024 * 1024
+
+logger = logging.getLogger(__name__)
+
+_PROJECT_NAME = re.compile(r'^[A-Za-z0-9][A-Za-z0-9_-]{0,63}$')
+
+
+class ProjectNotFoundError(Exception):
+    """El proyecto solicitado no existe en la carpeta de proyectos"""
+
+    def __init__(self, name: str):
+        super().__init__(f"No existe el proyecto '{name}'")
+        self.name = name
+
+
+def read_project_title(path: str, default: str = DEFAULT_PROJECT_TITLE) -> str:
+    """Nombre del proyecto según proyecto.json (o el indicado por defecto)"""
+    try:
+        with open(os.path.join(path, PROJECT_FILE), 'r', encoding='utf-8') as f:
+            title = json.load(f).get('nombre')
+    except (FileNotFoundError, ValueError, AttributeError):
+        return default
+    return str(title).strip() if title else default
+
+
+class Project:
+    """
+    Un proyecto cargado: su CSVProcessor (con una caché de matrices propia,
+    que se libera junto con el proyecto) más el índice de búsqueda, el
+    mapeo entre marcos y las cachés de reportes que dependen de él.
+    """
+
+    def __init__(self, name: str, path: str, backend: Union[str, StorageBackend] = 'csv',
+                 cache: Optional[MatrixCache] = None,
+                 report_memory_bytes: int = PROJECT_REPORT_MEMORY,
+                 default_title: str = DEFAULT_PROJECT_TITLE):
+        self.name = name
+        self.path = path
+        self.title = read_project_title(path, default_title)
+        self.processor = CSVProcessor(path, cache=cache if cache is not None else MatrixCache(),
+                                      backend=backend)
+        reports_dir = os.path.join(self.processor.state_dir, 'report_cache')
+        self.report_cache = ReportCache(reports_dir, max_memory_bytes=report_memory_bytes)
+        self.section_cache = ReportCache(os.path.join(reports_dir, 'sections'),
+                                         max_memory_bytes=report_memory_bytes)
+        self.control_mapper = ControlMapper(self.processor)
+        self._search_index: Optional[SearchIndex] = None
+        self._risk_stats: Optional[RiskStats] = None
+        self._live_feed: Optional[ChangeFeed] = None
+        self._lock = threading.Lock()
+        self.last_used = time.monotonic()
+        self.processor.start_compaction_worker()
+
+    @property
+    def search_index(self) -> SearchIndex:
+        """Índice de búsqueda, creado (leyendo las 4 matrices) en la primera búsqueda"""
+        if self._search_index is None:
+            with self._lock:
+                if self._search_index is None:
+                    self._search_index = SearchIndex(self.processor)
+        return self._search_index
+
+    @property
+    def risk_stats(self) -> RiskStats:
+        """Estadísticas incrementales, creadas (recorriendo MAGERIT una vez) en la primera consulta"""
+        if self._risk_stats is None:
+            with self._lock:
+                if self._risk_stats is None:
+                    self._risk_stats = RiskStats(self.processor)
+        return self._risk_stats
+
+    @property
+    def live_feed(self) -> ChangeFeed:
+        """Cambios de MAGERIT en vivo, con su hilo iniciado al conectarse el primer cliente"""
+        if self._live_feed is None:
+            with self._lock:
+                if self._live_feed is None:
+                    self._live_feed = ChangeFeed(self.processor)
+        return self._live_feed
+
+    def live_stats(self) -> Optional[Dict[str, Any]]:
+        """Contadores de los cambios en vivo (None si ningún cliente se conectó)"""
+        return self._live_feed.stats() if self._live_feed is not None else None
+
+    def memory_estimate(self) -> int:
+        """Bytes aproximados que ocupa el proyecto cargado"""
+        return (self.processor.backend.footprint() * MEMORY_FACTOR
+                + self.report_cache.stats()['memory_bytes']
+                + self.section_cache.stats()['memory_bytes'])
+
+    def close(self):
+        """
+        Detiene la compactación en segundo plano y los cambios en vivo y
+        deja MAGERIT compactado
+        """
+        if self._live_feed is not None:
+            self._live_feed.close()
+        self.processor.stop_compaction_worker()
+        try:
+            self.processor.compact_magerit()
+        except Exception as e:
+            logger.exception("Error al compactar MAGERIT del proyecto %s: %s", self.name, e)
+
+
+class ProjectPool:
+    """
+    Proyectos en subcarpetas de root (/p/<nombre>/... en la aplicación).
+    Se cargan al primer acceso; cuando hay más de max_projects cargados o
+    su memoria estimada supera memory_budget_bytes se descartan los usados
+    hace más tiempo. El proyecto por defecto (la carpeta de la aplicación)
+    nunca se descarta.
+    """
+
+    def __init__(self, root: str, default_path: str = '.', backend: str = 'csv',
+                 max_projects: int = 16, memory_budget_bytes: int = 512 * 1024 * 1024):
+        self.root = root
+        self.backend = backend
+        self.max_projects = max_projects
+        self.memory_budget_bytes = memory_budget_bytes
+        self._projects: 'OrderedDict[str, Project]' = OrderedDict()
+        self._lock = threading.Lock()
+        self._loading: Dict[str, threading.Lock] = {}
+        self._evict_listeners: List[Callable[[str], None]] = []
+        self.loads = 0
+        self.evictions = 0
+        # El proyecto por defecto usa la caché de matrices compartida del proceso
+        self.default = Project('', default_path, backend, cache=matrix_cache,
+                               report_memory_bytes=32 * 1024 * 1024)
+
+    def add_evict_listener(self, listener: Callable[[str], None]):
+        """Registra una función llamada con el nombre de cada proyecto descartado"""
+        self._evict_listeners.append(listener)
+
+    def project_path(self, name: str) -> str:
+        """Carpeta del proyecto (valida el nombre para no salir de root)"""
+        if not _PROJECT_NAME.match(name):
+            raise ProjectNotFoundError(name)
+        return os.path.join(self.root, name)
+
+    def names(self) -> List[str]:
+        """Proyectos disponibles en la carpeta de proyectos"""
+        try:
+            entries = sorted(os.listdir(self.root))
+        except FileNotFoundError:
+            return []
+        return [name for name in entries
+                if _PROJECT_NAME.match(name) and os.path.isdir(os.path.join(self.root, name))]
+
+    def get(self, name: Optional[str] = None) -> Project:
+        """
+        Retorna el proyecto (cargándolo si hace falta); sin nombre, el
+        proyecto por defecto
+
+        Raises:
+            ProjectNotFoundError: Si el nombre no es válido o la carpeta no existe
+        """
+        if not name:
+            return self.default
+
+        path = self.project_path(name)
+        with self._lock:
+            project = self._projects.get(name)
+            if project is not None:
+                self._projects.move_to_end(name)
+                project.last_used = time.monotonic()
+                return project
+        if not os.path.isdir(path):
+            raise ProjectNotFoundError(name)
+
+        with self._lock:
+            loading = self._loading.setdefault(name, threading.Lock())
+        # Cargar fuera del bloqueo del pool: solo espera quien pide el mismo proyecto
+        with loading:
+            with self._lock:
+                project = self._projects.get(name)
+                if project is not None:
+                    return project
+            try:
+                project = Project(name, path, self.backend)
+            except BaseException:
+                with self._lock:
+                    self._loading.pop(name, None)
+                raise
+            with self._lock:
+                self._projects[name] = project
+                self._loading.pop(name, None)
+                self.loads += 1
+                evicted = self._select_evictions(keep=name)
+
+        for old in evicted:
+            old.close()
+            for listener in self._evict_listeners:
+                listener(old.name)
+        return project
+
+    def loaded(self) -> List[Project]:
+        """El proyecto por defecto más los proyectos cargados en el pool"""
+        with self._lock:
+            return [self.default] + list(self._projects.values())
+
+    def _select_evictions(self, keep: str) -> List[Project]:
+        """Saca del pool los proyectos menos usados hasta cumplir los límites"""
+        evicted = []
+        sizes = {name: p.memory_estimate() for name, p in self._projects.items()}
+        total = sum(sizes.values())
+        for name in list(self._projects):
+            if len(self._projects) <= self.max_projects and total <= self.memory_budget_bytes:
+                break
+            if name == keep:
+                continue
+            evicted.append(self._projects.pop(name))
+            total -= sizes[name]
+            self.evictions += 1
+        return evicted
+
+    def stats(self) -> Dict[str, Any]:
+        """Proyectos cargados, memoria estimada y contadores del pool"""
+        with self._lock:
+            loaded = {name: p.memory_estimate() for name, p in self._projects.items()}
+            return {
+                'cargados': list(loaded),
+                'memoria_estimada': sum(loaded.values()),
+                'limite_memoria': self.memory_budget_bytes,
+                'limite_proyectos': self.max_projects,
+                'cargas': self.loads,
+                'descartes': self.evictions
+            }
@@ -0,0 +1,306 @@
+"""
+Construcción del reporte PDF con ReportLab
+"""
+import io
+import logging
+import os
+import re
+from concurrent.futures.process import BrokenProcessPool
+from datetime import datetime
+from typing import Any, Callable, Dict, List, Optional, Tuple
+from xml.sax.saxutils import escape
+
+from reportlab.lib.pagesizes import A4
+from reportlab.lib import colors
+from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
+from reportlab.platypus import SimpleDocTemplate, Table, TableStyle, Paragraph, Spacer, PageBreak
+from reportlab.lib.units import inch
+
+from .process_pool import SharedProcessPool
+from .projects import DEFAULT_PROJECT_TITLE
+from .report_cache import report_cache_key
+
+try:
+    from pypdf import PdfWriter, PdfReader
+except ImportError:  # pypdf es opcional: sin él se genera un único documento
+    PdfWriter = PdfReader = None
+
+
+REPORT_SECTIONS = ['magerit', 'anexo_a', 'cobit', 'nist']
+
+# Objetos de página de un PDF ("/Type /Page", no "/Type /Pages")
+_PDF_PAGE = re.compile(rb'/Type\s*/Page(?![A-Za-z])')
+
+# Pool de procesos compartido para renderizar secciones
+_pool = SharedProcessPool(min(len(REPORT_SECTIONS), os.cpu_count() or 1), 'los reportes')
+
+logger = logging.getLogger(__name__)
+
+
+def count_pdf_pages(content: bytes) -> int:
+    """Cantidad de páginas de un PDF generado (sin necesidad de pypdf)"""
+    return len(_PDF_PAGE.findall(content))
+
+
+def _cover_elements(styles, project_title: str = DEFAULT_PROJECT_TITLE) -> List[Any]:
+    """Título e información general del reporte"""
+    elements = []
+
+    # Estilo personalizado para título
+    title_style = ParagraphStyle(
+        'CustomTitle',
+        parent=styles['Heading1'],
+        fontSize=18,
+        textColor=colors.HexColor('#2c3e50'),
+        spaceAfter=30
+    )
+
+    # Título principal
+    title = Paragraph("Reporte de Análisis de Seguridad de la Información", title_style)
+    elements.append(title)
+    elements.append(Spacer(1, 0.2*inch))
+
+    # Información del reporte
+    date_str = datetime.now().strftime('%d/%m/%Y %H:%M')
+    info_text = f"<b>Fecha de generación:</b> {date_str}<br/><b>Proyecto:</b> {escape(project_title)}"
+    elements.append(Paragraph(info_text, styles['Normal']))
+    elements.append(Spacer(1, 0.3*inch))
+    return elements
+
+
+def _section_elements(section: str, data: Dict[str, Any], styles) -> Tuple[List[Any], bool]:
+    """
+    Elementos de una sección del reporte.
+    Retorna (elementos, True si la sección incluye una tabla).
+    """
+    elements = []
+    # MAGERIT
+    if section == 'magerit':
+        elements.append(Paragraph("1. Análisis de Riesgos (MAGERIT)", styles['Heading2']))
+        elements.append(Spacer(1, 0.1*inch))
+
+        magerit_data = data
+        if magerit_data['data']:
+            # Preparar datos para la tabla
+            table_data = [magerit_data['headers'][:6]]  # Solo primeras 6 columnas
+            for row in magerit_data['data']:
+                table_data.append(row[:6])
+
+            # Crear tabla
+            t = Table(table_data, repeatRows=1)
+            t.setStyle(TableStyle([
+                ('BACKGROUND', (0, 0), (-1, 0), colors.grey),
+                ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke),
+                ('ALIGN', (0, 0), (-1, -1), 'CENTER'),
+                ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
+                ('FONTSIZE', (0, 0), (-1, 0), 8),
+                ('FONTSIZE', (0, 1), (-1, -1), 7),
+                ('BOTTOMPADDING', (0, 0), (-1, 0), 12),
+                ('BACKGROUND', (0, 1), (-1, -1), colors.beige),
+                ('GRID', (0, 0), (-1, -1), 1, colors.black)
+            ]))
+            elements.append(t)
+            return elements, True
+    # ANEXO A
+    if section == 'anexo_a':
+        elements.append(Paragraph("2. Controles ISO 27001 (Anexo A)", styles['Heading2']))
+        elements.append(Spacer(1, 0.1*inch))
+
+        anexo_data = data
+        if anexo_data['data']:
+            table_data = [anexo_data['headers'][:4]]
+            for row in anexo_data['data'][:10]:  # Primeras 10 filas
+                table_data.append(row[:4])
+
+            t = Table(table_data, repeatRows=1, colWidths=[1.5*inch, 1.5*inch, 2*inch, 2*inch])
+            t.setStyle(TableStyle([
+                ('BACKGROUND', (0, 0), (-1, 0), colors.HexColor('#3498db')),
+                ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke),
+                ('ALIGN', (0, 0), (-1, -1), 'LEFT'),
+                ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
+                ('FONTSIZE', (0, 0), (-1, 0), 8),
+                ('FONTSIZE', (0, 1), (-1, -1), 6),
+                ('BOTTOMPADDING', (0, 0), (-1, 0), 12),
+                ('BACKGROUND', (0, 1), (-1, -1), colors.lightblue),
+                ('GRID', (0, 0), (-1, -1), 1, colors.black),
+                ('VALIGN', (0, 0), (-1, -1), 'TOP')
+            ]))
+            elements.append(t)
+            return elements, True
+    # COBIT
+    if section == 'cobit':
+        elements.append(Paragraph("3. Procesos de Gobernanza TI (COBIT)", styles['Heading2']))
+        elements.append(Spacer(1, 0.1*inch))
+
+        cobit_data = data
+        if cobit_data['data']:
+            table_data = [['Proceso', 'Objetivo', 'KPIs']]
+            for row in cobit_data['data'][:8]:
+                table_data.append([row[0], row[1][:100] + '...', row[4][:80] + '...'])
+
+            t = Table(table_data, repeatRows=1, colWidths=[1.5*inch, 3*inch, 2*inch])
+            t.setStyle(TableStyle([
+                ('BACKGROUND', (0, 0), (-1, 0), colors.HexColor('#e74c3c')),
+                ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke),
+                ('ALIGN', (0, 0), (-1, -1), 'LEFT'),
+                ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
+                ('FONTSIZE', (0, 0), (-1, 0), 8),
+                ('FONTSIZE', (0, 1), (-1, -1), 6),
+                ('BOTTOMPADDING', (0, 0), (-1, 0), 12),
+                ('BACKGROUND', (0, 1), (-1, -1), colors.lightpink),
+                ('GRID', (0, 0), (-1, -1), 1, colors.black),
+                ('VALIGN', (0, 0), (-1, -1), 'TOP')
+            ]))
+            elements.append(t)
+            return elements, True
+    # NIST
+    if section == 'nist':
+        elements.append(Paragraph("4. Marco de Ciberseguridad (NIST)", styles['Heading2']))
+        elements.append(Spacer(1, 0.1*inch))
+
+        nist_data = data
+        if nist_data['data']:
+            table_data = [['Función', 'Control', 'Descripción']]
+            for row in nist_data['data']:
+                table_data.append([row[0], row[1], row[2][:100] + '...'])
+
+            t = Table(table_data, repeatRows=1, colWidths=[1.5*inch, 2*inch, 3*inch])
+            t.setStyle(TableStyle([
+                ('BACKGROUND', (0, 0), (-1, 0), colors.HexColor('#27ae60')),
+                ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke),
+                ('ALIGN', (0, 0), (-1, -1), 'LEFT'),
+                ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
+                ('FONTSIZE', (0, 0), (-1, 0), 8),
+                ('FONTSIZE', (0, 1), (-1, -1), 6),
+                ('BOTTOMPADDING', (0, 0), (-1, 0), 12),
+                ('BACKGROUND', (0, 1), (-1, -1), colors.lightgreen),
+                ('GRID', (0, 0), (-1, -1), 1, colors.black),
+                ('VALIGN', (0, 0), (-1, -1), 'TOP')
+            ]))
+            elements.append(t)
+            return elements, True
+    return elements, False
+
+
+def build_report_pdf(all_data: Dict[str, Dict[str, Any]], include_sections: List[str],
+                     progress: Optional[Callable[[int, str], None]] = None,
+                     project_title: str = DEFAULT_PROJECT_TITLE) -> bytes:
+    """
+    Genera el reporte en PDF con las secciones solicitadas en un solo documento
+
+    Args:
+        all_data: Datos de las 4 matrices (CSVProcessor.get_all_data)
+        include_sections: Secciones a incluir ('magerit', 'anexo_a', 'cobit', 'nist')
+        progress: Función opcional que recibe (porcentaje, mensaje)
+        project_title: Nombre del proyecto que se muestra en la portada
+
+    Returns:
+        Contenido del PDF
+    """
+    def report(pct: int, message: str):
+        if progress is not None:
+            progress(pct, message)
+
+    # Crear buffer para el PDF
+    buffer = io.BytesIO()
+
+    # Crear documento PDF
+    doc = SimpleDocTemplate(buffer, pagesize=A4)
+    styles = getSampleStyleSheet()
+    elements = _cover_elements(styles, project_title)
+    report(10, 'Preparando secciones')
+
+    for position, section in enumerate(REPORT_SECTIONS):
+        if section in include_sections:
+            section_elements, has_table = _section_elements(section, all_data[section], styles)
+            elements.extend(section_elements)
+            if has_table and section != 'nist':
+                elements.append(PageBreak())
+        report(10 + 15 * (position + 1), f'Sección {section} lista')
+
+    # Construir PDF
+    doc.build(elements)
+    report(100, 'Reporte generado')
+    return buffer.getvalue()
+
+
+def _render(elements: List[Any]) -> bytes:
+    """Construye un documento independiente con los elementos dados"""
+    buffer = io.BytesIO()
+    SimpleDocTemplate(buffer, pagesize=A4).build(elements)
+    return buffer.getvalue()
+
+
+def build_section_pdf(section: str, data: Dict[str, Any]) -> bytes:
+    """Genera el PDF de una sola sección (se ejecuta en un proceso del pool)"""
+    elements, _ = _section_elements(section, data, getSampleStyleSheet())
+    return _render(elements)
+
+
+def build_report_pdf_parallel(all_data: Dict[str, Dict[str, Any]], include_sections: List[str],
+                              data_versions: Optional[Dict[str, str]] = None,
+                              section_cache=None, parallel: bool = True,
+                              progress: Optional[Callable[[int, str], None]] = None,
+                              project_title: str = DEFAULT_PROJECT_TITLE) -> bytes:
+    """
+    Genera el reporte renderizando cada sección por separado (en procesos
+    distintos) y uniendo los PDF resultantes. Las secciones se guardan en
+    section_cache según la versión de su matriz, de modo que solo se vuelven
+    a renderizar las matrices que cambiaron. Sin pypdf se recurre a
+    build_report_pdf.
+
+    Args:
+        all_data: Datos de las 4 matrices (CSVProcessor.get_all_data)
+        include_sections: Secciones a incluir
+        data_versions: Versión de los datos de cada matriz (para la caché)
+        section_cache: ReportCache para las secciones renderizadas (opcional)
+        parallel: Renderizar las secciones faltantes en procesos separados
+        progress: Función opcional que recibe (porcentaje, mensaje)
+        project_title: Nombre del proyecto que se muestra en la portada
+    """
+    if PdfWriter is None:
+        return build_report_pdf(all_data, include_sections, progress, project_title)
+
+    def report(pct: int, message: str):
+        if progress is not None:
+            progress(pct, message)
+
+    sections = [section for section in REPORT_SECTIONS if section in include_sections]
+    parts: Dict[str, bytes] = {}
+    keys: Dict[str, str] = {}
+
+    for section in sections:
+        if section_cache is not None and data_versions:
+            keys[section] = report_cache_key([section], {section: data_versions[section]})
+            cached = section_cache.get(keys[section])
+            if cached is not None:
+                parts[section] = cached
+    missing = [section for section in sections if section not in parts]
+    report(10, f'{len(missing)} secciones por generar')
+
+    if missing:
+        rendered = None
+        if parallel and len(missing) > 1 and (os.cpu_count() or 1) > 1:
+            try:
+                rendered = _pool.map(build_section_pdf, missing, [all_data[s] for s in missing])
+            except BrokenProcessPool:
+                # El pool ya se descartó; las secciones se generan en este proceso
+                logger.warning("Secciones del reporte generadas sin procesos auxiliares")
+        if rendered is None:
+            rendered = (build_section_pdf(s, all_data[s]) for s in missing)
+        for done, (section, content) in enumerate(zip(missing, rendered), start=1):
+            parts[section] = content
+            if section in keys:
+                section_cache.put(keys[section], content)
+            report(10 + 70 * done // len(missing), f'Sección {section} lista')
+
+    # Portada (incluye la fecha, por eso no se cachea) y unión de las secciones
+    writer = PdfWriter()
+    for content in [_render(_cover_elements(getSampleStyleSheet(), project_title))] + [parts[s] for s in sections]:
+        for page in PdfReader(io.BytesIO(content)).pages:
+            writer.add_page(page)
+
+    buffer = io.BytesIO()
+    writer.write(buffer)
+    report(100, 'Reporte generado')
+    return buffer.getvalue()
@@ -0,0 +1,124 @@
+"""
+Caché de reportes PDF direccionada por contenido
+"""
+import hashlib
+import json
+import os
+import tempfile
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, Iterable, Optional
+
+
+def report_cache_key(sections: Iterable[str], data_versions: Dict[str, str]) -> str:
+    """
+    Clave del reporte: secciones solicitadas más la versión de los datos
+    de las matrices. Dos solicitudes iguales sobre los mismos datos
+    producen la misma clave.
+    """
+    payload = json.dumps({'sections': sorted(set(sections)), 'versions': data_versions},
+                         sort_keys=True)
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+
+class ReportCache:
+    """
+    Guarda los PDF generados en memoria (LRU acotado por bytes) y en disco
+    (también LRU, usando la fecha de modificación como último acceso).
+    El disco es compartido por todos los workers de la aplicación.
+    """
+
+    def __init__(self, directory: str, max_memory_bytes: int = 32 * 1024 * 1024,
+                 max_disk_bytes: int = 256 * 1024 * 1024):
+        self.directory = directory
+        self.max_memory_bytes = max_memory_bytes
+        self.max_disk_bytes = max_disk_bytes
+        self._memory: 'OrderedDict[str, bytes]' = OrderedDict()
+        self._memory_bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.directory, f'{key}.pdf')
+
+    def _remember(self, key: str, content: bytes):
+        """Agrega a la memoria y expulsa los menos usados si se supera el límite"""
+        if len(content) > self.max_memory_bytes:
+            return
+        with self._lock:
+            if key in self._memory:
+                self._memory.move_to_end(key)
+                return
+            self._memory[key] = content
+            self._memory_bytes += len(content)
+            while self._memory_bytes > self.max_memory_bytes:
+                _, evicted = self._memory.popitem(last=False)
+                self._memory_bytes -= len(evicted)
+
+    def get(self, key: str) -> Optional[bytes]:
+        """Retorna el PDF cacheado o None"""
+        with self._lock:
+            content = self._memory.get(key)
+            if content is not None:
+                self._memory.move_to_end(key)
+                self.hits += 1
+                return content
+
+        path = self._path(key)
+        try:
+            with open(path, 'rb') as f:
+                content = f.read()
+            os.utime(path)
+        except FileNotFoundError:
+            with self._lock:
+                self.misses += 1
+            return None
+
+        with self._lock:
+            self.hits += 1
+        self._remember(key, content)
+        return content
+
+    def put(self, key: str, content: bytes):
+        """Guarda un PDF en memoria y en disco"""
+        self._remember(key, content)
+
+        os.makedirs(self.directory, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=self.directory, prefix='.tmp-')
+        with os.fdopen(fd, 'wb') as f:
+            f.write(content)
+        os.replace(tmp_path, self._path(key))
+        self._evict_disk()
+
+    def _evict_disk(self):
+        """Elimina del disco los reportes usados hace más tiempo hasta cumplir el límite"""
+        entries = []
+        for name in os.listdir(self.directory):
+            if not name.endswith('.pdf'):
+                continue
+            try:
+                st = os.stat(os.path.join(self.directory, name))
+            except FileNotFoundError:
+                continue
+            entries.append((st.st_mtime, st.st_size, name))
+
+        total = sum(size for _, size, _ in entries)
+        for _, size, name in sorted(entries):
+            if total <= self.max_disk_bytes:
+                break
+            try:
+                os.unlink(os.path.join(self.directory, name))
+            except FileNotFoundError:
+                pass
+            total -= size
+
+    def stats(self) -> Dict[str, Any]:
+        """Retorna los contadores de la caché de reportes"""
+        with self._lock:
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'memory_entries': len(self._memory),
+                'memory_bytes': self._memory_bytes
+            }
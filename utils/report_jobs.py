@@ -0,0 +1,255 @@
+"""
+Cola de trabajos en segundo plano para generar reportes PDF
+"""
+import json
+import os
+import tempfile
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, Optional, Tuple
+
+from .locking import FileLock
+
+
+# Intervalo máximo con el que un proceso renueva la fecha de modificación del
+# estado de sus trabajos sin terminar (latido)
+HEARTBEAT_SECONDS = 30.0
+
+
+class QueueFullError(RuntimeError):
+    """La cola de reportes alcanzó su capacidad máxima"""
+
+
+class _JobExpired(Exception):
+    """El trabajo ya se dio por fallido (expiró) mientras se generaba"""
+
+
+class ReportJobQueue:
+    """
+    Ejecuta la generación de reportes en un pool de hilos acotado.
+    El estado de cada trabajo y el PDF resultante se guardan en disco para
+    que cualquier worker de la aplicación pueda informar el progreso y
+    entregar el archivo, no solo el que lo generó.
+    """
+
+    def __init__(self, directory: str, max_workers: int = 2, max_pending: int = 20,
+                 ttl: float = 3600.0, timeout: float = 900.0):
+        self.directory = directory
+        self.max_pending = max_pending
+        self.ttl = ttl
+        # Un trabajo sin terminar se da por fallido si su proceso dejó de
+        # renovar el latido hace más de timeout segundos (el worker que lo
+        # tenía terminó) o si empezó a generarse hace más de timeout
+        # segundos. Los que solo esperan en la cola no expiran.
+        self.timeout = timeout
+        self.heartbeat_seconds = min(HEARTBEAT_SECONDS, timeout / 3)
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='report')
+        self._lock = threading.Lock()
+        self._pending = 0
+        # Trabajos sin terminar de este proceso, cuyo latido se renueva
+        self._active = set()
+        self._heartbeat: Optional[threading.Thread] = None
+        # Serializa entre procesos los cambios de estado de los trabajos
+        # (un trabajo que expiró no vuelve a quedar en curso ni terminado)
+        self._status_lock = FileLock(os.path.join(directory, '.status.lock'))
+
+    def _status_path(self, job_id: str) -> str:
+        return os.path.join(self.directory, f'{job_id}.json')
+
+    def _result_path(self, job_id: str) -> str:
+        return os.path.join(self.directory, f'{job_id}.pdf')
+
+    def _save(self, job: Dict[str, Any]):
+        """Guarda el estado del trabajo de forma atómica"""
+        os.makedirs(self.directory, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=self.directory, prefix='.job-')
+        with os.fdopen(fd, 'w', encoding='utf-8') as f:
+            json.dump(job, f)
+        os.replace(tmp_path, self._status_path(job['id']))
+
+    def submit(self, func: Callable[[Callable[[int, str], None]], bytes],
+               filename: str) -> Dict[str, Any]:
+        """
+        Encola un trabajo. func recibe una función de progreso
+        (porcentaje, mensaje) y retorna el contenido del PDF.
+        Lanza QueueFullError si hay demasiados trabajos pendientes.
+        """
+        with self._lock:
+            if self._pending >= self.max_pending:
+                raise QueueFullError(
+                    f"Hay {self._pending} reportes en proceso; intenta nuevamente en unos segundos"
+                )
+            self._pending += 1
+
+        job = self._new_job(filename)
+        self._save(job)
+        self.cleanup()
+        # Copia para el llamador: el hilo del trabajo modifica el original
+        snapshot = dict(job)
+
+        with self._lock:
+            self._active.add(job['id'])
+            if self._heartbeat is None:
+                self._heartbeat = threading.Thread(target=self._beat, name='report-heartbeat', daemon=True)
+                self._heartbeat.start()
+        try:
+            self._executor.submit(self._run, job, func)
+        except BaseException:
+            self._release(job['id'])
+            raise
+        return snapshot
+
+    def _release(self, job_id: str):
+        with self._lock:
+            self._pending -= 1
+            self._active.discard(job_id)
+
+    def _beat(self):
+        """Renueva el latido de los trabajos sin terminar de este proceso mientras haya alguno"""
+        while True:
+            time.sleep(self.heartbeat_seconds)
+            with self._lock:
+                if not self._active:
+                    self._heartbeat = None
+                    return
+                job_ids = list(self._active)
+            for job_id in job_ids:
+                try:
+                    os.utime(self._status_path(job_id))
+                except FileNotFoundError:
+                    pass
+
+    def complete(self, content: bytes, filename: str) -> Dict[str, Any]:
+        """Registra como terminado un reporte que ya está disponible (por ejemplo, en caché)"""
+        job = self._new_job(filename)
+        self._write_result(job['id'], content)
+        job.update(status='done', progress=100, message='Reporte listo', finished=time.time())
+        self._save(job)
+        self.cleanup()
+        return job
+
+    def _new_job(self, filename: str) -> Dict[str, Any]:
+        return {
+            'id': uuid.uuid4().hex,
+            'status': 'queued',
+            'progress': 0,
+            'message': 'En cola',
+            'filename': filename,
+            'error': None,
+            'created': time.time(),
+            'started': None,
+            'finished': None
+        }
+
+    def _write_result(self, job_id: str, content: bytes):
+        os.makedirs(self.directory, exist_ok=True)
+        tmp_path = self._result_path(job_id) + '.tmp'
+        with open(tmp_path, 'wb') as f:
+            f.write(content)
+        os.replace(tmp_path, self._result_path(job_id))
+
+    def _update(self, job: Dict[str, Any], **changes) -> bool:
+        """
+        Aplica los cambios al trabajo y guarda su estado, salvo que en disco
+        ya figure como terminado (expiró): en ese caso retorna False
+        """
+        with self._status_lock:
+            current = self._load(job['id'])
+            if current is not None and current[0]['finished'] is not None:
+                return False
+            job.update(changes)
+            self._save(job)
+            return True
+
+    def _run(self, job: Dict[str, Any], func: Callable):
+        """Ejecuta el trabajo y registra su progreso"""
+        def progress(pct: int, message: str):
+            if not self._update(job, progress=pct, message=message):
+                raise _JobExpired()
+
+        try:
+            if not self._update(job, status='running', started=time.time(),
+                                progress=1, message='Generando reporte'):
+                return
+            content = func(progress)
+            with self._status_lock:
+                current = self._load(job['id'])
+                if current is not None and current[0]['finished'] is not None:
+                    return
+                self._write_result(job['id'], content)
+                self._update(job, status='done', progress=100, message='Reporte listo',
+                             finished=time.time())
+        except _JobExpired:
+            pass
+        except Exception as e:
+            self._update(job, status='failed', error=str(e), message='Error al generar el reporte',
+                         finished=time.time())
+        finally:
+            self._release(job['id'])
+
+    def _load(self, job_id: str) -> Optional[Tuple[Dict[str, Any], float]]:
+        """Estado de un trabajo y fecha de su último latido (o None si no existe)"""
+        try:
+            with open(self._status_path(job_id), encoding='utf-8') as f:
+                return json.load(f), os.fstat(f.fileno()).st_mtime
+        except (FileNotFoundError, json.JSONDecodeError):
+            return None
+
+    def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        """Retorna el estado de un trabajo o None si no existe"""
+        if not job_id.isalnum():
+            return None
+        loaded = self._load(job_id)
+        if loaded is None:
+            return None
+        job, heartbeat = loaded
+        if self._expired(job, heartbeat):
+            return self._expire(job_id)
+        return job
+
+    def _expired(self, job: Dict[str, Any], heartbeat: float) -> bool:
+        """True si el trabajo sigue sin terminar pero su proceso murió o lleva demasiado generándose"""
+        if job['finished'] is not None:
+            return False
+        limit = time.time() - self.timeout
+        started = job.get('started')
+        return heartbeat < limit or (started is not None and started < limit)
+
+    def _expire(self, job_id: str) -> Optional[Dict[str, Any]]:
+        """Marca como fallido un trabajo vencido (si sigue así al tomar el bloqueo)"""
+        with self._status_lock:
+            loaded = self._load(job_id)
+            if loaded is None:
+                return None
+            job, heartbeat = loaded
+            if self._expired(job, heartbeat):
+                job.update(status='failed', message='Error al generar el reporte', finished=time.time(),
+                           error='El reporte no terminó a tiempo; intenta generarlo nuevamente')
+                self._save(job)
+            return job
+
+    def result_path(self, job_id: str) -> Optional[str]:
+        """Retorna la ruta del PDF de un trabajo terminado"""
+        job = self.get(job_id)
+        if job is None or job['status'] != 'done':
+            return None
+        return self._result_path(job_id)
+
+    def cleanup(self):
+        """
+        Elimina los trabajos terminados hace más de ttl segundos (los que
+        quedaron huérfanos se dan por fallidos tras timeout segundos)
+        """
+        if not os.path.isdir(self.directory):
+            return
+        limit = time.time() - self.ttl
+        for name in os.listdir(self.directory):
+            if not name.endswith('.json'):
+                continue
+            job = self.get(name[:-5])
+            if job and job['finished'] and job['finished'] < limit:
+                for path in (self._status_path(job['id']), self._result_path(job['id'])):
+                    if os.path.exists(path):
+                        os.unlink(path)
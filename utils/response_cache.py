@@ -0,0 +1,121 @@
+"""
+Caché de respuestas ya generadas (JSON de las APIs de datos y HTML de las
+vistas) y de sus variantes comprimidas
+"""
+import gzip
+import hashlib
+import threading
+from collections import OrderedDict
+from typing import Callable, Dict, Optional, Sequence, Tuple
+
+try:
+    import brotli
+except ImportError:  # brotli es opcional: sin él solo se ofrece gzip
+    brotli = None
+
+
+# Por debajo de este tamaño comprimir no compensa
+COMPRESS_MIN_BYTES = 1024
+
+
+def _compress(body: bytes, encoding: str) -> bytes:
+    if encoding == 'br':
+        return brotli.compress(body, quality=5)
+    # mtime=0 para que el mismo contenido produzca siempre los mismos bytes
+    return gzip.compress(body, compresslevel=6, mtime=0)
+
+
+def available_encodings() -> Sequence[str]:
+    """Codificaciones soportadas, en orden de preferencia del servidor"""
+    return ('br', 'gzip') if brotli is not None else ('gzip',)
+
+
+def make_etag(*versions: str) -> str:
+    """ETag fuerte (entre comillas) a partir de las versiones de las matrices"""
+    if len(versions) == 1:
+        return f'"{versions[0]}"'
+    return '"' + hashlib.sha1('|'.join(versions).encode('utf-8')).hexdigest()[:16] + '"'
+
+
+def encoded_etag(etag: str, encoding: Optional[str]) -> str:
+    """
+    ETag de la variante comprimida de un recurso ("<versión>-gzip"): cada
+    codificación es una representación distinta y necesita su propio ETag fuerte
+    """
+    if encoding is None:
+        return etag
+    return f'{etag[:-1]}-{encoding}"'
+
+
+def strip_encoding(tag: str) -> str:
+    """Valor de un ETag (sin comillas) sin el sufijo de codificación de encoded_etag"""
+    base, _, suffix = tag.rpartition('-')
+    return base if base and suffix in ('gzip', 'br') else tag
+
+
+class EncodedResponseCache:
+    """
+    Guarda, por cada recurso, el cuerpo de su última versión y sus
+    variantes comprimidas (que se generan la primera vez que se piden).
+    Mientras la versión no cambie, responder no vuelve a serializar,
+    renderizar ni comprimir nada. Se conservan como máximo max_entries recursos (LRU).
+    """
+
+    def __init__(self, max_entries: int = 64, compress_min_bytes: int = COMPRESS_MIN_BYTES):
+        self.max_entries = max_entries
+        self.compress_min_bytes = compress_min_bytes
+        self._entries: 'OrderedDict[str, Dict[str, object]]' = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key: str, etag: str, build: Callable[[], bytes],
+            encoding: Optional[str] = None) -> Tuple[bytes, Optional[str]]:
+        """
+        Retorna (cuerpo, codificación) para la versión etag del recurso key.
+        build genera el cuerpo sin comprimir si no está en la caché;
+        la codificación retornada es None si el cuerpo va sin comprimir.
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry['etag'] == etag:
+                self._entries.move_to_end(key)
+                self.hits += 1
+            else:
+                entry = None
+                self.misses += 1
+
+        if entry is None:
+            # Serializar fuera del bloqueo; si dos hilos coinciden, gana el último
+            entry = {'etag': etag, 'variants': {None: build()}}
+            with self._lock:
+                self._entries[key] = entry
+                self._entries.move_to_end(key)
+                while len(self._entries) > self.max_entries:
+                    self._entries.popitem(last=False)
+
+        variants = entry['variants']
+        body = variants[None]
+        if encoding is None or len(body) < self.compress_min_bytes:
+            return body, None
+
+        encoded = variants.get(encoding)
+        if encoded is None:
+            encoded = _compress(body, encoding)
+            variants[encoding] = encoded
+        return encoded, encoding
+
+    def discard_prefix(self, prefix: str):
+        """Elimina los recursos cuya clave empieza por prefix"""
+        with self._lock:
+            for key in [k for k in self._entries if k.startswith(prefix)]:
+                del self._entries[key]
+
+    def stats(self) -> Dict[str, int]:
+        """Contadores de aciertos y fallos"""
+        with self._lock:
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'entries': len(self._entries)
+            }
@@ -0,0 +1,156 @@
+"""
+Cálculo de riesgos MAGERIT en bloque (vectorizado con NumPy si está disponible)
+"""
+import functools
+import math
+import re
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+
+# Límites superiores (exclusivos) del riesgo residual para cada clasificación
+RISK_LEVELS = [
+    (2, 'Riesgo Bajo'),
+    (3, 'Riesgo Medio-Bajo'),
+    (4, 'Riesgo Medio-Alto'),
+]
+RISK_LEVEL_MAX = 'Riesgo Alto'
+RISK_CLASSES = [label for _, label in RISK_LEVELS] + [RISK_LEVEL_MAX]
+
+_NUMBER = re.compile(r'-?\d+(?:[.,]\d+)?')
+
+
+@functools.lru_cache(maxsize=None)
+def _numpy():
+    """
+    NumPy, importado la primera vez que se calcula en bloque para no
+    demorar el arranque; None si no está instalado (es opcional)
+    """
+    try:
+        import numpy
+    except ImportError:
+        return None
+    return numpy
+
+
+def round_risk(value: float) -> float:
+    """
+    Redondea un riesgo a centésimas, con la mitad hacia arriba sobre el
+    valor decimal (0,465 -> 0,47 aunque el binario sea 0,46499...). Se
+    descartan primero los errores de punto flotante por debajo de 10^-6
+    centésimas; las mismas operaciones se aplican en bloque con NumPy
+    (_round_risks), por lo que ambos caminos dan exactamente el mismo valor.
+    """
+    cents = round(value * 1e8) / 1e6
+    return math.floor(cents + 0.5) / 100
+
+
+def _round_risks(np, values):
+    """round_risk sobre un arreglo de NumPy"""
+    cents = np.rint(values * 1e8) / 1e6
+    return np.floor(cents + 0.5) / 100
+
+
+def classify_residual_risk(riesgo_residual: float) -> str:
+    """Retorna la clasificación del riesgo residual (Bajo, Medio-Bajo, Medio-Alto, Alto)"""
+    for limit, label in RISK_LEVELS:
+        if riesgo_residual < limit:
+            return label
+    return RISK_LEVEL_MAX
+
+
+def _to_float(text: str) -> float:
+    """Convierte un número con coma o punto decimal"""
+    return float(text.replace(',', '.'))
+
+
+def parse_magerit_values(row: Sequence[str]) -> Tuple[float, float, float]:
+    """
+    Extrae (frecuencia, impacto, % salvaguarda) de una fila de MAGERIT.
+    La frecuencia numérica se toma de la expresión del riesgo intrínseco
+    ("1,5 * 3,5 = 5,25") porque la columna de frecuencia suele ser texto.
+    """
+    intrinseco = _NUMBER.findall(row[7])
+    impacto = _NUMBER.findall(row[6].split(':')[-1])
+    salvaguarda = _NUMBER.findall(row[9].split(':')[-1])
+
+    if len(intrinseco) < 2 or not impacto or not salvaguarda:
+        raise ValueError(f"No se pudieron interpretar los valores del activo N° {row[0]}")
+
+    return _to_float(intrinseco[0]), _to_float(impacto[0]), _to_float(salvaguarda[0])
+
+
+def calculate_risks_bulk(frecuencias: Sequence[float], impactos: Sequence[float],
+                         salvaguardas_pct: Sequence[float]) -> Dict[str, List[Any]]:
+    """
+    Calcula riesgo intrínseco, residual y su clasificación para listas
+    de valores en una sola pasada
+
+    Returns:
+        Dict con las listas riesgo_intrinseco, riesgo_residual y clasificacion
+    """
+    if not (len(frecuencias) == len(impactos) == len(salvaguardas_pct)):
+        raise ValueError("Las listas de frecuencia, impacto y salvaguarda deben tener el mismo largo")
+
+    np = _numpy()
+    if np is not None:
+        frecuencia = np.asarray(frecuencias, dtype=float)
+        impacto = np.asarray(impactos, dtype=float)
+        salvaguarda = np.asarray(salvaguardas_pct, dtype=float)
+
+        intrinseco = frecuencia * impacto
+        residual = intrinseco - intrinseco * (salvaguarda / 100)
+        intrinseco = _round_risks(np, intrinseco)
+        residual = _round_risks(np, residual)
+
+        limits = np.array([limit for limit, _ in RISK_LEVELS], dtype=float)
+        levels = np.searchsorted(limits, residual, side='right')
+
+        return {
+            'riesgo_intrinseco': intrinseco.tolist(),
+            'riesgo_residual': residual.tolist(),
+            'clasificacion': [RISK_CLASSES[i] for i in levels.tolist()]
+        }
+
+    intrinseco = []
+    residual = []
+    clasificacion = []
+    for f, i, s in zip(frecuencias, impactos, salvaguardas_pct):
+        valor = float(f) * float(i)
+        restante = valor - valor * (float(s) / 100)
+        intrinseco.append(round_risk(valor))
+        residual.append(round_risk(restante))
+        clasificacion.append(classify_residual_risk(residual[-1]))
+
+    return {
+        'riesgo_intrinseco': intrinseco,
+        'riesgo_residual': residual,
+        'clasificacion': clasificacion
+    }
+
+
+def calculate_column_risks(columns: Dict[str, Any],
+                           overrides: Optional[Dict[str, float]] = None) -> Dict[str, List[Any]]:
+    """
+    Recalcula los riesgos de todos los activos de una matriz MAGERIT a
+    partir de sus columnas ya interpretadas (activo, frecuencia, impacto,
+    salvaguarda_pct y errores; ver utils.magerit_records.MageritColumns).
+    overrides permite fijar frecuencia, impacto o salvaguarda_pct para todos
+    los activos (por ejemplo, al evaluar un cambio de metodología).
+
+    Returns:
+        Dict con las columnas activo, frecuencia, impacto, salvaguarda_pct,
+        riesgo_intrinseco, riesgo_residual, clasificacion y la lista errores
+    """
+    overrides = overrides or {}
+    activos = list(columns['activo'])
+    result: Dict[str, Any] = {'activo': activos}
+    for field in ('frecuencia', 'impacto', 'salvaguarda_pct'):
+        values = columns[field]
+        if field in overrides:
+            result[field] = [overrides[field]] * len(activos)
+        else:
+            result[field] = values.tolist() if hasattr(values, 'tolist') else list(values)
+
+    result.update(calculate_risks_bulk(result['frecuencia'], result['impacto'], result['salvaguarda_pct']))
+    result['errores'] = list(columns.get('errores', []))
+    return result
@@ -0,0 +1,212 @@
+"""
+Índice invertido de búsqueda de texto sobre las cuatro matrices
+"""
+import bisect
+import heapq
+import math
+import re
+import threading
+import time
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+from .matrix_query import normalize_value
+
+
+# Palabras demasiado frecuentes en español para aportar a la búsqueda
+STOPWORDS = frozenset(
+    'a al como con de del e el en es la las lo los o para por que se sin su sus un una u y'.split()
+)
+MATRIX_TYPES = ('magerit', 'anexo_a', 'cobit', 'nist')
+MAX_RESULTS = 100
+
+# Parámetros de ranking BM25
+BM25_K1 = 1.2
+BM25_B = 0.75
+
+_TOKEN = re.compile(r'\w+')
+
+
+def tokenize(text: str) -> List[str]:
+    """Separa un texto en términos sin mayúsculas ni tildes ("Implementación" -> "implementacion")"""
+    return [t for t in _TOKEN.findall(normalize_value(text)) if t not in STOPWORDS]
+
+
+class SearchIndex:
+    """
+    Índice invertido (término -> documento -> frecuencia) de las filas de
+    las cuatro matrices, con ranking BM25. MAGERIT se actualiza fila a fila
+    con los cambios que notifica el CSVProcessor; las otras matrices solo
+    cambian editando el CSV y se reindexan cuando cambia su versión.
+    """
+
+    def __init__(self, processor):
+        self.processor = processor
+        self._lock = threading.Lock()
+        # Documento: (matriz, clave) -> fila; la clave es el N° de activo en
+        # MAGERIT y la posición de la fila en las demás matrices
+        self._docs: Dict[Tuple[str, str], Sequence[str]] = {}
+        self._doc_terms: Dict[Tuple[str, str], Dict[str, int]] = {}
+        self._doc_lengths: Dict[Tuple[str, str], int] = {}
+        self._postings: Dict[str, Dict[Tuple[str, str], int]] = {}
+        # Vocabulario ordenado para buscar por prefijo
+        self._vocabulary: List[str] = []
+        self._total_length = 0
+        self._versions: Dict[str, str] = {}
+
+        processor.add_change_listener(self._on_magerit_change)
+
+    # ---- mantenimiento del índice ----
+
+    def _add(self, doc_id: Tuple[str, str], row: Sequence[str]):
+        terms: Dict[str, int] = {}
+        for term in tokenize(' '.join(row)):
+            terms[term] = terms.get(term, 0) + 1
+        self._docs[doc_id] = row
+        self._doc_terms[doc_id] = terms
+        self._doc_lengths[doc_id] = sum(terms.values())
+        self._total_length += self._doc_lengths[doc_id]
+        for term, count in terms.items():
+            postings = self._postings.get(term)
+            if postings is None:
+                postings = self._postings[term] = {}
+                bisect.insort(self._vocabulary, term)
+            postings[doc_id] = count
+
+    def _remove(self, doc_id: Tuple[str, str]):
+        terms = self._doc_terms.pop(doc_id, None)
+        if terms is None:
+            return
+        del self._docs[doc_id]
+        self._total_length -= self._doc_lengths.pop(doc_id)
+        for term in terms:
+            postings = self._postings[term]
+            del postings[doc_id]
+            if not postings:
+                del self._postings[term]
+                del self._vocabulary[bisect.bisect_left(self._vocabulary, term)]
+
+    def _replace_matrix(self, csv_type: str, docs: List[Tuple[str, Sequence[str]]]):
+        for doc_id in [d for d in self._docs if d[0] == csv_type]:
+            self._remove(doc_id)
+        for key, row in docs:
+            self._add((csv_type, key), row)
+
+    def _on_magerit_change(self, rows: List[List[str]], reset: bool):
+        """Aplica las filas nuevas o modificadas de MAGERIT (llamado por el CSVProcessor)"""
+        with self._lock:
+            if reset:
+                self._replace_matrix('magerit', [(row[0].strip(), row) for row in rows])
+                return
+            for row in rows:
+                doc_id = ('magerit', row[0].strip())
+                self._remove(doc_id)
+                self._add(doc_id, row)
+
+    def _sync(self):
+        """Reindexa las matrices de solo lectura que cambiaron y trae los cambios de MAGERIT"""
+        # Lee el diario: los cambios de otros procesos llegan por _on_magerit_change
+        self.processor.get_magerit_version()
+        for csv_type in MATRIX_TYPES[1:]:
+            version = self.processor.get_data_version(csv_type)
+            if self._versions.get(csv_type) == version:
+                continue
+            rows = self.processor.get_data(csv_type).get('data', [])
+            with self._lock:
+                self._replace_matrix(csv_type, [(str(i), row) for i, row in enumerate(rows)])
+                self._versions[csv_type] = version
+
+    # ---- consultas ----
+
+    def _expand(self, term: str, prefix: bool) -> List[str]:
+        """Términos del vocabulario que corresponden a un término de la consulta"""
+        if not prefix:
+            return [term] if term in self._postings else []
+        start = bisect.bisect_left(self._vocabulary, term)
+        end = bisect.bisect_left(self._vocabulary, term + '\uffff')
+        return self._vocabulary[start:end]
+
+    def search(self, query: str, matrices: Optional[Sequence[str]] = None,
+               limit: int = 20) -> Dict[str, Any]:
+        """
+        Busca filas que contengan todos los términos de la consulta (el
+        último también como prefijo, para buscar mientras se escribe)
+
+        Args:
+            query: Texto a buscar
+            matrices: Limitar la búsqueda a estas matrices (opcional)
+            limit: Cantidad máxima de resultados (hasta MAX_RESULTS)
+
+        Returns:
+            Dict con total, resultados ordenados por relevancia y duración
+        """
+        if not 1 <= limit <= MAX_RESULTS:
+            raise ValueError(f"limit debe estar entre 1 y {MAX_RESULTS}")
+        if matrices:
+            invalid = [m for m in matrices if m not in MATRIX_TYPES]
+            if invalid:
+                raise ValueError(f"Matriz no válida: {', '.join(invalid)}")
+
+        self._sync()
+        started = time.perf_counter()
+        terms = list(dict.fromkeys(tokenize(query)))
+
+        with self._lock:
+            n_docs = len(self._docs)
+            avg_length = self._total_length / n_docs if n_docs else 0
+            scores: Optional[Dict[Tuple[str, str], float]] = None
+            k_base = BM25_K1 * (1 - BM25_B)
+            k_length = BM25_K1 * BM25_B / avg_length if avg_length else 0.0
+
+            # Los términos menos frecuentes primero: reducen antes los candidatos
+            expanded_terms = sorted(
+                (self._expand(term, prefix=position == len(terms) - 1) for position, term in enumerate(terms)),
+                key=lambda expanded: sum(len(self._postings[t]) for t in expanded)
+            )
+            for expanded in expanded_terms:
+                term_scores: Dict[Tuple[str, str], float] = {}
+                for term in expanded:
+                    postings = self._postings[term]
+                    idf = math.log(1 + (n_docs - len(postings) + 0.5) / (len(postings) + 0.5))
+                    if scores is None or len(postings) <= len(scores):
+                        candidates = postings.items()
+                    else:
+                        candidates = ((d, postings[d]) for d in scores if d in postings)
+                    for doc_id, tf in candidates:
+                        if scores is not None and doc_id not in scores:
+                            continue
+                        norm = tf + k_base + k_length * self._doc_lengths[doc_id]
+                        score = idf * tf * (BM25_K1 + 1) / norm
+                        term_scores[doc_id] = max(term_scores.get(doc_id, 0.0), score)
+                # Todos los términos deben aparecer
+                scores = term_scores if scores is None else {
+                    d: scores[d] + s for d, s in term_scores.items()
+                }
+                if not scores:
+                    break
+
+            scores = scores or {}
+            if matrices:
+                scores = {d: s for d, s in scores.items() if d[0] in matrices}
+            ranked = heapq.nsmallest(limit, scores.items(), key=lambda item: (-item[1], item[0]))
+            results = [
+                {
+                    'matriz': doc_id[0],
+                    'id': doc_id[1],
+                    'score': round(score, 4),
+                    'fila': list(self._docs[doc_id])
+                }
+                for doc_id, score in ranked
+            ]
+
+        return {
+            'consulta': query,
+            'terminos': terms,
+            'total': len(scores),
+            'resultados': results,
+            'duracion_ms': round((time.perf_counter() - started) * 1000, 3)
+        }
+
+    def stats(self) -> Dict[str, int]:
+        """Tamaño del índice"""
+        with self._lock:
+            return {'documentos': len(self._docs), 'terminos': len(self._postings)}
@@ -0,0 +1,263 @@
+"""
+Simulación Monte Carlo de escenarios de riesgo MAGERIT
+"""
+import logging
+import math
+import os
+import time
+from concurrent.futures.process import BrokenProcessPool
+from typing import Any, Dict, List, Optional, Sequence
+
+from .process_pool import SharedProcessPool
+from .risk import RISK_CLASSES, RISK_LEVELS, round_risk
+
+try:
+    import numpy as np
+except ImportError:  # NumPy es opcional, pero necesario para simular
+    np = None
+
+
+# Dispersión por defecto de las distribuciones triangulares
+DEFAULT_SPREADS = {
+    'frecuencia': 0.25,   # ±25 % alrededor de la frecuencia estimada
+    'impacto': 0.20,      # ±20 % alrededor del impacto estimado
+    'salvaguarda': 10.0   # ±10 puntos porcentuales de efectividad
+}
+DEFAULT_PERCENTILES = [5, 25, 50, 75, 95, 99]
+MAX_TRIALS = 1_000_000
+# Máximo de celdas (ensayos × activos) de una simulación: con matrices
+# grandes limita el tiempo de CPU y la memoria de los histogramas
+MAX_ELEMENTS = 100_000_000
+
+# Celdas (ensayos × activos) que se procesan por bloque dentro de un worker
+BLOCK_ELEMENTS = 2_000_000
+ASSET_BINS = 200
+PORTFOLIO_BINS = 2000
+# Por debajo de este tamaño no compensa repartir el trabajo entre procesos
+PARALLEL_MIN_ELEMENTS = 5_000_000
+
+_pool = SharedProcessPool(os.cpu_count() or 1, 'la simulación')
+
+logger = logging.getLogger(__name__)
+
+
+def _triangular(rng, center, spread_low, spread_high, size):
+    """Muestras triangulares por activo; si el rango es nulo retorna el valor fijo"""
+    left = np.minimum(spread_low, center)
+    right = np.maximum(spread_high, center)
+    width = right - left
+    # Inversa de la CDF triangular, vectorizada y sin casos degenerados
+    u = rng.random(size)
+    safe = np.where(width > 0, width, 1.0)
+    split = np.where(width > 0, (center - left) / safe, 0.0)
+    low = left + np.sqrt(u * safe * (center - left))
+    high = right - np.sqrt((1 - u) * safe * (right - center))
+    return np.where(width > 0, np.where(u < split, low, high), center)
+
+
+def _simulate_task(task: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Ejecuta un bloque de ensayos y retorna histogramas acumulables
+    (se ejecuta en un proceso del pool)
+    """
+    rng = np.random.default_rng(task['seed'])
+    frecuencia = task['frecuencia']
+    impacto = task['impacto']
+    salvaguarda = task['salvaguarda']
+    spreads = task['spreads']
+    asset_max = task['asset_max']
+    portfolio_max = task['portfolio_max']
+    n_assets = len(frecuencia)
+
+    asset_hist = np.zeros(n_assets * ASSET_BINS, dtype=np.int64)
+    class_counts = np.zeros(n_assets * len(RISK_CLASSES), dtype=np.int64)
+    portfolio_hist = np.zeros(PORTFOLIO_BINS, dtype=np.int64)
+    asset_sum = np.zeros(n_assets)
+    portfolio_sum = 0.0
+    portfolio_sq = 0.0
+
+    limits = np.array([limit for limit, _ in RISK_LEVELS], dtype=float)
+    offsets = np.arange(n_assets)
+    block = max(1, BLOCK_ELEMENTS // max(n_assets, 1))
+    remaining = task['trials']
+
+    while remaining > 0:
+        size = (min(block, remaining), n_assets)
+        remaining -= size[0]
+
+        f = _triangular(rng, frecuencia, frecuencia * (1 - spreads['frecuencia']),
+                        frecuencia * (1 + spreads['frecuencia']), size)
+        i = _triangular(rng, impacto, impacto * (1 - spreads['impacto']),
+                        impacto * (1 + spreads['impacto']), size)
+        s = _triangular(rng, salvaguarda, np.clip(salvaguarda - spreads['salvaguarda'], 0, 100),
+                        np.clip(salvaguarda + spreads['salvaguarda'], 0, 100), size)
+
+        residual = f * i * (1 - s / 100)
+
+        bins = np.minimum((residual / asset_max * ASSET_BINS).astype(np.int64), ASSET_BINS - 1)
+        asset_hist += np.bincount((offsets * ASSET_BINS + bins).ravel(), minlength=asset_hist.size)
+        levels = np.searchsorted(limits, residual, side='right')
+        class_counts += np.bincount((offsets * len(RISK_CLASSES) + levels).ravel(),
+                                    minlength=class_counts.size)
+        asset_sum += residual.sum(axis=0)
+
+        portfolio = residual.sum(axis=1)
+        pbins = np.minimum((portfolio / portfolio_max * PORTFOLIO_BINS).astype(np.int64), PORTFOLIO_BINS - 1)
+        portfolio_hist += np.bincount(pbins, minlength=PORTFOLIO_BINS)
+        portfolio_sum += float(portfolio.sum())
+        portfolio_sq += float((portfolio ** 2).sum())
+
+    return {
+        'asset_hist': asset_hist,
+        'class_counts': class_counts,
+        'portfolio_hist': portfolio_hist,
+        'asset_sum': asset_sum,
+        'portfolio_sum': portfolio_sum,
+        'portfolio_sq': portfolio_sq
+    }
+
+
+def _hist_percentiles(hist, upper: float, percentiles: Sequence[float]):
+    """Percentiles interpolados a partir de un histograma de [0, upper] (última dimensión)"""
+    total = hist.sum(axis=-1, keepdims=True)
+    cumulative = np.cumsum(hist, axis=-1)
+    width = upper / hist.shape[-1]
+    result = []
+    for q in percentiles:
+        target = total * (q / 100)
+        idx = np.minimum((cumulative < target).sum(axis=-1, keepdims=True), hist.shape[-1] - 1)
+        before = np.take_along_axis(cumulative, idx, axis=-1) - np.take_along_axis(hist, idx, axis=-1)
+        inside = np.take_along_axis(hist, idx, axis=-1)
+        fraction = np.where(inside > 0, (target - before) / np.where(inside > 0, inside, 1), 0)
+        value = (idx + np.clip(fraction, 0, 1)) * width
+        result.append(np.squeeze(value, axis=-1))
+    return result
+
+
+def simulate_portfolio(activos: Sequence[str], frecuencias: Sequence[float],
+                       impactos: Sequence[float], salvaguardas_pct: Sequence[float],
+                       trials: int = 100_000, seed: Optional[int] = None,
+                       spreads: Optional[Dict[str, float]] = None,
+                       percentiles: Optional[List[float]] = None,
+                       parallel: bool = True,
+                       curve_points: int = 50) -> Dict[str, Any]:
+    """
+    Simula el riesgo residual de cada activo y del portafolio completo
+
+    Args:
+        activos: Identificadores de los activos
+        frecuencias, impactos, salvaguardas_pct: Estimaciones puntuales por activo
+        trials: Número de ensayos (hasta MAX_TRIALS y MAX_ELEMENTS ensayos × activos)
+        seed: Semilla para reproducir la simulación
+        spreads: Dispersión de las distribuciones (ver DEFAULT_SPREADS)
+        percentiles: Percentiles a reportar
+        parallel: Repartir los ensayos entre todos los núcleos
+        curve_points: Puntos de la curva de excedencia del portafolio
+
+    Returns:
+        Dict con percentiles por activo, probabilidad de cada clasificación y
+        la distribución del riesgo residual total (curva de excedencia)
+    """
+    if np is None:
+        raise RuntimeError("La simulación requiere NumPy (pip install numpy)")
+    if not activos:
+        raise ValueError("No hay activos para simular")
+
+    trials = int(trials)
+    if not 1 <= trials <= MAX_TRIALS:
+        raise ValueError(f"El número de ensayos debe estar entre 1 y {MAX_TRIALS}")
+    if trials * len(activos) > MAX_ELEMENTS:
+        raise ValueError(f"Con {len(activos)} activos se admiten hasta "
+                         f"{max(1, MAX_ELEMENTS // len(activos))} ensayos")
+
+    spreads = {**DEFAULT_SPREADS, **{k: float(v) for k, v in (spreads or {}).items()}}
+    if not (0 <= spreads['frecuencia'] <= 1 and 0 <= spreads['impacto'] <= 1
+            and 0 <= spreads['salvaguarda'] <= 100):
+        raise ValueError("Dispersión fuera de rango (frecuencia e impacto entre 0 y 1, salvaguarda entre 0 y 100)")
+    percentiles = [float(q) for q in percentiles or DEFAULT_PERCENTILES]
+    if any(not 0 <= q <= 100 for q in percentiles):
+        raise ValueError("Los percentiles deben estar entre 0 y 100")
+    started = time.perf_counter()
+
+    frecuencia = np.asarray(frecuencias, dtype=float)
+    impacto = np.asarray(impactos, dtype=float)
+    salvaguarda = np.asarray(salvaguardas_pct, dtype=float)
+    n_assets = len(frecuencia)
+
+    # Cota superior del riesgo residual de cada activo y del portafolio
+    asset_max = (frecuencia * (1 + spreads['frecuencia'])) * (impacto * (1 + spreads['impacto']))
+    asset_max = np.where(asset_max > 0, asset_max, 1.0)
+    portfolio_max = float(asset_max.sum())
+
+    # La cantidad de tareas depende solo del tamaño, así una semilla da el
+    # mismo resultado sin importar cuántos núcleos tenga el servidor
+    elements = trials * n_assets
+    n_tasks = max(1, min(64, math.ceil(elements / BLOCK_ELEMENTS)))
+    seeds = np.random.SeedSequence(seed).spawn(n_tasks)
+    base = {
+        'frecuencia': frecuencia, 'impacto': impacto, 'salvaguarda': salvaguarda,
+        'spreads': spreads, 'asset_max': asset_max, 'portfolio_max': portfolio_max
+    }
+    tasks = [
+        dict(base, seed=seeds[k], trials=trials // n_tasks + (1 if k < trials % n_tasks else 0))
+        for k in range(n_tasks)
+    ]
+
+    workers = min(os.cpu_count() or 1, n_tasks)
+    partials = None
+    if parallel and workers > 1 and elements >= PARALLEL_MIN_ELEMENTS:
+        try:
+            partials = _pool.map(_simulate_task, tasks)
+        except BrokenProcessPool:
+            # El pool ya se descartó; esta simulación se completa en el proceso actual
+            logger.warning("Simulación de %s ensayos sin procesos auxiliares", trials)
+    if partials is None:
+        workers = 1
+        partials = [_simulate_task(task) for task in tasks]
+
+    asset_hist = sum(p['asset_hist'] for p in partials).reshape(n_assets, ASSET_BINS)
+    class_counts = sum(p['class_counts'] for p in partials).reshape(n_assets, len(RISK_CLASSES))
+    portfolio_hist = sum(p['portfolio_hist'] for p in partials)
+    asset_mean = sum(p['asset_sum'] for p in partials) / trials
+    portfolio_mean = sum(p['portfolio_sum'] for p in partials) / trials
+    portfolio_var = max(sum(p['portfolio_sq'] for p in partials) / trials - portfolio_mean ** 2, 0.0)
+
+    asset_percentiles = _hist_percentiles(asset_hist, asset_max[:, None], percentiles)
+    portfolio_percentiles = _hist_percentiles(portfolio_hist, portfolio_max, percentiles)
+
+    assets = []
+    for k, activo in enumerate(activos):
+        valor = float(frecuencia[k] * impacto[k])
+        assets.append({
+            'activo': activo,
+            'riesgo_residual_estimado': round_risk(valor - valor * (float(salvaguarda[k]) / 100)),
+            'media': round(float(asset_mean[k]), 4),
+            'percentiles': {f'p{q:g}': round(float(v[k]), 4) for q, v in zip(percentiles, asset_percentiles)},
+            'probabilidades': {
+                label: round(float(class_counts[k, c]) / trials, 6) for c, label in enumerate(RISK_CLASSES)
+            }
+        })
+
+    # Curva de excedencia: probabilidad de que el riesgo total supere cada valor
+    exceed = 1 - np.cumsum(portfolio_hist) / trials
+    width = portfolio_max / PORTFOLIO_BINS
+    step = max(1, PORTFOLIO_BINS // curve_points)
+    last_bin = int(np.nonzero(portfolio_hist)[0].max())
+    curve = [
+        {'valor': round((b + 1) * width, 4), 'probabilidad': round(float(exceed[b]), 6)}
+        for b in range(0, last_bin + 1, step)
+    ]
+
+    return {
+        'ensayos': trials,
+        'workers': workers,
+        'duracion_s': round(time.perf_counter() - started, 3),
+        'parametros': {'seed': seed, 'spreads': spreads},
+        'activos': assets,
+        'portafolio': {
+            'media': round(portfolio_mean, 4),
+            'desviacion': round(math.sqrt(portfolio_var), 4),
+            'percentiles': {f'p{q:g}': round(float(v), 4) for q, v in zip(percentiles, portfolio_percentiles)},
+            'curva_excedencia': curve
+        }
+    }
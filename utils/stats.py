@@ -0,0 +1,189 @@
+"""
+Estadísticas de las matrices (activos y riesgos de MAGERIT por tipo y
+clasificación, mapa de calor frecuencia × impacto, efectividad promedio de
+las salvaguardas y controles por función NIST, categoría del Anexo A y
+proceso COBIT), mantenidas de forma incremental
+"""
+import re
+import threading
+from collections import Counter
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple
+
+from .magerit_records import COL_TIPO_ACTIVO, parse_values
+from .matrix_query import residual_risk_class
+from .risk import RISK_CLASSES
+
+
+_COBIT_DOMAIN = re.compile(r'[A-Z]{3}')
+
+
+def _first_column(row: Sequence[str]) -> str:
+    return row[0].strip() if row else ''
+
+
+def _cobit_domain(row: Sequence[str]) -> str:
+    match = _COBIT_DOMAIN.match(_first_column(row))
+    return match.group(0) if match else _first_column(row)
+
+
+# Grupo de cada fila de las matrices de solo lectura: categoría del Anexo A,
+# dominio COBIT (EDM, APO, BAI, DSS, MEA) y función NIST
+GROUPS: Dict[str, Callable[[Sequence[str]], str]] = {
+    'anexo_a': _first_column,
+    'cobit': _cobit_domain,
+    'nist': _first_column
+}
+
+# Aporte de un activo: (tipo, clasificación, (frecuencia, impacto) en
+# centésimas o None, % salvaguarda, riesgo intrínseco y residual en centésimas)
+Contribution = Tuple[str, str, Optional[Tuple[int, int]], int, int, int]
+
+
+def _hundredths(value: float) -> int:
+    # Los valores tienen a lo sumo 2 decimales: en centésimas las sumas y restas son exactas
+    return int(round(value * 100))
+
+
+class RiskStats:
+    """
+    Agregados de MAGERIT que se actualizan con cada alta o edición (a
+    partir de los cambios que notifica el CSVProcessor): a cada activo se
+    le resta su aporte anterior y se suma el nuevo, sin recorrer la matriz.
+    Los conteos de las otras matrices se recalculan cuando cambia su versión.
+    """
+
+    def __init__(self, processor):
+        self.processor = processor
+        self._lock = threading.Lock()
+        self._assets: Dict[str, Contribution] = {}
+        self._types: Dict[str, List[int]] = {}
+        self._classes: Counter = Counter()
+        self._heatmap: Counter = Counter()
+        self._safeguard_total = 0
+        self._intrinsic_total = 0
+        self._residual_total = 0
+        self._parsed = 0
+        self._groups: Dict[str, Dict[str, int]] = {}
+        self._versions: Dict[str, str] = {}
+
+        processor.add_change_listener(self._on_magerit_change)
+
+    # ---- mantenimiento ----
+
+    def _contribution(self, row: Sequence[str],
+                      memo: Optional[Dict[tuple, Optional[tuple]]] = None) -> Contribution:
+        tipo = row[COL_TIPO_ACTIVO].strip() if len(row) > COL_TIPO_ACTIVO else ''
+        values = parse_values(row, memo) if len(row) > COL_TIPO_ACTIVO else None
+        if values is None:
+            return tipo, residual_risk_class(row), None, 0, 0, 0
+        frecuencia, impacto, salvaguarda_pct, intrinseco, residual = values
+        return (tipo, residual_risk_class(row), (_hundredths(frecuencia), _hundredths(impacto)),
+                _hundredths(salvaguarda_pct), _hundredths(intrinseco), _hundredths(residual))
+
+    def _apply(self, contribution: Contribution, sign: int):
+        tipo, clase, cell, salvaguarda, intrinseco, residual = contribution
+        totals = self._types.setdefault(tipo, [0, 0, 0])
+        totals[0] += sign
+        if clase:
+            self._classes[clase] += sign
+        if cell is not None:
+            totals[1] += sign * intrinseco
+            totals[2] += sign * residual
+            self._heatmap[cell] += sign
+            self._safeguard_total += sign * salvaguarda
+            self._intrinsic_total += sign * intrinseco
+            self._residual_total += sign * residual
+            self._parsed += sign
+        if not totals[0]:
+            del self._types[tipo]
+
+    def _on_magerit_change(self, rows: List[List[str]], reset: bool):
+        """Aplica las filas nuevas o modificadas de MAGERIT (llamado por el CSVProcessor)"""
+        memo: Dict[tuple, Optional[tuple]] = {}
+        changes = [(row[0].strip(), self._contribution(row, memo)) for row in rows]
+        with self._lock:
+            if reset:
+                self._assets.clear()
+                self._types.clear()
+                self._classes.clear()
+                self._heatmap.clear()
+                self._safeguard_total = self._intrinsic_total = self._residual_total = 0
+                self._parsed = 0
+            for asset, contribution in changes:
+                previous = self._assets.get(asset)
+                if previous is not None:
+                    self._apply(previous, -1)
+                self._assets[asset] = contribution
+                self._apply(contribution, 1)
+
+    def _sync(self):
+        """Trae los cambios de MAGERIT y recuenta las matrices de solo lectura que cambiaron"""
+        # Lee el diario: los cambios de otros procesos llegan por _on_magerit_change
+        self.processor.get_magerit_version()
+        for csv_type, group in GROUPS.items():
+            version = self.processor.get_data_version(csv_type)
+            if self._versions.get(csv_type) == version:
+                continue
+            rows = self.processor.get_data(csv_type).get('data', [])
+            groups = Counter(group(row) for row in rows)
+            with self._lock:
+                self._groups[csv_type] = dict(groups)
+                self._versions[csv_type] = version
+
+    # ---- consultas ----
+
+    def _class_counts(self) -> Dict[str, int]:
+        # Las cuatro clasificaciones siempre, más las que traiga el CSV con otro nombre
+        counts = {clase: 0 for clase in RISK_CLASSES}
+        counts.update((clase, count) for clase, count in sorted(self._classes.items()) if count)
+        return counts
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        Estadísticas actuales de las cuatro matrices
+
+        Returns:
+            Dict con magerit (activos, activos por tipo con sus riesgos
+            sumados, clasificación, mapa de calor, promedios) y los controles
+            por grupo de anexo_a, cobit y nist
+        """
+        self._sync()
+        with self._lock:
+            cells = sorted(self._heatmap.items())
+            parsed = self._parsed
+            result = {
+                'magerit': {
+                    'activos': len(self._assets),
+                    'sin_valores': len(self._assets) - parsed,
+                    'por_tipo': {
+                        tipo: {
+                            'activos': totals[0],
+                            'riesgo_intrinseco': totals[1] / 100,
+                            'riesgo_residual': totals[2] / 100
+                        }
+                        for tipo, totals in sorted(self._types.items())
+                    },
+                    'clasificacion': self._class_counts(),
+                    'salvaguarda_promedio': round(self._safeguard_total / parsed / 100, 2) if parsed else None,
+                    'riesgo_intrinseco_promedio': round(self._intrinsic_total / parsed / 100, 2) if parsed else None,
+                    'riesgo_residual_promedio': round(self._residual_total / parsed / 100, 2) if parsed else None
+                }
+            }
+            groups = {csv_type: dict(sorted(counts.items())) for csv_type, counts in self._groups.items()}
+
+        frecuencias = sorted({f for (f, _), count in cells if count})
+        impactos = sorted({i for (_, i), count in cells if count})
+        counts = dict(cells)
+        result['magerit']['mapa_calor'] = {
+            'frecuencias': [f / 100 for f in frecuencias],
+            'impactos': [i / 100 for i in impactos],
+            # conteos[f][i]: activos con la frecuencia frecuencias[f] y el impacto impactos[i]
+            'conteos': [[counts.get((f, i), 0) for i in impactos] for f in frecuencias]
+        }
+        for csv_type in GROUPS:
+            counts_by_group = groups.get(csv_type, {})
+            result[csv_type] = {
+                'total': sum(counts_by_group.values()),
+                'por_grupo': counts_by_group
+            }
+        return result
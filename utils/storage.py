@@ -0,0 +1,333 @@
+"""
+Almacenamiento de las matrices: archivos CSV (formato original) o una base
+SQLite, con importación y exportación sin pérdida entre ambos
+"""
+import argparse
+import csv
+import json
+import os
+import sqlite3
+import stat
+import tempfile
+import threading
+import uuid
+from typing import Any, Dict, Hashable, List, Optional, Tuple
+
+
+# Primera celda de la fila de encabezados de cada matriz
+# (los CSV de MAGERIT exportados usan 'º' en latin-1)
+HEADER_MARKERS: Dict[str, Tuple[str, ...]] = {
+    'magerit': ('N° Activos', 'Nº Activos'),
+    'anexo_a': ('Categoría',),
+    'cobit': ('Proceso COBIT',),
+    'nist': ('Función NIST',)
+}
+
+DEFAULT_ENCODING = 'utf-8-sig'
+
+
+class StorageBackend:
+    """
+    Interfaz de almacenamiento de las matrices. Cada matriz se lee y se
+    escribe completa, con el mismo formato de filas que el CSV (metadatos,
+    encabezados y datos).
+    """
+
+    name = ''
+
+    def location(self, csv_type: str) -> str:
+        """Identificador de la matriz en el almacenamiento (clave de caché)"""
+        raise NotImplementedError
+
+    def signature(self, csv_type: str) -> Optional[Hashable]:
+        """Firma de la versión almacenada, o None si la matriz no existe"""
+        raise NotImplementedError
+
+    def read_rows(self, csv_type: str) -> List[List[str]]:
+        """Todas las filas de la matriz"""
+        raise NotImplementedError
+
+    def write_rows(self, csv_type: str, rows: List[List[str]], encoding: Optional[str] = None):
+        """Reemplaza atómicamente todas las filas de la matriz"""
+        raise NotImplementedError
+
+    def encoding(self, csv_type: str) -> str:
+        """Codificación de texto con que la matriz se exporta a CSV"""
+        return DEFAULT_ENCODING
+
+    def size(self, csv_type: str) -> int:
+        """Bytes que ocupa la matriz en el almacenamiento (para las métricas)"""
+        raise NotImplementedError
+
+    def footprint(self) -> int:
+        """Bytes que ocupan todas las matrices en disco (para estimar la memoria de un proyecto)"""
+        raise NotImplementedError
+
+
+class CSVBackend(StorageBackend):
+    """Un archivo Matiz(*).csv por matriz (formato original)"""
+
+    name = 'csv'
+
+    def __init__(self, base_path: str, files: Dict[str, str]):
+        self.base_path = base_path
+        self.files = files
+        # Codificación detectada por archivo, válida para una firma concreta
+        self._encodings: Dict[str, Tuple[Any, str]] = {}
+
+    def location(self, csv_type: str) -> str:
+        return os.path.join(self.base_path, self.files[csv_type])
+
+    def signature(self, csv_type: str) -> Optional[Tuple[int, int, int]]:
+        """Retorna la firma (inodo, mtime, tamaño) del archivo CSV o None si no existe"""
+        try:
+            st = os.stat(self.location(csv_type))
+        except FileNotFoundError:
+            return None
+        return (st.st_ino, st.st_mtime_ns, st.st_size)
+
+    def read_rows(self, csv_type: str, encoding: str = DEFAULT_ENCODING) -> List[List[str]]:
+        file_path = self.location(csv_type)
+        signature = self.signature(csv_type)
+
+        # Si ya sabemos que esta versión del archivo es latin-1, evitar el doble intento
+        known = self._encodings.get(file_path)
+        if known is not None and known[0] == signature:
+            encoding = known[1]
+
+        try:
+            with open(file_path, 'r', encoding=encoding) as f:
+                rows = list(csv.reader(f))
+        except UnicodeDecodeError:
+            # Intentar con latin-1 si utf-8 falla
+            encoding = 'latin-1'
+            with open(file_path, 'r', encoding=encoding) as f:
+                rows = list(csv.reader(f))
+
+        self._encodings[file_path] = (signature, encoding)
+        return rows
+
+    def write_rows(self, csv_type: str, rows: List[List[str]], encoding: Optional[str] = None):
+        """Escribe en un temporal del mismo directorio y lo renombra sobre el CSV"""
+        encoding = encoding or DEFAULT_ENCODING
+        file_path = self.location(csv_type)
+        directory = os.path.dirname(os.path.abspath(file_path))
+
+        fd, tmp_path = tempfile.mkstemp(dir=directory, prefix='.tmp-', suffix='.csv')
+        try:
+            with os.fdopen(fd, 'w', encoding=encoding, newline='') as f:
+                writer = csv.writer(f)
+                writer.writerows(rows)
+                f.flush()
+                os.fsync(f.fileno())
+            if os.path.exists(file_path):
+                os.chmod(tmp_path, stat.S_IMODE(os.stat(file_path).st_mode))
+            os.replace(tmp_path, file_path)
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.unlink(tmp_path)
+            raise
+
+        self._encodings[file_path] = (self.signature(csv_type), encoding)
+
+    def size(self, csv_type: str) -> int:
+        try:
+            return os.path.getsize(self.location(csv_type))
+        except FileNotFoundError:
+            return 0
+
+    def footprint(self) -> int:
+        return sum(self.size(csv_type) for csv_type in self.files)
+
+    def encoding(self, csv_type: str) -> str:
+        known = self._encodings.get(self.location(csv_type))
+        if known is None or known[0] != self.signature(csv_type):
+            self.read_rows(csv_type)
+            known = self._encodings[self.location(csv_type)]
+        return known[1]
+
+
+# Las filas se indexan por (matriz, posición), que es como se leen y se
+# actualizan. No hay índices por valor: los filtros de /api/data usan el
+# índice en memoria de cada versión (utils.matrix_query.MatrixIndex), que
+# incluye los cambios del diario de MAGERIT aún no compactados.
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS store (
+    id TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS matrices (
+    matrix TEXT PRIMARY KEY,
+    generation INTEGER NOT NULL,
+    encoding TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS matrix_rows (
+    matrix TEXT NOT NULL,
+    position INTEGER NOT NULL,
+    is_data INTEGER NOT NULL,
+    cells TEXT NOT NULL,
+    PRIMARY KEY (matrix, position)
+);
+"""
+
+
+class SQLiteBackend(StorageBackend):
+    """
+    Todas las matrices en una base SQLite. Cada fila del CSV (incluidos
+    metadatos y filas vacías) se guarda con su posición, de modo que la
+    exportación reproduce el archivo original. Al escribir solo se
+    actualizan las filas que cambiaron, por lo que compactar el diario de
+    MAGERIT toca unas pocas filas y no la matriz completa.
+    """
+
+    name = 'sqlite'
+
+    def __init__(self, path: str):
+        self.path = path
+        self._local = threading.local()
+        self._store_id: Optional[str] = None
+        with self._connect() as conn:
+            conn.executescript(_SCHEMA)
+            row = conn.execute("SELECT id FROM store").fetchone()
+            if row is None:
+                conn.execute("INSERT INTO store (id) VALUES (?)", (uuid.uuid4().hex,))
+
+    def _connect(self) -> sqlite3.Connection:
+        """Conexión propia de cada hilo"""
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            directory = os.path.dirname(os.path.abspath(self.path))
+            os.makedirs(directory, exist_ok=True)
+            conn = sqlite3.connect(self.path, timeout=30)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def location(self, csv_type: str) -> str:
+        return f'{self.path}#{csv_type}'
+
+    def signature(self, csv_type: str) -> Optional[Tuple[str, int]]:
+        """Identificador de la base y número de generación de la matriz"""
+        conn = self._connect()
+        if self._store_id is None:
+            self._store_id = conn.execute("SELECT id FROM store").fetchone()[0]
+        row = conn.execute("SELECT generation FROM matrices WHERE matrix = ?", (csv_type,)).fetchone()
+        if row is None:
+            return None
+        return (self._store_id, row[0])
+
+    def read_rows(self, csv_type: str) -> List[List[str]]:
+        conn = self._connect()
+        if conn.execute("SELECT 1 FROM matrices WHERE matrix = ?", (csv_type,)).fetchone() is None:
+            raise FileNotFoundError(f"La matriz {csv_type} no existe en {self.path}")
+        cursor = conn.execute(
+            "SELECT cells FROM matrix_rows WHERE matrix = ? ORDER BY position", (csv_type,)
+        )
+        return [json.loads(cells) for (cells,) in cursor]
+
+    def write_rows(self, csv_type: str, rows: List[List[str]], encoding: Optional[str] = None):
+        """
+        Reemplaza las filas en una sola transacción y aumenta la generación.
+        Se insertan o actualizan solo las posiciones cuyo contenido cambió y
+        se eliminan las que sobran.
+        """
+        markers = HEADER_MARKERS.get(csv_type, ())
+        records = []
+        in_data = False
+        for position, row in enumerate(rows):
+            is_data = in_data and len(row) > 0 and bool(row[0]) and bool(row[0].strip())
+            records.append((csv_type, position, int(is_data), json.dumps(row, ensure_ascii=False)))
+            if not in_data and len(row) > 0 and row[0] in markers:
+                in_data = True
+
+        conn = self._connect()
+        with conn:
+            conn.execute("BEGIN IMMEDIATE")
+            current = conn.execute("SELECT encoding FROM matrices WHERE matrix = ?", (csv_type,)).fetchone()
+            encoding = encoding or (current[0] if current else DEFAULT_ENCODING)
+            stored = dict(conn.execute(
+                "SELECT position, cells FROM matrix_rows WHERE matrix = ?", (csv_type,)
+            ))
+            conn.executemany(
+                "INSERT INTO matrix_rows (matrix, position, is_data, cells) VALUES (?, ?, ?, ?) "
+                "ON CONFLICT (matrix, position) DO UPDATE SET is_data = excluded.is_data, cells = excluded.cells",
+                [record for record in records if stored.get(record[1]) != record[3]]
+            )
+            conn.execute("DELETE FROM matrix_rows WHERE matrix = ? AND position >= ?", (csv_type, len(rows)))
+            conn.execute(
+                "INSERT INTO matrices (matrix, generation, encoding) VALUES (?, 1, ?) "
+                "ON CONFLICT (matrix) DO UPDATE SET generation = generation + 1, encoding = excluded.encoding",
+                (csv_type, encoding)
+            )
+
+    def encoding(self, csv_type: str) -> str:
+        row = self._connect().execute(
+            "SELECT encoding FROM matrices WHERE matrix = ?", (csv_type,)
+        ).fetchone()
+        return row[0] if row else DEFAULT_ENCODING
+
+    def size(self, csv_type: str) -> int:
+        row = self._connect().execute(
+            "SELECT COALESCE(SUM(LENGTH(CAST(cells AS BLOB))), 0) FROM matrix_rows WHERE matrix = ?",
+            (csv_type,)
+        ).fetchone()
+        return row[0]
+
+    def footprint(self) -> int:
+        """Tamaño del archivo de la base más su WAL (sin recorrer las filas)"""
+        total = 0
+        for path in (self.path, self.path + '-wal'):
+            try:
+                total += os.path.getsize(path)
+            except FileNotFoundError:
+                pass
+        return total
+
+
+def copy_matrix(source: StorageBackend, target: StorageBackend, csv_type: str):
+    """Copia una matriz entre almacenamientos conservando filas y codificación"""
+    rows = source.read_rows(csv_type)
+    target.write_rows(csv_type, rows, source.encoding(csv_type))
+
+
+def main(argv: Optional[List[str]] = None):
+    """
+    Importa los CSV a SQLite o exporta SQLite a CSV:
+
+        python -m utils.storage import --base-path . --db matrices.db
+        python -m utils.storage export --base-path . --db matrices.db
+    """
+    from .csv_processor import CSVProcessor
+
+    parser = argparse.ArgumentParser(prog='python -m utils.storage', description=main.__doc__.strip().splitlines()[0])
+    parser.add_argument('action', choices=['import', 'export'])
+    parser.add_argument('--base-path', default='.', help='Carpeta de los archivos Matiz(*).csv')
+    parser.add_argument('--db', default=None, help='Base SQLite (por defecto <base-path>/matrices.db)')
+    args = parser.parse_args(argv)
+
+    db_path = args.db or os.path.join(args.base_path, CSVProcessor.SQLITE_FILE)
+    csv_processor = CSVProcessor(args.base_path, backend=CSVBackend(args.base_path, CSVProcessor.CSV_FILES))
+    sqlite_processor = CSVProcessor(args.base_path, backend=SQLiteBackend(db_path))
+    if args.action == 'import':
+        source, target = csv_processor, sqlite_processor
+    else:
+        source, target = sqlite_processor, csv_processor
+
+    # Cada almacenamiento tiene su propio diario de MAGERIT: los cambios
+    # pendientes del origen se incorporan antes de copiar, y MAGERIT se
+    # escribe en el destino con write_csv, que reemplaza su diario (sus
+    # cambios pendientes no deben volver a aplicarse sobre la copia)
+    source.compact_magerit()
+    for csv_type in CSVProcessor.CSV_FILES:
+        if source.backend.signature(csv_type) is None:
+            print(f"{csv_type}: no existe en el origen, se omite")
+            continue
+        if csv_type == 'magerit':
+            target.write_csv(csv_type, source.backend.read_rows(csv_type), source.backend.encoding(csv_type))
+        else:
+            copy_matrix(source.backend, target.backend, csv_type)
+        print(f"{csv_type}: {len(target.backend.read_rows(csv_type))} filas copiadas")
+
+
+if __name__ == '__main__':
+    main()